@@ -8,12 +8,14 @@ import os
 import threading
 import time
 import pyautogui
+from camera_stream import CameraStream, CAPTURE_COPY
 
 # --- CONFIGURATION ---
 WIDTH = 1280
 HEIGHT = 720
 FPS = 30
 WINDOW_NAME = "3x3 Grid Eye Tracker"
+CAMERA_TIMEOUT = 2.0
 
 # --- USER CALIBRATED SENSITIVITY ---
 ROI_X_OFFSET = 10  
@@ -30,52 +32,9 @@ try:
 except:
     SCREEN_W, SCREEN_H = 1920, 1080
 
-# --- CLASS: CAMERA WORKER ---
-class CameraStream:
-    def __init__(self, width, height, fps):
-        self.width = width
-        self.height = height
-        self.frame_size = int(width * height * 1.5)
-        self.frame = None
-        self.running = False
-        
-        cmd_executable = "rpicam-vid" if shutil.which("rpicam-vid") else "libcamera-vid"
-        command = [
-            cmd_executable, "--inline", "--nopreview",
-            "--width", str(width), "--height", str(height),
-            "--framerate", str(fps), "--timeout", "0",
-            "--codec", "yuv420", "-o", "-"
-        ]
-        
-        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=10**8)
-        self.running = True
-        self.thread = threading.Thread(target=self.update, args=())
-        self.thread.daemon = True
-        self.thread.start()
-        
-        print("Waiting for camera stream...")
-        while self.frame is None:
-            time.sleep(0.1)
-
-    def update(self):
-        while self.running:
-            raw_bytes = self.process.stdout.read(self.frame_size)
-            if len(raw_bytes) != self.frame_size:
-                self.running = False
-                break
-            yuv = np.frombuffer(raw_bytes, dtype=np.uint8).reshape((int(self.height * 1.5), self.width))
-            bgr = cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR_I420)
-            self.frame = cv2.flip(bgr, 1)
-
-    def read(self):
-        return self.frame
-
-    def stop(self):
-        self.running = False
-        self.process.terminate()
-
 # --- MAIN SETUP ---
-camera = CameraStream(WIDTH, HEIGHT, FPS)
+# Copy mode: a new frame every time, since this loop draws on the frame it gets
+camera = CameraStream(WIDTH, HEIGHT, FPS, capture_mode=CAPTURE_COPY)
 device = uinput.Device([uinput.BTN_LEFT, uinput.BTN_RIGHT, uinput.REL_X, uinput.REL_Y])
 
 mp_face_mesh = mp.solutions.face_mesh
@@ -102,6 +61,7 @@ calibrated = False
 xs, ys = 0.0, 0.0
 click_cooldown = 0
 show_click_msg = 0
+last_seq = 0
 
 cv2.namedWindow(WINDOW_NAME, cv2.WINDOW_NORMAL)
 cv2.setWindowProperty(WINDOW_NAME, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
@@ -110,8 +70,9 @@ print("Look at Blue Dot & Press SPACE to see the Highlighted Grid.")
 
 try:
     while True:
-        frame = camera.read()
+        seq, capture_time, frame = camera.read(last_seq, timeout=CAMERA_TIMEOUT)
         if frame is None: break
+        last_seq = seq
 
         small_frame = cv2.resize(frame, (640, 360))
         rgb_small = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
@@ -0,0 +1,330 @@
+"""
+Headless keyboard benchmark.
+
+Runs each keyboard's real main() loop under SDL's dummy video driver and feeds
+it scripted clicks, instead of a user, through pygame's own event queue
+functions. For every language it reports:
+  frame_ms            wall time of each loop iteration (event fetch to event fetch)
+  event_to_display_ms click handed to the loop -> end of the next display update
+  alloc               Python heap allocated per iteration (tracemalloc, second pass)
+per keyboard state and overall, as JSON.
+
+    python bench_keyboards.py                        # all languages, JSON on stdout
+    python bench_keyboards.py --out bench.json
+    python bench_keyboards.py --baseline bench.json  # exit 1 if p95s regressed
+
+Speak clicks are counted, not spoken: this measures the UI, not TTS.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import numpy as np
+import pygame
+
+LANGUAGES = {
+    "ENGLISH": "english_keyboard",
+    "HINDI": "hindi_keyboard",
+    "GUJARATI": "gujarati_keyboard",
+    # main.py's host: all three on one display, switching language between them
+    "HOST": "main",
+}
+KEYBOARD_MODULES = ["english_keyboard", "hindi_keyboard", "gujarati_keyboard"]
+
+# --- SCRIPTS ---
+# Each step is (cell clicked, keyboard state it leads to). Every scenario starts
+# and ends on the main layout, so they can run back to back in one main() call.
+SPEAK = ((1, 2), "main")
+
+SCRIPTS = {
+    "ENGLISH": {
+        "type_letter": [((0, 0), "spread_alpha"), ((0, 0), "main")],
+        "nums": [((2, 1), "spread_alpha"), ((2, 2), "nums"), ((0, 0), "spread_nums"), ((0, 0), "main")],
+        "pdm": [((2, 2), "spread_alpha"), ((0, 0), "pdm_categories"), ((0, 0), "pdm_messages"),
+                ((0, 0), "main")],
+        "backspace": [((2, 1), "spread_alpha"), ((2, 0), "main")],
+        "speak": [SPEAK],
+    },
+    # Hindi and Gujarati share their layout positions
+    "INDIC": {
+        "maatra": [((0, 0), "spread_alpha"), ((0, 0), "maatra_groups"), ((0, 0), "maatra_spread"),
+                   ((0, 0), "main")],
+        "pdm": [((2, 2), "spread_alpha"), ((2, 1), "pdm_categories"), ((0, 0), "pdm_messages"),
+                ((0, 0), "main")],
+        "nums": [((2, 2), "spread_alpha"), ((2, 2), "others"), ((0, 2), "nums"), ((0, 0), "nums_spread"),
+                 ((0, 0), "main")],
+        "swar": [((2, 2), "spread_alpha"), ((2, 2), "others"), ((0, 1), "swar"), ((0, 0), "swar_spread"),
+                 ((0, 0), "main")],
+        "backspace": [((2, 2), "spread_alpha"), ((0, 2), "main")],
+        "speak": [SPEAK],
+    },
+}
+SCRIPTS["HINDI"] = SCRIPTS["GUJARATI"] = SCRIPTS.pop("INDIC")
+# Starts on Gujarati (main.DEFAULT_KEYBOARD), goes round English and Hindi and back
+SCRIPTS["HOST"] = {
+    "switch": [((0, 0), "spread_alpha"), ((0, 0), "maatra_groups"), ((0, 0), "maatra_spread"), ((0, 0), "main"),
+               ((2, 2), "spread_alpha"), ((2, 2), "others"), ((2, 2), "language_select"), ((0, 0), "switch"),
+               ((2, 2), "spread_alpha"), ((2, 1), "language_select"), ((2, 0), "switch"),
+               ((2, 2), "spread_alpha"), ((2, 2), "others"), ((2, 2), "language_select"), ((2, 0), "switch")],
+}
+
+DEFAULT_IDLE = 20      # loop iterations with no input after each click
+DEFAULT_ROUNDS = 5     # times each scenario is repeated per pass
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    p = np.percentile(np.asarray(values, dtype=np.float64), (50, 95, 99))
+    return {"n": len(values), "p50": round(float(p[0]), 3), "p95": round(float(p[1]), 3),
+            "p99": round(float(p[2]), 3), "max": round(float(max(values)), 3)}
+
+
+class ScriptedInput:
+    """
+    Stands in for the user: wraps pygame.event.get/poll/wait and display.update/flip
+    so the keyboard loop runs unmodified. One click is handed out per loop
+    iteration after `idle` quiet iterations (a loop that redraws only on change
+    may show nothing for some clicks, e.g. Speak); QUIT follows the last step of
+    the last pass.
+    """
+
+    def __init__(self, w, h, steps, idle, alloc_pass=True):
+        self.w = w
+        self.h = h
+        self.steps = steps
+        self.idle = idle
+        self.passes = [False, True] if alloc_pass else [False]
+        self.pass_index = 0
+        self.step_index = 0
+        self.state = "main"
+        self.quiet = idle
+        self.click_t = None
+        self.iter_t = None
+        self.frame_ms = {}
+        self.event_to_display_ms = {}
+        self.alloc_kb = {}
+        self.frames = 0
+        self.iterations = 0
+        self.clicks_not_drawn = 0
+        self._alloc_start = 0
+        self._orig = {}
+
+    # -- pygame hooks --
+    def install(self):
+        self._orig = {"get": pygame.event.get, "poll": pygame.event.poll, "wait": pygame.event.wait,
+                      "update": pygame.display.update, "flip": pygame.display.flip}
+        pygame.event.get = self._get
+        pygame.event.poll = self._poll
+        pygame.event.wait = self._wait
+        pygame.display.update = self._update
+        pygame.display.flip = self._flip
+
+    def uninstall(self):
+        pygame.event.get = self._orig["get"]
+        pygame.event.poll = self._orig["poll"]
+        pygame.event.wait = self._orig["wait"]
+        pygame.display.update = self._orig["update"]
+        pygame.display.flip = self._orig["flip"]
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def _update(self, *args):
+        self._orig["update"](*args)
+        self._shown()
+
+    def _flip(self):
+        self._orig["flip"]()
+        self._shown()
+
+    def _shown(self):
+        self.frames += 1
+        if self.click_t is not None and not tracemalloc.is_tracing():
+            self.event_to_display_ms.setdefault(self.state, []).append((time.perf_counter() - self.click_t) * 1000)
+        self.click_t = None
+
+    def _get(self, *args, **kwargs):
+        # Real events too (posted gaze clicks, the window system), then ours
+        events = self._orig["get"](*args, **kwargs)
+        ours = self._next()
+        return events + [ours] if ours is not None else events
+
+    def _poll(self):
+        ours = self._next()
+        return ours if ours is not None else self._orig["poll"]()
+
+    def _wait(self, timeout=0):
+        # Never block: an idle iteration is a wait that timed out
+        ours = self._next()
+        if ours is not None:
+            return ours
+        return self._orig["poll"]()
+
+    # -- script --
+    def _iteration(self):
+        now = time.perf_counter()
+        tracing = self.passes[self.pass_index] if self.pass_index < len(self.passes) else False
+        if self.iter_t is not None:
+            if tracing:
+                current, peak = tracemalloc.get_traced_memory()
+                self.alloc_kb.setdefault(self.state, []).append((peak - self._alloc_start) / 1024)
+            else:
+                self.frame_ms.setdefault(self.state, []).append((now - self.iter_t) * 1000)
+        if tracing:
+            tracemalloc.reset_peak()
+            self._alloc_start = tracemalloc.get_traced_memory()[0]
+        self.iterations += 1
+        self.iter_t = time.perf_counter()
+
+    def _next(self):
+        """The event this loop iteration gets, or None for a quiet one."""
+        if self.pass_index >= len(self.passes):
+            return pygame.event.Event(pygame.QUIT)
+        self._iteration()
+        if self.quiet < self.idle:
+            self.quiet += 1
+            return None
+        if self.click_t is not None:
+            # The loop redraws only on change, and this click changed nothing on screen
+            self.clicks_not_drawn += 1
+            self.click_t = None
+
+        if self.step_index == len(self.steps):
+            self.pass_index += 1
+            self.step_index = 0
+            self.iter_t = None
+            if self.pass_index >= len(self.passes):
+                return pygame.event.Event(pygame.QUIT)
+            if self.passes[self.pass_index]:
+                tracemalloc.start()
+
+        (r, c), self.state = self.steps[self.step_index]
+        self.step_index += 1
+        self.quiet = 0
+        pos = (((2 * c + 1) * self.w) // 6, ((2 * r + 1) * self.h) // 6)
+        self.click_t = time.perf_counter()
+        return pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=pos, button=1)
+
+
+def run_language(language, rounds, idle, alloc_pass=True):
+    module = importlib.import_module(LANGUAGES[language])
+    core_ui = importlib.import_module("core_ui")
+    spoken = []
+    for name in KEYBOARD_MODULES:
+        importlib.import_module(name).speak_text = lambda text, **kw: spoken.append(text)
+    # The host warms up TTS in the background (timing every backend, gTTS over
+    # the network): that would run alongside the frames being measured
+    speech_engine = importlib.import_module("speech_engine")
+    speech_engine.warm_up = lambda: None
+    speech_engine.engine.measure = lambda *a, **kw: None
+
+    steps = []
+    for name, scenario in SCRIPTS[language].items():
+        steps += scenario * rounds
+
+    pygame.init()
+    info = pygame.display.Info()
+    feeder = ScriptedInput(info.current_w, info.current_h, steps, idle, alloc_pass)
+    feeder.install()
+    t0 = time.perf_counter()
+    try:
+        module.main()
+    finally:
+        feeder.uninstall()
+    wall = time.perf_counter() - t0
+
+    all_frames = [v for values in feeder.frame_ms.values() for v in values]
+    all_latency = [v for values in feeder.event_to_display_ms.values() for v in values]
+    all_alloc = [v for values in feeder.alloc_kb.values() for v in values]
+    states = sorted(set(feeder.frame_ms) | set(feeder.event_to_display_ms))
+    return {
+        "screen": [feeder.w, feeder.h],
+        "clicks": len(steps),
+        "iterations": feeder.iterations,
+        "frames_drawn": feeder.frames,
+        "clicks_not_drawn": feeder.clicks_not_drawn,
+        "speak_calls": len(spoken),
+        "wall_s": round(wall, 3),
+        "frame_ms": _percentiles(all_frames),
+        "event_to_display_ms": _percentiles(all_latency),
+        "alloc_kb_per_iteration": _percentiles(all_alloc),
+        # Cumulative over the languages run so far
+        "label_cache": core_ui.label_cache.stats(),
+        "states": {state: {"frame_ms": _percentiles(feeder.frame_ms.get(state, [])),
+                           "event_to_display_ms": _percentiles(feeder.event_to_display_ms.get(state, [])),
+                           "alloc_kb_per_iteration": _percentiles(feeder.alloc_kb.get(state, []))}
+                   for state in states},
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing every overall p95 that got worse than baseline by more than tolerance."""
+    regressions = []
+    for language, result in results["languages"].items():
+        base = baseline.get("languages", {}).get(language)
+        if base is None:
+            continue
+        for metric in ("frame_ms", "event_to_display_ms", "alloc_kb_per_iteration"):
+            new, old = result.get(metric), base.get(metric)
+            if not new or not old or old["p95"] <= 0:
+                continue
+            if new["p95"] > old["p95"] * (1 + tolerance):
+                regressions.append(f"{language} {metric} p95 {old['p95']} -> {new['p95']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless keyboard rendering and input-latency benchmark")
+    parser.add_argument("languages", nargs="*", metavar="LANGUAGE", help="ENGLISH, HINDI, GUJARATI, HOST (default: all)")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS, help="repeats of each scenario")
+    parser.add_argument("--idle", type=int, default=DEFAULT_IDLE, help="quiet loop iterations after each click")
+    parser.add_argument("--no-alloc", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--out", metavar="FILE", help="write JSON here instead of stdout")
+    parser.add_argument("--baseline", metavar="FILE", help="compare with an earlier --out, exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth vs baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+    languages = [language.upper() for language in args.languages] or list(LANGUAGES)
+    unknown = [language for language in languages if language not in LANGUAGES]
+    if unknown:
+        parser.error(f"unknown language(s): {', '.join(unknown)}")
+
+    # The keyboards load their fonts relative to the repo
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    results = {
+        "time": time.time(),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "machine": platform.machine(),
+        "rounds": args.rounds,
+        "idle": args.idle,
+        "languages": {},
+    }
+    for language in languages:
+        results["languages"][language] = run_language(language, args.rounds, args.idle, not args.no_alloc)
+
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
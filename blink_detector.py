@@ -0,0 +1,125 @@
+import numpy as np
+
+# --- EYELID LANDMARKS ---
+# Six points per eye for the eye aspect ratio (Soukupova & Cech):
+# outer corner, two upper-lid points, inner corner, two lower-lid points.
+# The second eye lists the mirror image of each point, in the same order.
+EAR_LANDMARKS = (
+    [33, 160, 158, 133, 153, 144],
+    [263, 387, 385, 362, 380, 373],
+)
+
+# --- EVENTS ---
+EVENT_BLINK = "blink"             # both eyes, short: involuntary, never a click
+EVENT_WINK_LEFT = "wink_left"     # eye 0 closed while eye 1 stayed open
+EVENT_WINK_RIGHT = "wink_right"
+EVENT_LONG_CLOSE = "long_close"   # both eyes held closed for long_close seconds
+
+DEFAULT_WINK_MIN = 0.15     # seconds; shorter one-eyed closures are landmark noise
+DEFAULT_WINK_MAX = 1.0      # seconds; longer ones are resting the eye, not a wink
+DEFAULT_LONG_CLOSE = 1.5    # seconds
+
+# Open/closed thresholds sit this far between the learned closed and open EAR
+CLOSE_FRACTION = 0.35
+REOPEN_FRACTION = 0.55
+# Before anything is learned: frames used for the first open baseline, and the
+# closed EAR assumed relative to it
+WARMUP_FRAMES = 30
+CLOSED_PRIOR = 0.4
+MIN_OPEN_EAR = 0.1    # a warm-up median below this means closed eyes or bad landmarks: try again
+OPEN_RATE = 0.02      # EMA rates for the baselines
+CLOSED_RATE = 0.2
+MAX_CLOSED_RATIO = 0.8   # closed baseline never creeps above this fraction of open
+
+
+def eye_aspect_ratios(eyes):
+    """EAR of every eye at once; eyes is (n_eyes, 6, 2) in pixels (any uniform scale)."""
+    v = np.linalg.norm(eyes[:, [1, 2]] - eyes[:, [5, 4]], axis=2).sum(axis=1)
+    h = np.linalg.norm(eyes[:, 0] - eyes[:, 3], axis=1)
+    return v / (2.0 * np.maximum(h, 1e-6))
+
+
+class BlinkDetector:
+    """
+    Classifies eyelid closures from the eye aspect ratio, which does not change
+    with distance to the camera. Open and closed EAR are learned per eye while
+    running; to_dict() and the `baselines` argument carry them across sessions. A closure lasts
+    from the first eye closing until both are open again; it is classified when
+    it ends, except a long close, which fires as soon as it is long enough.
+    """
+
+    def __init__(self, wink_min=DEFAULT_WINK_MIN, wink_max=DEFAULT_WINK_MAX, long_close=DEFAULT_LONG_CLOSE,
+                 baselines=None):
+        self.wink_min = wink_min
+        self.wink_max = wink_max
+        self.long_close = long_close
+        self.open_ear = None       # (2,) learned baselines
+        self.closed_ear = None
+        self._warmup = []
+        if baselines:
+            self.open_ear = np.array(baselines["open"], dtype=np.float64)
+            self.closed_ear = np.array(baselines["closed"], dtype=np.float64)
+        self.ear = np.zeros(2)
+        self.closed = np.zeros(2, dtype=bool)
+        self.reset()
+
+    def reset(self):
+        """Forget the closure in progress (e.g. the face was lost); baselines are kept."""
+        self.closed[:] = False
+        self._start_t = None
+        self._ever_closed = np.zeros(2, dtype=bool)
+        self._min_ear = np.full(2, np.inf)
+        self._long_fired = False
+
+    def to_dict(self):
+        if self.open_ear is None:
+            return None
+        return {"open": self.open_ear.tolist(), "closed": self.closed_ear.tolist()}
+
+    def update(self, eyes, t):
+        """Feed one frame: eyes is (2, 6, 2) in EAR_LANDMARKS order. Returns an EVENT_* or None."""
+        self.ear = eye_aspect_ratios(eyes)
+
+        if self.open_ear is None:
+            self._warmup.append(self.ear)
+            if len(self._warmup) >= WARMUP_FRAMES:
+                # Median, so blinks during warm-up do not drag the baseline down
+                open_ear = np.median(self._warmup, axis=0)
+                self._warmup = []
+                if (open_ear >= MIN_OPEN_EAR).all():
+                    self.open_ear = open_ear
+                    self.closed_ear = open_ear * CLOSED_PRIOR
+            return None
+
+        span = self.open_ear - self.closed_ear
+        close_at = self.closed_ear + CLOSE_FRACTION * span
+        reopen_at = self.closed_ear + REOPEN_FRACTION * span
+        self.closed = np.where(self.closed, self.ear < reopen_at, self.ear < close_at)
+
+        if self._start_t is None:
+            if not self.closed.any():
+                self.open_ear += OPEN_RATE * (self.ear - self.open_ear)
+                return None
+            self._start_t = t
+
+        self._ever_closed |= self.closed
+        self._min_ear = np.minimum(self._min_ear, self.ear)
+        duration = t - self._start_t
+
+        if self.closed.all() and duration >= self.long_close and not self._long_fired:
+            self._long_fired = True
+            return EVENT_LONG_CLOSE
+        if self.closed.any():
+            return None
+
+        # Closure over: learn the closed baseline from the eyes that closed, then classify
+        ever_closed, long_fired = self._ever_closed, self._long_fired
+        self.closed_ear[ever_closed] += CLOSED_RATE * (self._min_ear[ever_closed] - self.closed_ear[ever_closed])
+        self.closed_ear = np.minimum(self.closed_ear, self.open_ear * MAX_CLOSED_RATIO)
+        self.reset()
+
+        if ever_closed.all():
+            return None if long_fired else EVENT_BLINK
+        if not self.wink_min <= duration <= self.wink_max:
+            return None
+        return EVENT_WINK_LEFT if ever_closed[0] else EVENT_WINK_RIGHT
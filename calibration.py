@@ -0,0 +1,158 @@
+import threading
+import time
+import cv2
+import numpy as np
+
+# --- MAPPING MODELS ---
+# "poly2": second-order polynomial per screen axis, least squares over the 9 targets
+# "homography": projective map, fewer parameters, cannot bend
+MODEL_POLY2 = "poly2"
+MODEL_HOMOGRAPHY = "homography"
+
+# The nine centres of the 3x3 grid, row by row, as fractions of the screen
+GRID_TARGETS = [((c + 0.5) / 3.0, (r + 0.5) / 3.0) for r in range(3) for c in range(3)]
+
+DEFAULT_SAMPLES_PER_TARGET = 15
+DEFAULT_SETTLE_SECONDS = 0.8   # ignore the eye while it travels to a new target
+
+
+# ---------------- Mappings ----------------
+class Poly2Mapping:
+    """screen = [1, x, y, xy, x^2, y^2] @ coeffs, on eye coords normalized by the calibration spread."""
+    name = MODEL_POLY2
+
+    def __init__(self, coeffs, center, scale):
+        self.coeffs = np.asarray(coeffs, dtype=np.float64)    # (6, 2)
+        self.center = np.asarray(center, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+
+    @staticmethod
+    def _features(eye):
+        x, y = eye[..., 0], eye[..., 1]
+        return np.stack([np.ones_like(x), x, y, x * y, x * x, y * y], axis=-1)
+
+    @classmethod
+    def fit(cls, eye_pts, screen_pts):
+        eye_pts = np.asarray(eye_pts, dtype=np.float64)
+        center = eye_pts.mean(axis=0)
+        scale = eye_pts.std(axis=0)
+        scale[scale == 0] = 1.0
+        a = cls._features((eye_pts - center) / scale)
+        coeffs, *_ = np.linalg.lstsq(a, np.asarray(screen_pts, dtype=np.float64), rcond=None)
+        return cls(coeffs, center, scale)
+
+    def __call__(self, x, y):
+        f = self._features((np.array([x, y]) - self.center) / self.scale)
+        sx, sy = f @ self.coeffs
+        return sx, sy
+
+    def to_dict(self):
+        return {"model": self.name, "coeffs": self.coeffs.tolist(),
+                "center": self.center.tolist(), "scale": self.scale.tolist()}
+
+
+class HomographyMapping:
+    name = MODEL_HOMOGRAPHY
+
+    def __init__(self, matrix):
+        self.matrix = np.asarray(matrix, dtype=np.float64)   # (3, 3)
+
+    @classmethod
+    def fit(cls, eye_pts, screen_pts):
+        matrix, _ = cv2.findHomography(np.asarray(eye_pts, dtype=np.float64),
+                                       np.asarray(screen_pts, dtype=np.float64), 0)
+        if matrix is None:
+            raise ValueError("degenerate calibration points")
+        return cls(matrix)
+
+    def __call__(self, x, y):
+        sx, sy, w = self.matrix @ (x, y, 1.0)
+        return sx / w, sy / w
+
+    def to_dict(self):
+        return {"model": self.name, "matrix": self.matrix.tolist()}
+
+
+def fit_mapping(model, eye_pts, screen_pts):
+    if model == MODEL_POLY2:
+        return Poly2Mapping.fit(eye_pts, screen_pts)
+    if model == MODEL_HOMOGRAPHY:
+        return HomographyMapping.fit(eye_pts, screen_pts)
+    raise ValueError(f"Unknown calibration model: {model}")
+
+
+def mapping_from_dict(data):
+    if data["model"] == MODEL_POLY2:
+        return Poly2Mapping(data["coeffs"], data["center"], data["scale"])
+    if data["model"] == MODEL_HOMOGRAPHY:
+        return HomographyMapping(data["matrix"])
+    raise ValueError(f"Unknown calibration model: {data['model']}")
+
+
+# ---------------- Nine-point session ----------------
+class NinePointCalibration:
+    """
+    Walks the user through the nine grid centres. The display side calls start()
+    and target(); the tracker side feeds add_sample() with the eye position of
+    every frame. When the last target is done, `mapping` holds the fitted model.
+    """
+
+    def __init__(self, screen_w, screen_h, model=MODEL_POLY2,
+                 samples_per_target=DEFAULT_SAMPLES_PER_TARGET, settle_seconds=DEFAULT_SETTLE_SECONDS):
+        self.screen_w = screen_w
+        self.screen_h = screen_h
+        self.model = model
+        self.samples_per_target = samples_per_target
+        self.settle_seconds = settle_seconds
+        self.lock = threading.Lock()
+        self.active = False
+        self.mapping = None
+        self.error = None
+        self._index = 0
+
+    def start(self):
+        with self.lock:
+            self.active = True
+            self.error = None
+            self._index = 0
+            self._samples = []
+            self._eye_pts = []
+            self._target_start = time.monotonic()
+
+    def cancel(self):
+        with self.lock:
+            self.active = False
+
+    def target(self):
+        """(index, (x, y) screen pixels, progress 0..1 on this target), or None when idle."""
+        with self.lock:
+            if not self.active:
+                return None
+            fx, fy = GRID_TARGETS[self._index]
+            progress = len(self._samples) / self.samples_per_target
+            return self._index, (fx * self.screen_w, fy * self.screen_h), progress
+
+    def add_sample(self, eye_xy, t):
+        with self.lock:
+            if not self.active or t - self._target_start < self.settle_seconds:
+                return
+            self._samples.append(eye_xy)
+            if len(self._samples) < self.samples_per_target:
+                return
+
+            # Median is robust to the odd blink or landmark glitch
+            self._eye_pts.append(np.median(np.asarray(self._samples), axis=0))
+            self._samples = []
+            self._index += 1
+            self._target_start = time.monotonic()
+            if self._index == len(GRID_TARGETS):
+                self._finish()
+
+    def _finish(self):
+        self.active = False
+        screen_pts = [(fx * self.screen_w, fy * self.screen_h) for fx, fy in GRID_TARGETS]
+        try:
+            self.mapping = fit_mapping(self.model, self._eye_pts, screen_pts)
+        except (ValueError, np.linalg.LinAlgError) as e:
+            self.error = str(e)
+            print(f"❌ Calibration failed: {e}")
@@ -0,0 +1,422 @@
+import cv2
+import subprocess
+import numpy as np
+import shutil
+import threading
+import time
+from session_file import SessionReader
+
+# --- CAPTURE MODES ---
+# "copy": original path, one new bytes/ndarray per frame (kept for debugging)
+# "ring": readinto a fixed ring of preallocated buffers, no per-frame allocations
+CAPTURE_COPY = "copy"
+CAPTURE_RING = "ring"
+
+DEFAULT_RING_SIZE = 4
+MAX_RING_SIZE = 16
+# Slots beyond the frames that arrive during one inference: the preview and
+# recorder copy out of the ring in between inferences, on the same busy CPU
+RING_SLACK = 2
+
+# --- COLOUR PATHS ---
+# "full":  I420 -> full-res BGR -> flip, inference frame resized from that (old behaviour)
+# "infer": I420 is downsampled in the YUV domain straight to the inference RGB frame,
+#          without mirroring; the full-res BGR frame is only built when read() asks for it
+COLOUR_FULL = "full"
+COLOUR_INFER = "infer"
+
+DEFAULT_INFER_SIZE = (640, 360)
+
+# --- REPLAY SPEEDS ---
+# "realtime": frames arrive with the recorded spacing, like the live camera
+# "max":      lockstep, as fast as the tracker takes them: every frame is processed
+#             exactly once, so runs are repeatable and directly comparable
+REPLAY_REALTIME = "realtime"
+REPLAY_MAX = "max"
+
+
+def ring_size_for(inference_ms, fps):
+    """Ring slots for an inference taking inference_ms (e.g. last session's p95); None = default."""
+    if not inference_ms:
+        return DEFAULT_RING_SIZE
+    frames = int(np.ceil(inference_ms * fps / 1000.0))
+    return max(DEFAULT_RING_SIZE, min(MAX_RING_SIZE, frames + RING_SLACK))
+
+
+# ---------------- YUV helpers ----------------
+def i420_planes(yuv, width, height):
+    """Return (Y, U, V) views of an I420 buffer shaped (height * 1.5, width)."""
+    flat = yuv.reshape(-1)
+    y_size = width * height
+    c_size = y_size // 4
+    y = flat[:y_size].reshape(height, width)
+    u = flat[y_size:y_size + c_size].reshape(height // 2, width // 2)
+    v = flat[y_size + c_size:y_size + 2 * c_size].reshape(height // 2, width // 2)
+    return y, u, v
+
+
+def i420_to_small(src_planes, small_yuv, small_planes, dst=None, code=cv2.COLOR_YUV2RGB_I420):
+    """
+    Downsample each I420 plane with INTER_AREA into small_yuv, then convert
+    only the small image (to RGB by default). The full-res frame is never built.
+    """
+    for src, small in zip(src_planes, small_planes):
+        cv2.resize(src, (small.shape[1], small.shape[0]), dst=small, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small_yuv, code, dst=dst)
+
+
+# --- CLASS: CAMERA WORKER ---
+class CameraStream:
+    def __init__(self, width, height, fps, capture_mode=CAPTURE_RING, ring_size=DEFAULT_RING_SIZE,
+                 colour_path=COLOUR_FULL, infer_size=DEFAULT_INFER_SIZE, wait_first=True):
+        self.width = width
+        self.height = height
+        self.frame_size = int(width * height * 1.5)
+        self.capture_mode = capture_mode
+        self.colour_path = colour_path
+        self.infer_w, self.infer_h = infer_size
+        # In the "infer" path pixels are never mirrored; the caller flips landmark x instead
+        self.infer_mirrored = colour_path == COLOUR_FULL
+        self.frame = None
+        self.frame_seq = 0
+        self.frame_time = 0.0
+        self.yuv = None
+        self.running = False
+
+        # Frame handoff: the capture thread notifies, readers block in read()/read_infer()
+        self.cond = threading.Condition()
+        self.frames_delivered = 0
+        self.frames_dropped = 0
+        # Frames refilled by the capture thread while a reader copied them out of the ring
+        self.frames_torn = 0
+        # Last seq handed to the tracker (read/read_infer; not the preview or recorder)
+        self.consumed_seq = 0
+
+        # Preview-size buffers, allocated on the first read_preview()
+        self._small_preview = None
+
+        if colour_path == COLOUR_INFER:
+            self._alloc_infer_buffers()
+
+        if capture_mode == CAPTURE_RING:
+            self._alloc_ring(ring_size)
+            # Unbuffered pipe: we readinto our own buffers, no 100 MB BufferedReader in between
+            bufsize = 0
+            target = self._update_ring
+        else:
+            bufsize = 10**8
+            target = self._update_copy
+
+        self._start_source(width, height, fps, bufsize)
+        self.running = True
+        self.thread = threading.Thread(target=target, args=())
+        self.thread.daemon = True
+        self.thread.start()
+
+        # wait_first=False returns while rpicam-vid is still starting, so the caller
+        # can load models in the meantime and call wait_ready() afterwards
+        if wait_first:
+            self.wait_ready()
+
+    def wait_ready(self, timeout=None):
+        """Block until the first frame has arrived. False if the stream ended or timed out first."""
+        print("Waiting for camera stream...")
+        with self.cond:
+            return self.cond.wait_for(lambda: self.frame_seq > 0 or not self.running, timeout) \
+                and self.frame_seq > 0
+
+    def _start_source(self, width, height, fps, bufsize):
+        cmd_executable = "rpicam-vid" if shutil.which("rpicam-vid") else "libcamera-vid"
+        command = [
+            cmd_executable, "--inline", "--nopreview",
+            "--width", str(width), "--height", str(height),
+            "--framerate", str(fps), "--timeout", "0",
+            "--codec", "yuv420", "-o", "-"
+        ]
+        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=bufsize)
+
+    # ---------------- Ring buffer ----------------
+    def _alloc_ring(self, ring_size):
+        """Preallocate every buffer the capture thread will ever touch."""
+        self.ring_size = ring_size
+        self.yuv_ring = np.empty((ring_size, int(self.height * 1.5), self.width), dtype=np.uint8)
+        # Sequence number of the frame currently held by each slot (0 = never written)
+        self.slot_seq = [0] * ring_size
+
+        self._yuv_bytes = [memoryview(self.yuv_ring[i]).cast("B") for i in range(ring_size)]
+        self._yuv_views = [self.yuv_ring[i] for i in range(ring_size)]
+
+        if self.colour_path == COLOUR_INFER:
+            self.rgb_ring = np.empty((ring_size, self.infer_h, self.infer_w, 3), dtype=np.uint8)
+            self._rgb_views = [self.rgb_ring[i] for i in range(ring_size)]
+            # What read_infer() hands out: inference may take longer than the ring holds a frame
+            self._infer_copy = np.empty((self.infer_h, self.infer_w, 3), dtype=np.uint8)
+            self._yuv_planes = [i420_planes(v, self.width, self.height) for v in self._yuv_views]
+        else:
+            self._bgr_scratch = np.empty((self.height, self.width, 3), dtype=np.uint8)
+            self.bgr_ring = np.empty((ring_size, self.height, self.width, 3), dtype=np.uint8)
+            self._bgr_views = [self.bgr_ring[i] for i in range(ring_size)]
+
+    def _alloc_infer_buffers(self):
+        self._small_yuv = np.empty((int(self.infer_h * 1.5), self.infer_w), dtype=np.uint8)
+        self._small_planes = i420_planes(self._small_yuv, self.infer_w, self.infer_h)
+        # Mirrored full-res frame, built on demand for the preview
+        self._bgr_scratch = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self._preview_bgr = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self._preview_seq = 0
+        self.yuv = None
+        self.infer_frame = None
+
+    def _read_exact(self, buf):
+        """readinto() until buf is full. Returns False on EOF / short stream."""
+        got = 0
+        total = len(buf)
+        while got < total:
+            n = self.process.stdout.readinto(buf[got:])
+            if not n:
+                return False
+            got += n
+        return True
+
+    def _update_ring(self):
+        seq = 0
+        while self.running:
+            seq += 1
+            slot = seq % self.ring_size
+            # Mark the slot as being rewritten so readers holding it can notice
+            self.slot_seq[slot] = 0
+            if not self._read_exact(self._yuv_bytes[slot]):
+                break
+            capture_time = time.monotonic()
+            if self.colour_path == COLOUR_INFER:
+                i420_to_small(self._yuv_planes[slot], self._small_yuv, self._small_planes,
+                                  dst=self._rgb_views[slot])
+                self.slot_seq[slot] = seq
+                self._publish(seq, capture_time, yuv=self._yuv_views[slot], infer_frame=self._rgb_views[slot])
+            else:
+                cv2.cvtColor(self._yuv_views[slot], cv2.COLOR_YUV2BGR_I420, dst=self._bgr_scratch)
+                cv2.flip(self._bgr_scratch, 1, dst=self._bgr_views[slot])
+                self.slot_seq[slot] = seq
+                self._publish(seq, capture_time, frame=self._bgr_views[slot], yuv=self._yuv_views[slot])
+        self._stream_ended()
+
+    def is_valid(self, seq):
+        """True while the slot that held frame `seq` has not been overwritten yet."""
+        if self.capture_mode != CAPTURE_RING:
+            return True
+        return self.slot_seq[seq % self.ring_size] == seq
+
+    # ---------------- Legacy copy path ----------------
+    def _update_copy(self):
+        seq = 0
+        while self.running:
+            raw_bytes = self.process.stdout.read(self.frame_size)
+            if len(raw_bytes) != self.frame_size:
+                break
+            capture_time = time.monotonic()
+            yuv = np.frombuffer(raw_bytes, dtype=np.uint8).reshape((int(self.height * 1.5), self.width))
+            seq += 1
+            if self.colour_path == COLOUR_INFER:
+                planes = i420_planes(yuv, self.width, self.height)
+                infer_frame = i420_to_small(planes, self._small_yuv, self._small_planes)
+                self._publish(seq, capture_time, yuv=yuv, infer_frame=infer_frame)
+            else:
+                bgr = cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR_I420)
+                self._publish(seq, capture_time, frame=cv2.flip(bgr, 1), yuv=yuv)
+        self._stream_ended()
+
+    # ---------------- Frame handoff ----------------
+    def _publish(self, seq, capture_time, frame=None, yuv=None, infer_frame=None):
+        with self.cond:
+            if frame is not None:
+                self.frame = frame
+            else:
+                self.infer_frame = infer_frame
+            self.yuv = yuv
+            self.frame_seq = seq
+            self.frame_time = capture_time
+            self.cond.notify_all()
+
+    def _stream_ended(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+    def _wait(self, after_seq, timeout, tracked=True):
+        """
+        Block until a frame newer than after_seq is published.
+        Returns (seq, capture_time, frame, yuv, infer_frame); seq is 0 on timeout or end of stream.
+        """
+        with self.cond:
+            self.cond.wait_for(lambda: self.frame_seq > after_seq or not self.running, timeout)
+            seq = self.frame_seq
+            if seq <= after_seq:
+                return 0, 0.0, None, None, None
+            if tracked:
+                if after_seq > 0:
+                    self.frames_delivered += 1
+                    self.frames_dropped += seq - after_seq - 1
+                self.consumed_seq = seq
+                self.cond.notify_all()
+            if self.colour_path == COLOUR_INFER:
+                return seq, self.frame_time, None, self.yuv, self.infer_frame
+            return seq, self.frame_time, self.frame, self.yuv, None
+
+    def read(self, after_seq=0, timeout=None):
+        """
+        Wait for a frame newer than after_seq and return (seq, capture_time, frame),
+        where frame is the mirrored full-res BGR image. Pass the last seq you
+        got back to receive every new frame exactly once; frames skipped in
+        between are added to frames_dropped. On timeout or end of stream
+        returns (0, 0.0, None).
+
+        In ring mode the frame is a view into the ring, valid for ring_size - 1
+        more frames. In the "infer" colour path it is built here, only when
+        someone (the preview) actually asks for it.
+        """
+        while True:
+            seq, capture_time, frame, yuv, _ = self._wait(after_seq, timeout)
+            if seq == 0 or self.colour_path != COLOUR_INFER:
+                return seq, capture_time, frame
+            if self._preview_seq == seq:
+                return seq, capture_time, self._preview_bgr
+            cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR_I420, dst=self._bgr_scratch)
+            cv2.flip(self._bgr_scratch, 1, dst=self._preview_bgr)
+            # The slot may have been refilled while we converted: take the next frame instead
+            if self.is_valid(seq):
+                self._preview_seq = seq
+                return seq, capture_time, self._preview_bgr
+            self.frames_torn += 1
+            after_seq = seq
+
+    def read_preview(self, size, after_seq=0, timeout=None):
+        """
+        Same contract as read(), but the mirrored BGR frame comes back at preview
+        size (w, h), in a buffer only the preview uses, so it is safe to draw on.
+        In the "infer" path it is downsampled straight from YUV, like the
+        inference frame; the full-res BGR frame is never built. Preview reads
+        never count as the tracker's (frames_dropped, replay lockstep).
+        """
+        w, h = size
+        if self._small_preview is None or self._small_preview.shape[:2] != (h, w):
+            self._small_preview = np.empty((h, w, 3), dtype=np.uint8)
+            self._small_preview_scratch = np.empty((h, w, 3), dtype=np.uint8)
+            self._small_preview_yuv = np.empty((int(h * 1.5), w), dtype=np.uint8)
+            self._small_preview_planes = i420_planes(self._small_preview_yuv, w, h)
+
+        while True:
+            seq, capture_time, frame, yuv, _ = self._wait(after_seq, timeout, tracked=False)
+            if seq == 0:
+                return seq, capture_time, None
+            if self.colour_path == COLOUR_INFER:
+                i420_to_small(i420_planes(yuv, self.width, self.height), self._small_preview_yuv,
+                              self._small_preview_planes, dst=self._small_preview_scratch,
+                              code=cv2.COLOR_YUV2BGR_I420)
+                cv2.flip(self._small_preview_scratch, 1, dst=self._small_preview)
+            else:
+                cv2.resize(frame, (w, h), dst=self._small_preview, interpolation=cv2.INTER_AREA)
+            # The slot may have been refilled while we downsampled: take the next frame instead
+            if self.is_valid(seq):
+                return seq, capture_time, self._small_preview
+            self.frames_torn += 1
+            after_seq = seq
+
+    def read_infer(self, after_seq=0, timeout=None):
+        """
+        Same contract as read(), but returns the RGB frame at inference resolution.
+        Check `infer_mirrored`: in the "infer" path it is NOT mirrored and
+        landmark x must be flipped.
+
+        The frame never points into the ring, so it stays whole however long
+        inference takes; it is reused by the next read_infer().
+        """
+        while True:
+            seq, capture_time, frame, _, infer_frame = self._wait(after_seq, timeout)
+            if seq == 0:
+                return seq, capture_time, None
+            if self.colour_path == COLOUR_INFER:
+                if self.capture_mode != CAPTURE_RING:
+                    return seq, capture_time, infer_frame
+                np.copyto(self._infer_copy, infer_frame)
+                out = self._infer_copy
+            else:
+                small_frame = cv2.resize(frame, (self.infer_w, self.infer_h))
+                out = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+            # The slot may have been refilled while we copied: take the next frame instead
+            if self.is_valid(seq):
+                return seq, capture_time, out
+            self.frames_torn += 1
+            after_seq = seq
+
+    def read_yuv(self, after_seq=0, timeout=None):
+        """
+        Same contract as read(), but returns the raw I420 frame, not mirrored, as
+        it came from the camera (the recorder's input). Frames this reader skips
+        are not counted in frames_dropped.
+        """
+        seq, capture_time, _, yuv, _ = self._wait(after_seq, timeout, tracked=False)
+        return seq, capture_time, yuv
+
+    def stop(self):
+        self._stream_ended()
+        self.process.terminate()
+
+
+# --- CLASS: RECORDED SESSION ---
+class ReplayStream(CameraStream):
+    """
+    Drop-in CameraStream that plays back a file written by SessionWriter (see
+    --record in cursor4.py). Frames go through the same ring and colour path as
+    live ones; only the pipe is replaced. Capture times are stamped at replay,
+    so latency numbers mean the same as live; the recorded times only set the pace.
+    Always uses the ring capture mode.
+    """
+
+    def __init__(self, path, speed=REPLAY_REALTIME, loop=False, ring_size=DEFAULT_RING_SIZE,
+                 colour_path=COLOUR_FULL, infer_size=DEFAULT_INFER_SIZE, wait_first=True):
+        self.session = SessionReader(path)
+        self.speed = speed
+        self.loop = loop
+        print(f"Replaying {path}: {self.session.width}x{self.session.height}, "
+              f"{self.session.frame_count} frames, {self.session.duration:.1f} s, speed {speed}")
+        super().__init__(self.session.width, self.session.height, self.session.fps, capture_mode=CAPTURE_RING,
+                         ring_size=ring_size, colour_path=colour_path, infer_size=infer_size, wait_first=wait_first)
+
+    def _start_source(self, width, height, fps, bufsize):
+        self._frames = self.session.frames()
+        self._pace_offset = None
+
+    def _next_frame(self):
+        frame = next(self._frames, None)
+        if frame is None and self.loop and self.session.frame_count:
+            self._frames = self.session.frames()
+            self._pace_offset = None
+            frame = next(self._frames, None)
+        return frame
+
+    def _read_exact(self, buf):
+        frame = self._next_frame()
+        if frame is None:
+            return False
+        yuv, recorded_t = frame
+
+        if self.speed == REPLAY_MAX:
+            # Do not overwrite anything until the tracker took the last frame
+            with self.cond:
+                self.cond.wait_for(lambda: self.consumed_seq >= self.frame_seq or not self.running)
+        else:
+            now = time.monotonic()
+            if self._pace_offset is None:
+                self._pace_offset = now - recorded_t
+            delay = recorded_t + self._pace_offset - now
+            if delay > 0:
+                time.sleep(delay)
+
+        buf[:] = memoryview(yuv).cast("B")
+        return self.running
+
+    def stop(self):
+        self._stream_ended()
+        self.thread.join(timeout=1.0)
+        self._frames = iter(())
+        self.session.close()
@@ -1,5 +1,14 @@
+import itertools
+import os
+import time
+from collections import namedtuple
 import pygame
 import pygame.freetype
+from gaze_ipc import CellReader, EventClient, NO_CELL, MSG_CLICK, MSG_TRACKING_LOST, MSG_TRACKING_FOUND, \
+    MSG_LAYOUT, MSG_RECALIBRATE
+from latency_stats import LatencyStats
+from label_cache import LabelCache, LabelStyle
+from keyboard_engine import SPEAK, SWITCH
 
 # ----------------- Colors -----------------
 BLACK = (0, 0, 0)
@@ -8,16 +17,24 @@ PURPLE = (128, 0, 128)
 GREEN = (0, 255, 0)
 TEXT_COLOR = WHITE
 TXT_COLOR_BLACK = (0, 0, 0)
+GAZE_COLOR = (255, 215, 0)
+RED = (255, 0, 0)
 
 # ----------------- Basic UI -----------------
 def init_pygame_and_get_screen_size():
-    pygame.init()
+    # Just what drawing needs; not pygame.init(), which would open the audio
+    # device too (speech_engine does that, with its own buffer size, when needed)
+    pygame.display.init()
+    pygame.font.init()
     pygame.freetype.init()
     info = pygame.display.Info()
     return info.current_w, info.current_h
 
 def create_window(w, h):
-    return pygame.display.set_mode((w, h), pygame.FULLSCREEN)
+    screen = pygame.display.set_mode((w, h), pygame.FULLSCREEN)
+    # Only clicks matter; pointer motion would just wake the loop up for nothing
+    pygame.event.set_blocked(pygame.MOUSEMOTION)
+    return screen
 
 def draw_grid(screen, w, h):
     # Determine the pixel positions of the lines
@@ -44,10 +61,65 @@ def render_text(surface, text, font, pos, color, use_freetype=False):
         surf = font.render(text, True, color)
         surface.blit(surf, pos)
 
+# ----------------- Fonts & label cache -----------------
+# Labels are rendered once and blitted from label_cache afterwards; fonts are
+# created once per size instead of once per cell per frame.
+label_cache = LabelCache()
+_fonts = {}
+_label_styles = {}
+_style_ids = itertools.count()
+
+def get_font(size, bold=False):
+    # pygame's default font at this size, shared
+    font = _fonts.get((size, bold))
+    if font is None:
+        if bold:
+            font = pygame.font.SysFont(None, size, bold=True)
+        else:
+            font = pygame.font.Font(None, size)
+        _fonts[(size, bold)] = font
+    return font
+
+def quit_pygame():
+    # Fonts do not survive pygame.quit(): forget them, so a later init gets new ones
+    _fonts.clear()
+    _label_styles.clear()
+    pygame.quit()
+
+def draw_centered_lines(surface, rect, label, color, font, use_freetype=False):
+    # Lines of label centred in rect (how draw_buttons lays a label out)
+    lines = label.split("\n")
+    if use_freetype:
+        line_height = font.get_sized_height()
+    else:
+        line_height = font.get_linesize()
+
+    total_h = len(lines) * line_height
+    y_text_start = rect.centery - total_h // 2
+
+    for i, line in enumerate(lines):
+        if use_freetype:
+            text_w, text_h = font.get_rect(line).size
+            pos = (rect.centerx - text_w // 2, y_text_start + i * text_h)
+            font.render_to(surface, pos, line, color)
+        else:
+            surf = font.render(line, True, color)
+            rrect = surf.get_rect(center=(rect.centerx, y_text_start + i * line_height + line_height // 2))
+            surface.blit(surf, rrect)
+
+def button_label_style(font, use_freetype=False):
+    # One cache style per font; the style keeps the font alive, so its id stays unique
+    key = (id(font), use_freetype)
+    style = _label_styles.get(key)
+    if style is None:
+        draw = lambda surface, rect, label, color: draw_centered_lines(surface, rect, label, color, font, use_freetype)
+        style = _label_styles[key] = LabelStyle(f"buttons-{next(_style_ids)}", draw, TEXT_COLOR)
+    return style
+
 # ----------------- Buttons -----------------
-def draw_buttons(screen, w, h, texts, custom_font=None, use_freetype=False):
+def button_rects(w, h):
     rects = {}
-    
+
     # Loop through the 3x3 grid
     for r in range(3):
         for c in range(3):
@@ -55,7 +127,7 @@ def draw_buttons(screen, w, h, texts, custom_font=None, use_freetype=False):
             #    We only want to draw buttons in the other spots.
             if r == 1 and c < 2:
                 continue
-            
+
             # 2. Calculate coordinates EXACTLY (Pixel Perfect)
             #    We calculate the start and end of the cell to determine width/height.
             #    This handles cases where screen width isn't perfectly divisible by 3.
@@ -63,50 +135,36 @@ def draw_buttons(screen, w, h, texts, custom_font=None, use_freetype=False):
             y_start = (r * h) // 3
             x_end = ((c + 1) * w) // 3
             y_end = ((r + 1) * h) // 3
-            
-            width = x_end - x_start
-            height = y_end - y_start
-            
-            rect = pygame.Rect(x_start, y_start, width, height)
-            rects[(r, c)] = rect
-
-            # 3. Determine Color and Label
-            if r == 1 and c == 2:  # Speak button (Row 1, Col 2)
-                color = GREEN
-                label = "Speak"
-                font = custom_font if custom_font else pygame.font.Font(None, 50)
-            else:
-                color = PURPLE
-                label = texts.get((r, c), "")
-                font = custom_font if custom_font else pygame.font.Font(None, 40)
-
-            # 4. Draw Rect (Full Size, No Margins)
-            pygame.draw.rect(screen, color, rect)
-
-            # 5. Center Text
-            if label:
-                lines = label.split("\n")
-                if use_freetype:
-                    line_height = font.get_sized_height()
-                else:
-                    line_height = font.get_linesize()
-                
-                total_h = len(lines) * line_height
-                y_text_start = rect.centery - total_h // 2
-                
-                for i, line in enumerate(lines):
-                    if use_freetype:
-                        text_w, text_h = font.get_rect(line).size
-                        pos = (rect.centerx - text_w // 2, y_text_start + i * text_h)
-                        font.render_to(screen, pos, line, TEXT_COLOR)
-                    else:
-                        surf = font.render(line, True, TEXT_COLOR)
-                        rrect = surf.get_rect(center=(rect.centerx, y_text_start + i * line_height + line_height // 2))
-                        screen.blit(surf, rrect)
+
+            rects[(r, c)] = pygame.Rect(x_start, y_start, x_end - x_start, y_end - y_start)
+    return rects
+
+def _button_look(pos, texts, custom_font, use_freetype):
+    if pos == (1, 2):  # Speak button (Row 1, Col 2)
+        return GREEN, "Speak", button_label_style(custom_font or get_font(50), use_freetype)
+    return PURPLE, texts.get(pos, ""), button_label_style(custom_font or get_font(40), use_freetype)
+
+def draw_buttons(screen, w, h, texts, custom_font=None, use_freetype=False):
+    rects = button_rects(w, h)
+    for pos, rect in rects.items():
+        color, label, style = _button_look(pos, texts, custom_font, use_freetype)
+        # Full size, no margins; the label comes ready-made from the cache
+        pygame.draw.rect(screen, color, rect)
+        if label:
+            label_cache.blit(screen, rect, style, label)
     return rects
 
+def preload_buttons(w, h, layouts, custom_font=None, use_freetype=False):
+    # Render the labels of static layouts up front, so their first frame is only blits
+    rects = button_rects(w, h)
+    for texts in layouts:
+        for pos, rect in rects.items():
+            _, label, style = _button_look(pos, texts, custom_font, use_freetype)
+            if label:
+                label_cache.preload(style, label, rect.size)
+
 # ----------------- Textbox -----------------
-def draw_textbox(screen, w, h, text, custom_font=None, use_freetype=False):
+def textbox_rect(w, h):
     # Textbox occupies Row 1, Columns 0 and 1.
     
     # Calculate x, y, w, h exactly based on grid logic
@@ -115,14 +173,14 @@ def draw_textbox(screen, w, h, text, custom_font=None, use_freetype=False):
     x_end = (2 * w) // 3  # Ends after 2nd column
     y_end = (2 * h) // 3  # Ends after 2nd row (start of 3rd)
     
-    width = x_end - x_start
-    height = y_end - y_start
-    
-    rect = pygame.Rect(x_start, y_start, width, height)
+    return pygame.Rect(x_start, y_start, x_end - x_start, y_end - y_start)
+
+def draw_textbox(screen, w, h, text, custom_font=None, use_freetype=False):
+    rect = textbox_rect(w, h)
     
     pygame.draw.rect(screen, WHITE, rect)
 
-    font = custom_font if custom_font else pygame.font.Font(None, 48)
+    font = custom_font if custom_font else get_font(48)
     padding = 20
     
     lines = text.split("\n")
@@ -137,3 +195,269 @@ def draw_textbox(screen, w, h, text, custom_font=None, use_freetype=False):
             cur_y += surf.get_height()
 
     return rect
+
+# ----------------- Gaze Input -----------------
+# With cursor4.py in OUTPUT_CELL mode there is no pointer: the tracker publishes
+# which cell is looked at, and selections arrive as clicks on that cell's centre.
+# Events (clicks, tracking lost) come over the event channel; the shared page
+# carries the latest cell, and its selections are only used if the channel is down.
+# Without a tracker, all of this does nothing and the mouse works as before.
+gaze_reader = CellReader()
+gaze_events = EventClient()
+gaze_tracking = True
+
+# Latency of tracker selections on this side, from the frame's capture time:
+# channel (sent -> received), capture_to_keyboard, capture_to_screen (first
+# display.update() after the click was handled)
+KEYBOARD_LATENCY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "latency_keyboard.json")
+latency = LatencyStats(KEYBOARD_LATENCY_PATH)
+_pending_click_t = None
+# Pointer clicks reach us twice: as an X mouse click and as MSG_CLICK, in either
+# order. The capture time goes with the mouse click only if that is handled
+# within POINTER_CLICK_MATCH_S of the message (otherwise it was handled already).
+POINTER_CLICK_MATCH_S = 0.1
+_pointer_click = None    # (capture time, received) of a MSG_CLICK waiting for its mouse click
+
+def cell_rect(w, h, cell):
+    r, c = divmod(cell, 3)
+    x_start = (c * w) // 3
+    y_start = (r * h) // 3
+    return pygame.Rect(x_start, y_start, ((c + 1) * w) // 3 - x_start, ((r + 1) * h) // 3 - y_start)
+
+def _post_cell_click(w, h, cell):
+    pygame.event.post(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=cell_rect(w, h, cell).center, button=1))
+
+def poll_gaze(w, h):
+    # Call once per frame, before reading events
+    global gaze_tracking, _pending_click_t, _pointer_click
+    now = time.monotonic()
+    if _pointer_click is not None and now - _pointer_click[1] > POINTER_CLICK_MATCH_S:
+        _pointer_click = None
+    for msg in gaze_events.poll():
+        if msg["type"] == MSG_CLICK:
+            latency.record("channel", msg["sent"], now)
+            latency.record("capture_to_keyboard", msg["t"], now)
+            if msg.get("pointer"):
+                _pointer_click = (msg["t"], now)
+            elif msg.get("cell") is not None:
+                _pending_click_t = msg["t"]
+                _post_cell_click(w, h, msg["cell"])
+        elif msg["type"] == MSG_TRACKING_LOST:
+            gaze_tracking = False
+        elif msg["type"] == MSG_TRACKING_FOUND:
+            gaze_tracking = True
+    cell = gaze_reader.new_selection()
+    if cell is not None and not gaze_events.connected:
+        _post_cell_click(w, h, cell)
+    latency.maybe_dump()
+
+def gaze_frame_shown():
+    # Call right after pygame.display.update()
+    global _pending_click_t
+    if _pending_click_t is not None:
+        latency.record("capture_to_screen", _pending_click_t)
+        _pending_click_t = None
+
+def gaze_mouse_down():
+    # Call when a mouse click is handled: it may be the pointer click of a MSG_CLICK
+    global _pending_click_t, _pointer_click
+    if _pointer_click is not None:
+        if time.monotonic() - _pointer_click[1] <= POINTER_CLICK_MATCH_S:
+            _pending_click_t = _pointer_click[0]
+        _pointer_click = None
+
+def gaze_click_unseen():
+    # Call when a click was handled without changing the screen (Speak, an empty
+    # cell): the next update is not its doing, and may come seconds later
+    global _pending_click_t
+    _pending_click_t = None
+
+def send_gaze_layout(btn_rects, layout):
+    # Tell the tracker which cells hold something to select (dwell skips the rest); only sent on change
+    layout = layout or {}
+    active = sorted(r * 3 + c for (r, c) in btn_rects if (r, c) == (1, 2) or layout.get((r, c)))
+    if gaze_events.layout != {"active": active}:
+        gaze_events.send(MSG_LAYOUT, active=active)
+
+def request_recalibration():
+    gaze_events.send(MSG_RECALIBRATE)
+
+def gaze_overlay_state():
+    # What draw_gaze_cell() would draw right now; dwell progress in 2% steps
+    if gaze_events.connected and not gaze_tracking:
+        return "lost"
+    state = gaze_reader.read()
+    if state is None or state.cell == NO_CELL:
+        return None
+    return state.cell, round(state.progress * 50)
+
+def draw_gaze_cell(screen, w, h, overlay=False):
+    # Outline the looked-at cell, dwell progress as a bar along its bottom.
+    # Returns the rects drawn on.
+    if overlay is False:
+        overlay = gaze_overlay_state()
+    if overlay is None:
+        return []
+    if overlay == "lost":
+        # Tell the user straight away, instead of a frozen highlight
+        pygame.draw.rect(screen, RED, screen.get_rect(), 10)
+        render_text(screen, "Eyes not found - look at the screen", get_font(48), (20, 20), RED)
+        return [screen.get_rect()]
+    cell, progress = overlay
+    rect = cell_rect(w, h, cell)
+    pygame.draw.rect(screen, GAZE_COLOR, rect, 6)
+    if progress > 0:
+        pygame.draw.rect(screen, GAZE_COLOR, (rect.x, rect.bottom - 12, rect.width * progress // 50, 12))
+    return [rect]
+
+# ----------------- Event-driven redraw -----------------
+# The loops sleep in pygame.event.wait() and push only what changed: cells whose
+# label changed, the textbox when the text did, and the gaze highlight.
+GAZE_FRAME_MS = 40     # wake-up interval while a tracker is around (highlight, dwell bar)
+IDLE_WAIT_MS = 500     # otherwise; poll_gaze() looks for a tracker about once a second anyway
+BACKGROUND_WAIT_MS = 1 # while there is background work queued for idle moments
+TEXTBOX_CELLS = (3, 4)
+
+class KeyboardView:
+    """
+    Draw the keyboard into `base`, and only when changed(layout, text) says the
+    labels or the text differ from the last call. present() copies the dirty
+    parts to the screen, puts the gaze highlight on top and updates just those
+    rects; it does nothing at all when nothing changed.
+    """
+
+    def __init__(self, screen, w, h):
+        self.screen = screen
+        self.w = w
+        self.h = h
+        self.base = pygame.Surface((w, h)).convert()
+        self._layout = None
+        self._labels = None
+        self._text = None
+        self._dirty = []
+        self._overlay = None
+        self._overlay_rects = []
+
+    def invalidate(self):
+        self._layout = None
+        self._labels = None
+
+    def changed(self, layout, text):
+        if layout is self._layout and text == self._text and not self._dirty:
+            return False
+        self._layout = layout
+        labels = [(layout or {}).get(divmod(cell, 3), "") for cell in range(9)]
+        if self._labels is None:
+            self._dirty = [self.screen.get_rect()]
+        else:
+            self._dirty += [cell_rect(self.w, self.h, cell) for cell in range(9) if labels[cell] != self._labels[cell]]
+            if text != self._text:
+                self._dirty += [cell_rect(self.w, self.h, cell) for cell in TEXTBOX_CELLS]
+        self._labels = labels
+        self._text = text
+        return bool(self._dirty)
+
+    def present(self):
+        overlay = gaze_overlay_state()
+        if not self._dirty and overlay == self._overlay:
+            return
+        rects = self._dirty + self._overlay_rects if overlay != self._overlay else self._dirty
+        for rect in rects:
+            self.screen.blit(self.base, rect, rect)
+        self._overlay = overlay
+        self._overlay_rects = draw_gaze_cell(self.screen, self.w, self.h, overlay)
+        pygame.display.update(rects + self._overlay_rects)
+        self._dirty = []
+        gaze_frame_shown()
+
+    def wait_events(self, timeout=None):
+        # Sleep until there is input, or it is time to look at the gaze highlight again
+        poll_gaze(self.w, self.h)
+        if timeout is None:
+            tracker = gaze_reader.attached or gaze_events.connected
+            timeout = GAZE_FRAME_MS if tracker else IDLE_WAIT_MS
+        ev = pygame.event.wait(timeout)
+        if ev.type == pygame.NOEVENT:
+            return []
+        if ev.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+            self.invalidate()
+        return [ev]
+
+# ----------------- Keyboard loop -----------------
+# Everything the loop needs to show one language: the compiled keyboard, how it
+# is drawn (and the rects clicks are tested against), speak(text), textbox font
+LanguageKeyboard = namedtuple("LanguageKeyboard", "keyboard draw_buttons rects speak custom_font use_freetype")
+
+def run_keyboards(screen, w, h, keyboards, current, idle_tasks=(), on_first_frame=None):
+    """
+    One loop for all languages on one display. keyboards maps language ->
+    LanguageKeyboard, or a loader(w, h) returning one: only `current` is loaded
+    before the first frame. When the loop is idle, idle_tasks run, one per idle
+    moment, then the other languages load (or when chosen, if that comes first).
+
+    Choosing a language on the language screen swaps it in for the next frame
+    and carries the typed text over. Choosing a language not in keyboards
+    returns "SWITCH_<LANGUAGE>"; closing the window returns None.
+    """
+    def load(language):
+        if not isinstance(keyboards[language], LanguageKeyboard):
+            keyboards[language] = keyboards[language](w, h)
+        return keyboards[language]
+
+    view = KeyboardView(screen, w, h)
+    active = load(current)
+    active.keyboard.reset()
+    active.keyboard.set_geometry(active.rects, textbox_rect(w, h))
+    background = list(idle_tasks)
+    background += [lambda language=language: load(language) for language in keyboards if language != current]
+    first_frame = True
+    running = True
+
+    while running:
+        keyboard = active.keyboard
+        layout = keyboard.screen.cells
+        text = keyboard.text
+
+        # Redraw only when the labels or the text changed
+        if view.changed(layout, text):
+            view.base.fill(BLACK)
+            draw_grid(view.base, w, h)
+            btn_rects = active.draw_buttons(view.base, w, h, layout)
+            send_gaze_layout(btn_rects, layout)
+            draw_textbox(view.base, w, h, text, custom_font=active.custom_font, use_freetype=active.use_freetype)
+        view.present()
+        if first_frame:
+            first_frame = False
+            if on_first_frame:
+                on_first_frame()
+
+        events = view.wait_events(BACKGROUND_WAIT_MS if background else None)
+        if not events and background:
+            background.pop(0)()
+
+        for e in events:
+            if e.type == pygame.QUIT or (e.type == pygame.KEYDOWN and e.key == pygame.K_ESCAPE):
+                running = False
+            if e.type == pygame.KEYDOWN and e.key == pygame.K_F5:
+                request_recalibration()
+            if e.type == pygame.MOUSEBUTTONDOWN:
+                gaze_mouse_down()
+                result = keyboard.click(e.pos)
+                if (result is None or result[0] == SPEAK) and keyboard.screen.cells is layout and keyboard.text == text:
+                    gaze_click_unseen()
+                if result is None:
+                    continue
+                what, value = result
+                if what == SPEAK:
+                    active.speak(value)
+                elif what == SWITCH:
+                    if value not in keyboards:
+                        return f"SWITCH_{value}"
+                    active = load(value)
+                    active.keyboard.reset()
+                    active.keyboard.text = text
+                    active.keyboard.set_geometry(active.rects, textbox_rect(w, h))
+                    # Other button geometry and fonts: repaint the whole screen
+                    view.invalidate()
+
+    quit_pygame()
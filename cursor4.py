@@ -1,13 +1,27 @@
+import argparse
 import cv2
-import subprocess
 import numpy as np
-import shutil
-import mediapipe as mp
-import uinput
 import os
+import signal
 import threading
 import time
-import pyautogui
+from camera_stream import CameraStream, ReplayStream, ring_size_for, CAPTURE_RING, COLOUR_INFER, REPLAY_REALTIME, \
+    REPLAY_MAX
+from session_file import SessionWriter
+from landmark_tracker import EyeRegionTracker, TRACK_CROP
+from landmark_backends import create_backend, create_eye_backend, BACKEND_MEDIAPIPE
+from tracker_pipeline import LatestSlot, Stage, RateCounter
+from virtual_pointer import VirtualPointer, POINTER_ABS, screen_size
+from gaze_filters import create_gaze_filter, FILTER_ONE_EURO
+from calibration import NinePointCalibration, MODEL_POLY2, mapping_from_dict
+from tracker_profile import load_profile, save_profile
+from latency_stats import LatencyStats
+from dwell import DwellSelector, SELECT_WINK, SELECT_DWELL
+from blink_detector import BlinkDetector, EAR_LANDMARKS, EVENT_WINK_LEFT
+from gaze_ipc import CellPublisher, OUTPUT_POINTER, OUTPUT_CELL, EventServer, MSG_GAZE, MSG_CELL, MSG_CLICK, \
+    MSG_TRACKING_LOST, MSG_TRACKING_FOUND, MSG_CALIBRATION, MSG_READY, MSG_LAYOUT, MSG_RECALIBRATE
+
+STARTUP_T0 = time.monotonic()
 
 # --- CONFIGURATION ---
 WIDTH = 1280
@@ -15,79 +29,147 @@ HEIGHT = 720
 FPS = 30
 WINDOW_NAME = "3x3 Grid Eye Tracker"
 
-# --- USER CALIBRATED SENSITIVITY ---
+# Preview: "off" (no window, production), "every-N" (draw every Nth frame) or "full"
+# The overlay is drawn directly at the mini-view size
+PREVIEW_W, PREVIEW_H = 320, 180
+
+# Capture: CAPTURE_RING reuses preallocated frame buffers, CAPTURE_COPY is the old path
+CAPTURE_MODE = CAPTURE_RING
+# Colour: COLOUR_INFER downsamples in YUV straight to the 640x360 RGB inference frame,
+# COLOUR_FULL builds the full 1280x720 BGR frame first (old path)
+COLOUR_PATH = COLOUR_INFER
+INFER_W, INFER_H = 640, 360
+# Give up if the camera delivers nothing for this long (seconds)
+CAMERA_TIMEOUT = 2.0
+# Tracking: TRACK_CROP runs FaceMesh every REDETECT_EVERY frames (or on loss) and
+# follows the eye points with optical flow in between, TRACK_FULL runs it every frame
+TRACKING_MODE = TRACK_CROP
+REDETECT_EVERY = 5
+# Inference: full-face backend (BACKEND_MEDIAPIPE / BACKEND_TASKS) and, for TRACK_CROP,
+# an optional eye-crop backend ("tflite" / "onnx" iris model, None = optical flow)
+LANDMARK_BACKEND = BACKEND_MEDIAPIPE
+EYE_BACKEND = None
+INFER_THREADS = 4
+EYE_BACKEND_INT8 = False
+
+# Output: OUTPUT_POINTER drives the system pointer; OUTPUT_CELL only publishes the
+# looked-at 3x3 cell (and selections) to the keyboard through shared memory
+OUTPUT_MODE = OUTPUT_POINTER
+# Event channel to the keyboard (gaze_ipc.py): clicks, cell changes, tracking loss,
+# and layout / recalibration requests coming back
+EVENT_CHANNEL = True
+
+# Latency: per-stage p50/p95/p99 (ms) over the last frames, written to this file
+# every LATENCY_DUMP_EVERY seconds and, with LATENCY_OVERLAY, shown in the preview
+LATENCY_STATS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "latency_tracker.json")
+LATENCY_DUMP_EVERY = 10.0
+LATENCY_OVERLAY = True
+# Pointer: POINTER_ABS emits absolute positions, POINTER_REL the old relative moves
+POINTER_MODE = POINTER_ABS
+
+# Smoothing between landmarks and cursor: FILTER_ONE_EURO, FILTER_KALMAN or FILTER_NONE.
+# GAZE_FILTER_PARAMS overrides the defaults in gaze_filters.py for this user.
+GAZE_FILTER = FILTER_ONE_EURO
+GAZE_FILTER_PARAMS = {}
+
+# Calibration: SPACE runs the nine-point calibration and fits MODEL_POLY2 (or
+# MODEL_HOMOGRAPHY) from eye position to screen. None = old single-point box below.
+CALIBRATION_MODEL = MODEL_POLY2
+CALIBRATION_SAMPLES = 15      # frames collected per target
+CALIBRATION_SETTLE = 0.8      # seconds to let the eye land on a new target
+CALIBRATION_WINDOW = "Calibration"
+
+# --- USER CALIBRATED SENSITIVITY (single-point box only) ---
 ROI_X_OFFSET = 10  
 ROI_Y_OFFSET = 5
 
 # CLICK SETTINGS
-BLINK_THRESHOLD = 6.5 
-CLICK_COOLDOWN_FRAMES = 10
+# SELECT_WINK clicks on a left-eye wink, SELECT_DWELL when the gaze rests on a cell
+SELECTION_MODE = SELECT_WINK
+# Winks are told apart from blinks by eye aspect ratio (blink_detector.py);
+# open/closed levels are learned per user and kept in the profile
+CLICK_WINK = EVENT_WINK_LEFT
+WINK_MIN, WINK_MAX = 0.15, 1.0   # seconds one eye must stay shut to count as a wink
+LONG_CLOSE = 1.5                 # seconds both eyes shut to count as a long close
+DWELL_TIME = 1.2          # seconds on one cell before it is clicked
+DWELL_HYSTERESIS = 0.15   # fraction of a cell to cross past a border before the cell changes
+
+# --- COMMAND LINE ---
+def parse_preview(value):
+    """'off' -> 0, 'full' -> 1, 'every-N' -> N (draw one preview per N frames)."""
+    if value == "off":
+        return 0
+    if value == "full":
+        return 1
+    if value.startswith("every-") and value[6:].isdigit() and int(value[6:]) > 0:
+        return int(value[6:])
+    raise argparse.ArgumentTypeError(f"expected off, every-N or full, got {value!r}")
+
+parser = argparse.ArgumentParser(description=WINDOW_NAME)
+parser.add_argument("--preview", type=parse_preview, default="full", metavar="off|every-N|full",
+                    help="preview window mode (default: full)")
+parser.add_argument("--calibrate", action="store_true",
+                    help="recalibrate at startup even if the profile has a saved calibration")
+parser.add_argument("--record", metavar="FILE",
+                    help="also write the raw camera frames and their capture times to a session file")
+parser.add_argument("--replay", metavar="FILE",
+                    help="run on a session recorded with --record instead of the camera")
+parser.add_argument("--replay-speed", choices=[REPLAY_REALTIME, REPLAY_MAX], default=REPLAY_REALTIME,
+                    help="realtime: recorded frame spacing; max: every frame once, as fast as tracking allows")
+args = parser.parse_args()
+PREVIEW_EVERY = args.preview
 
 # --- DETECT SCREEN SIZE ---
-try:
-    output = subprocess.check_output("xrandr | grep '*' | awk '{print $1}'", shell=True).decode()
-    SCREEN_W, SCREEN_H = map(int, output.strip().split('x'))
-except:
-    SCREEN_W, SCREEN_H = 1920, 1080
-
-# --- CLASS: CAMERA WORKER ---
-class CameraStream:
-    def __init__(self, width, height, fps):
-        self.width = width
-        self.height = height
-        self.frame_size = int(width * height * 1.5)
-        self.frame = None
-        self.running = False
-        
-        cmd_executable = "rpicam-vid" if shutil.which("rpicam-vid") else "libcamera-vid"
-        command = [
-            cmd_executable, "--inline", "--nopreview",
-            "--width", str(width), "--height", str(height),
-            "--framerate", str(fps), "--timeout", "0",
-            "--codec", "yuv420", "-o", "-"
-        ]
-        
-        self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=10**8)
-        self.running = True
-        self.thread = threading.Thread(target=self.update, args=())
-        self.thread.daemon = True
-        self.thread.start()
-        
-        print("Waiting for camera stream...")
-        while self.frame is None:
-            time.sleep(0.1)
-
-    def update(self):
-        while self.running:
-            raw_bytes = self.process.stdout.read(self.frame_size)
-            if len(raw_bytes) != self.frame_size:
-                self.running = False
-                break
-            yuv = np.frombuffer(raw_bytes, dtype=np.uint8).reshape((int(self.height * 1.5), self.width))
-            bgr = cv2.cvtColor(yuv, cv2.COLOR_YUV2BGR_I420)
-            self.frame = cv2.flip(bgr, 1)
-
-    def read(self):
-        return self.frame
-
-    def stop(self):
-        self.running = False
-        self.process.terminate()
+SCREEN_W, SCREEN_H = screen_size()
 
 # --- MAIN SETUP ---
-camera = CameraStream(WIDTH, HEIGHT, FPS)
-device = uinput.Device([uinput.BTN_LEFT, uinput.BTN_RIGHT, uinput.REL_X, uinput.REL_Y])
+profile = load_profile()
+# The camera starts first and does not wait for its first frame: rpicam-vid spins
+# up while the models below load and warm up, then we wait for whatever is left.
+# The ring holds as many frames as arrive during one inference, as measured last session.
+RING_SIZE = ring_size_for(profile.get("inference_ms"), FPS)
+if args.replay:
+    camera = ReplayStream(args.replay, speed=args.replay_speed, ring_size=RING_SIZE,
+                          colour_path=COLOUR_PATH, infer_size=(INFER_W, INFER_H), wait_first=False)
+    WIDTH, HEIGHT = camera.width, camera.height
+else:
+    camera = CameraStream(WIDTH, HEIGHT, FPS, capture_mode=CAPTURE_MODE, ring_size=RING_SIZE,
+                          colour_path=COLOUR_PATH, infer_size=(INFER_W, INFER_H), wait_first=False)
+pointer = VirtualPointer(POINTER_MODE, SCREEN_W, SCREEN_H) if OUTPUT_MODE == OUTPUT_POINTER else None
+cell_publisher = CellPublisher() if OUTPUT_MODE == OUTPUT_CELL else None
+gaze_filter = create_gaze_filter(GAZE_FILTER, **GAZE_FILTER_PARAMS)
+calibration = NinePointCalibration(SCREEN_W, SCREEN_H, CALIBRATION_MODEL or MODEL_POLY2,
+                                   samples_per_target=CALIBRATION_SAMPLES, settle_seconds=CALIBRATION_SETTLE)
+dwell = DwellSelector(SCREEN_W, SCREEN_H, dwell_time=DWELL_TIME, hysteresis=DWELL_HYSTERESIS)
+
+landmark_backend = create_backend(LANDMARK_BACKEND, INFER_THREADS)
+eye_backend = create_eye_backend(EYE_BACKEND, INFER_THREADS, int8=EYE_BACKEND_INT8)
+landmark_backend.warm_up((INFER_W, INFER_H))
+if eye_backend is not None:
+    eye_backend.warm_up()
+camera.wait_ready()
+print(f"Tracker ready after {time.monotonic() - STARTUP_T0:.2f} s")
+
+# Landmarks (as seen on the mirrored preview)
+RIGHT_IRIS_CENTER = 473
+LEFT_EYE_LIDS, RIGHT_EYE_LIDS = EAR_LANDMARKS
 
-mp_face_mesh = mp.solutions.face_mesh
-face_mesh = mp_face_mesh.FaceMesh(
-    max_num_faces=1, refine_landmarks=True, 
-    min_detection_confidence=0.5, min_tracking_confidence=0.5
-)
+# FaceMesh labels eyes by where they appear in the image, so when we mirror
+# landmark x instead of pixels the left/right eye indices swap as well
+_EYE_PAIRS = [(468, 473)] + list(zip(*EAR_LANDMARKS))
+MIRROR_LANDMARKS = {**dict(_EYE_PAIRS), **{b: a for a, b in _EYE_PAIRS}}
+if not camera.infer_mirrored:
+    RIGHT_IRIS_CENTER = MIRROR_LANDMARKS[RIGHT_IRIS_CENTER]
+    LEFT_EYE_LIDS = [MIRROR_LANDMARKS[i] for i in LEFT_EYE_LIDS]
+    RIGHT_EYE_LIDS = [MIRROR_LANDMARKS[i] for i in RIGHT_EYE_LIDS]
 
-# Landmarks
-RIGHT_IRIS_CENTER = 473
-LEFT_EYE_LIDS = [159, 145]
-RIGHT_EYE_LIDS = [386, 374]
+# Rows of the tracker's landmark array: iris, then six lid points per eye
+TRACKED_LANDMARKS = [RIGHT_IRIS_CENTER] + LEFT_EYE_LIDS + RIGHT_EYE_LIDS
+IRIS_ROW = 0
+EYE_ROWS = slice(1, 13)
+
+tracker = EyeRegionTracker(landmark_backend, TRACKED_LANDMARKS, mode=TRACKING_MODE,
+                           redetect_every=REDETECT_EVERY, eye_backend=eye_backend)
 
 # Colors
 SKY_BLUE = (235, 206, 135)
@@ -96,168 +178,513 @@ ROI_COLOR = (0, 255, 255) # Yellow
 CLICK_MSG_COLOR = (0, 0, 255)
 GRID_COLOR = (255, 255, 255)
 HIGHLIGHT_COLOR = (0, 0, 255) # Reddish highlight
+TARGET_COLOR = (0, 0, 255)
+TARGET_PROGRESS_COLOR = (0, 255, 0)
+PREVIEW_FONT_SCALE = 0.35
 
-# State
+# Solid tint for one preview cell, blended into the highlighted cell only
+highlight_tint = np.full((PREVIEW_H // 3 + 1, PREVIEW_W // 3 + 1, 3), HIGHLIGHT_COLOR, dtype=np.uint8)
+
+# State (cursor stage writes, preview stage reads; keys in the preview change it)
 calibrated = False
 xs, ys = 0.0, 0.0
-click_cooldown = 0
-show_click_msg = 0
-
-cv2.namedWindow(WINDOW_NAME, cv2.WINDOW_NORMAL)
-#cv2.setWindowProperty(WINDOW_NAME, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
-
-print("Look at Blue Dot & Press SPACE to see the Highlighted Grid.")
+click_count = 0
+tracking = False
+sent_cell = None
+
+# --- USER PROFILE ---
+# Calibration and sensitivity survive restarts; saved whenever they change
+if profile:
+    ROI_X_OFFSET, ROI_Y_OFFSET = profile.get("roi_offset", (ROI_X_OFFSET, ROI_Y_OFFSET))
+    if "single_point" in profile:
+        xs, ys = profile["single_point"]
+        calibrated = True
+    if "mapping" in profile:
+        if profile.get("screen") == [SCREEN_W, SCREEN_H]:
+            calibration.mapping = mapping_from_dict(profile["mapping"])
+        else:
+            print(f"Saved calibration is for a {profile.get('screen')} screen, recalibrating.")
+blink = BlinkDetector(WINK_MIN, WINK_MAX, LONG_CLOSE, baselines=profile.get("blink"))
+
+def save_tracker_profile():
+    profile.update(screen=[SCREEN_W, SCREEN_H], roi_offset=[ROI_X_OFFSET, ROI_Y_OFFSET])
+    if calibrated:
+        profile["single_point"] = [float(xs), float(ys)]
+    if calibration.mapping is not None:
+        profile["mapping"] = calibration.mapping.to_dict()
+    if blink.to_dict() is not None:
+        profile["blink"] = blink.to_dict()
+    inference = latency.summary().get("inference")
+    if inference is not None:
+        profile["inference_ms"] = inference["p95"]
+    save_profile(profile)
+
+# --- KEYBOARD EVENT CHANNEL ---
+def on_keyboard_message(msg):
+    # Runs on the channel's thread
+    msg_type = msg.get("type")
+    if msg_type == MSG_READY:
+        print("Keyboard connected")
+        emit(MSG_CALIBRATION, active=calibration.active)
+        emit(MSG_TRACKING_FOUND if tracking else MSG_TRACKING_LOST, t=time.monotonic())
+        emit(MSG_CELL, t=time.monotonic(), cell=dwell.cell, confidence=dwell.confidence)
+    elif msg_type == MSG_LAYOUT:
+        dwell.active_cells = frozenset(msg.get("active", ()))
+    elif msg_type == MSG_RECALIBRATE and CALIBRATION_MODEL is not None and not calibration.active:
+        calibration.start()
+
+# Defined before the server starts: its thread may call on_keyboard_message right away
+events = None
+
+def emit(msg_type, **fields):
+    if events is not None:
+        events.send(msg_type, **fields)
+
+if EVENT_CHANNEL:
+    try:
+        events = EventServer(on_keyboard_message)
+    except OSError as e:
+        print(f"⚠️ Keyboard event channel unavailable: {e}")
+
+# --- PIPELINE ---
+# capture (CameraStream thread) -> inference -> cursor output -> preview (main thread).
+# Stages talk through latest-wins slots, so a slow preview never delays the cursor.
+STAGE_TIMEOUT = 0.05
+stop_event = threading.Event()
+gaze_slot = LatestSlot()      # inference -> cursor: (seq, capture_time, points or None, infer start, infer end)
+preview_slot = LatestSlot()   # cursor -> preview: dict describing what to draw
+# Stages, all measured on the frame's own timestamps:
+#   queue (capture -> inference start), inference, handoff (inference end -> cursor),
+#   cursor, capture_to_output (pointer / cell written), capture_to_click, capture_to_preview
+latency = LatencyStats(LATENCY_STATS_PATH, dump_every=LATENCY_DUMP_EVERY)
+
+
+# --- STAGE: INFERENCE ---
+last_seq = 0
+
+def inference_step():
+    global last_seq
+    # Blocks until a new frame arrives, so FaceMesh never runs twice on one frame
+    seq, capture_time, rgb_small = camera.read_infer(last_seq, timeout=CAMERA_TIMEOUT)
+    if rgb_small is None:
+        return False
+    last_seq = seq
+
+    infer_start = time.monotonic()
+    points = tracker.process(rgb_small)
+    if points is not None:
+        # Normalized -> preview pixels, mirroring x if the pixels were not mirrored
+        if not camera.infer_mirrored:
+            points[:, 0] = 1.0 - points[:, 0]
+        points *= (WIDTH, HEIGHT)
+    infer_end = time.monotonic()
+    gaze_slot.put((seq, capture_time, points, infer_start, infer_end))
+    latency.record("queue", capture_time, infer_start)
+    latency.record("inference", infer_start, infer_end)
+    return True
+
+
+# --- STAGE: RECORDER (--record) ---
+# Copies each raw frame into the session writer's chunk buffer; compression runs
+# here too, off the capture and inference threads. Frames it cannot keep up with
+# are skipped (recorder_skipped); the capture times keep the real spacing.
+recorder = SessionWriter(args.record, camera.width, camera.height, FPS) if args.record else None
+record_seq = 0
+recorder_skipped = 0
+
+def record_step():
+    global record_seq, recorder_skipped
+    seq, capture_time, yuv = camera.read_yuv(record_seq, timeout=CAMERA_TIMEOUT)
+    if yuv is None:
+        return None if camera.running else False
+    if record_seq:
+        recorder_skipped += seq - record_seq - 1
+    record_seq = seq
+    np.copyto(recorder.frame_buffer(), yuv.reshape(-1))
+    # The ring slot may have been refilled while we copied
+    if not camera.is_valid(seq):
+        recorder_skipped += 1
+        return None
+    recorder.commit(capture_time)
+    return True
+
+
+# --- STAGE: CURSOR OUTPUT ---
+gaze_seq = 0
+
+def map_gaze(xi, yi, view):
+    """Eye position -> clamped screen position, or None before calibration."""
+    # --- ABSOLUTE MAPPING ---
+    mapping = calibration.mapping
+    if mapping is not None:
+        target_cursor_x, target_cursor_y = mapping(xi, yi)
+        final_x = max(0, min(target_cursor_x, SCREEN_W))
+        final_y = max(0, min(target_cursor_y, SCREEN_H))
+        return final_x, final_y
+
+    if not calibrated:
+        return None
+    r1x = xs - ROI_X_OFFSET
+    r2x = xs + ROI_X_OFFSET
+    r1y = ys - ROI_Y_OFFSET
+    r2y = ys + ROI_Y_OFFSET
+
+    denom_x = (r2x - r1x)
+    denom_y = (r2y - r1y)
+    if denom_x == 0: denom_x = 0.001
+    if denom_y == 0: denom_y = 0.001
+
+    target_cursor_x = SCREEN_W - ((r2x - xi) * (SCREEN_W / denom_x))
+    target_cursor_y = SCREEN_H - ((r2y - yi) * (SCREEN_H / denom_y))
+
+    final_x = max(0, min(target_cursor_x, SCREEN_W))
+    final_y = max(0, min(target_cursor_y, SCREEN_H))
+    view["roi"] = (r1x, r1y, r2x, r2y)
+    return final_x, final_y
+
+
+def select(cell, snap, t):
+    """One click: a selection message in cell mode, a pointer click otherwise."""
+    global click_count
+    if OUTPUT_MODE == OUTPUT_CELL:
+        if cell is None:
+            return
+        cell_publisher.select(cell)
+    else:
+        if snap:
+            # Click the cell centre: with hysteresis the cursor may sit just past the border
+            pointer.move_to(*dwell.cell_center(cell))
+        pointer.click()
+    click_count += 1
+    latency.record("capture_to_click", t)
+    # "pointer": the keyboard already gets this one as a real mouse click
+    emit(MSG_CLICK, t=t, cell=cell, pointer=OUTPUT_MODE == OUTPUT_POINTER)
+
+
+def output_gaze(view, xi, yi, eye_event, capture_time):
+    view["cursor"] = map_gaze(xi, yi, view)
+    if view["cursor"] is not None:
+        # The cell (with hysteresis) is tracked in every mode; dwell only fires in SELECT_DWELL
+        fired = dwell.update(*view["cursor"], capture_time)
+        view["cell"] = dwell.cell
+        if OUTPUT_MODE == OUTPUT_POINTER:
+            pointer.move_to(*view["cursor"])
+        if SELECTION_MODE == SELECT_DWELL:
+            view["dwell"] = dwell.progress
+            if fired:
+                select(dwell.cell, snap=True, t=capture_time)
+
+    # --- CLICK LOGIC ---
+    if SELECTION_MODE == SELECT_WINK and eye_event == CLICK_WINK:
+        select(dwell.cell, snap=False, t=capture_time)
+
+
+def cursor_step():
+    global gaze_seq, tracking, sent_cell
+    gaze_seq, sample = gaze_slot.get(gaze_seq, timeout=STAGE_TIMEOUT)
+    if sample is None:
+        return None
+    cursor_start = time.monotonic()
+    seq, capture_time, points, _, infer_end = sample
+    latency.record("handoff", infer_end, cursor_start)
+    view = {"seq": seq, "capture_time": capture_time, "iris": None, "cursor": None, "roi": None,
+            "calibrating": calibration.active, "cell": None, "dwell": 0.0, "eye_event": None}
+
+    if points is None:
+        gaze_filter.reset()
+        dwell.reset()
+        blink.reset()
+        if tracking:
+            tracking = False
+            emit(MSG_TRACKING_LOST, t=capture_time)
+    else:
+        if not tracking:
+            tracking = True
+            emit(MSG_TRACKING_FOUND, t=capture_time)
+        xi, yi = gaze_filter(points[IRIS_ROW], capture_time)
+        view["iris"] = (xi, yi)
+        # Keeps learning the open/closed levels during calibration too
+        eye_event = blink.update(points[EYE_ROWS].reshape(2, 6, 2), capture_time)
+        view["eye_event"] = eye_event
+
+        if calibration.active:
+            # The user is looking at a target, not typing: no clicks, no cursor
+            calibration.add_sample((xi, yi), capture_time)
+            dwell.reset()
+        else:
+            output_gaze(view, xi, yi, eye_event, capture_time)
+
+    if cell_publisher is not None:
+        cell_publisher.update(dwell.cell, dwell.confidence, view["dwell"])
+    if dwell.cell != sent_cell:
+        sent_cell = dwell.cell
+        emit(MSG_CELL, t=capture_time, cell=dwell.cell, confidence=dwell.confidence)
+    if view["cursor"] is not None:
+        emit(MSG_GAZE, t=capture_time, x=view["cursor"][0], y=view["cursor"][1], cell=dwell.cell)
+    cursor_end = time.monotonic()
+    latency.record("cursor", cursor_start, cursor_end)
+    latency.record("capture_to_output", capture_time, cursor_end)
+    view["clicks"] = click_count
+    preview_slot.put(view)
+    return True
+
+
+# --- STAGE: PREVIEW (main thread, HighGUI must live here) ---
+def handle_key(key, view):
+    global ROI_X_OFFSET, ROI_Y_OFFSET, xs, ys, calibrated
+    # Sensitivity Controls
+    if key == ord('='):
+        ROI_X_OFFSET += 1
+        ROI_Y_OFFSET += 0.5
+    elif key == ord('-'):
+        ROI_X_OFFSET -= 1
+        ROI_Y_OFFSET -= 0.5
+    ROI_X_OFFSET = max(1, ROI_X_OFFSET)
+    ROI_Y_OFFSET = max(1, ROI_Y_OFFSET)
+    if key in (ord('='), ord('-')):
+        save_tracker_profile()
+
+    # --- CALIBRATION ---
+    if key == ord(' ') and CALIBRATION_MODEL is not None and not calibration.active:
+        calibration.start()
+    elif key == ord(' ') and CALIBRATION_MODEL is None and not calibrated \
+            and view is not None and view["iris"] is not None:
+        xs, ys = view["iris"]
+        calibrated = True
+        save_tracker_profile()
+    elif key == 27 and calibration.active:
+        calibration.cancel()
+
+
+# --- CALIBRATION SCREEN (main thread) ---
+calibration_canvas = None
+calibration_drawn = None
+
+def update_calibration_screen():
+    """Show the current target fullscreen; redraws only when the target or its progress changes."""
+    global calibration_canvas, calibration_drawn
+    target = calibration.target()
+    if target is None:
+        if calibration_canvas is not None:
+            cv2.destroyWindow(CALIBRATION_WINDOW)
+            calibration_canvas = None
+            emit(MSG_CALIBRATION, active=False)
+            if calibration.error is None and calibration.mapping is not None:
+                print(f"✅ Nine-point calibration done ({calibration.mapping.name})")
+                save_tracker_profile()
+        return
+
+    if calibration_canvas is None:
+        calibration_canvas = np.zeros((SCREEN_H, SCREEN_W, 3), dtype=np.uint8)
+        calibration_drawn = None
+        emit(MSG_CALIBRATION, active=True)
+        cv2.namedWindow(CALIBRATION_WINDOW, cv2.WINDOW_NORMAL)
+        cv2.setWindowProperty(CALIBRATION_WINDOW, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
+        # Stay above the keyboard, which is fullscreen too (needs OpenCV >= 4.5.5)
+        if hasattr(cv2, "WND_PROP_TOPMOST"):
+            cv2.setWindowProperty(CALIBRATION_WINDOW, cv2.WND_PROP_TOPMOST, 1)
+
+    index, (tx, ty), progress = target
+    state = (index, int(progress * 12))
+    if state == calibration_drawn:
+        return
+    calibration_drawn = state
+
+    center = (int(tx), int(ty))
+    calibration_canvas[:] = 0
+    cv2.circle(calibration_canvas, center, 30, GRID_COLOR, 2)
+    cv2.circle(calibration_canvas, center, 6, TARGET_COLOR, -1)
+    if progress > 0:
+        cv2.ellipse(calibration_canvas, center, (40, 40), -90, 0, 360 * progress, TARGET_PROGRESS_COLOR, 4)
+    cv2.putText(calibration_canvas, f"Look at the dot  {index + 1}/9   (Esc cancels)", (30, 50),
+                cv2.FONT_HERSHEY_SIMPLEX, 1.0, GRID_COLOR, 2)
+    cv2.imshow(CALIBRATION_WINDOW, calibration_canvas)
+
+
+def draw_overlay(frame, view):
+    """Draw the tracker state onto a preview-sized frame (tracker coords are WIDTH x HEIGHT)."""
+    if view["iris"] is None:
+        return
+    pw, ph = frame.shape[1], frame.shape[0]
+    sx, sy = pw / WIDTH, ph / HEIGHT
+    xi, yi = view["iris"]
+
+    if view["calibrating"]:
+        cv2.putText(frame, "CALIBRATING", (8, 14), cv2.FONT_HERSHEY_SIMPLEX, PREVIEW_FONT_SCALE, ROI_COLOR, 1)
+        cv2.circle(frame, (int(xi * sx), int(yi * sy)), 2, (0, 255, 0), -1)
+        return
+
+    if view["cursor"] is None:
+        cv2.circle(frame, (pw // 2, ph // 2), max(2, int(15 * sx)), CALIBRATION_COLOR, -1)
+        cv2.circle(frame, (int(xi * sx), int(yi * sy)), 2, (0, 255, 0), -1)
+        return
+
+    final_x, final_y = view["cursor"]
+
+    # 1. HIGHLIGHT ACTIVE CELL
+    if view["cell"] is not None:
+        # The selector's cell, hysteresis included, in every selection mode
+        # (wink too); only the progress bar below is dwell-specific
+        row_idx, col_idx = divmod(view["cell"], 3)
+    else:
+        # Determine which cell the cursor is in (0, 1, or 2)
+        col_idx = int(final_x / (SCREEN_W / 3))
+        row_idx = int(final_y / (SCREEN_H / 3))
+
+        # Clamp index to 0-2 (handle edge case where cursor is at max screen pixel)
+        col_idx = min(2, max(0, col_idx))
+        row_idx = min(2, max(0, row_idx))
+
+    # Calculate coordinates on the preview frame
+    cell_w, cell_h = pw // 3, ph // 3
+    x1 = col_idx * cell_w
+    y1 = row_idx * cell_h
+    x2 = x1 + cell_w
+    y2 = y1 + cell_h
+
+    # Blend the red tint into that cell only (0.3 = 30% opacity)
+    cell = frame[y1:y2, x1:x2]
+    cell[:] = cv2.addWeighted(cell, 0.7, highlight_tint[:cell.shape[0], :cell.shape[1]], 0.3, 0)
+    if view["dwell"] > 0:
+        # Dwell progress fills a bar along the bottom of the cell
+        cv2.rectangle(frame, (x1, y2 - 4), (x1 + int(cell_w * view["dwell"]), y2 - 1), SKY_BLUE, -1)
+
+    # 2. DRAW GRID LINES ON TOP
+    cv2.line(frame, (cell_w, 0), (cell_w, ph), GRID_COLOR, 1)
+    cv2.line(frame, (2 * cell_w, 0), (2 * cell_w, ph), GRID_COLOR, 1)
+    cv2.line(frame, (0, cell_h), (pw, cell_h), GRID_COLOR, 1)
+    cv2.line(frame, (0, 2 * cell_h), (pw, 2 * cell_h), GRID_COLOR, 1)
+
+    # 3. Draw ROI Box (single-point mode) & Cursor Circle
+    if view["roi"] is not None:
+        r1x, r1y, r2x, r2y = view["roi"]
+        cv2.rectangle(frame, (int(r1x * sx), int(r1y * sy)), (int(r2x * sx), int(r2y * sy)), ROI_COLOR, 1)
+    cv2.circle(frame, (int(xi * sx), int(yi * sy)), 1, (0, 255, 0), -1)
+
+    cam_cursor_x = int((final_x / SCREEN_W) * pw)
+    cam_cursor_y = int((final_y / SCREEN_H) * ph)
+    cv2.circle(frame, (cam_cursor_x, cam_cursor_y), max(3, int(20 * sx)), SKY_BLUE, 1)
+
+    if view["roi"] is not None:
+        text_info = f"Box: {ROI_X_OFFSET:.1f}x{ROI_Y_OFFSET:.1f}  Dropped: {camera.frames_dropped}"
+    else:
+        text_info = f"Map: {calibration.mapping.name}  Dropped: {camera.frames_dropped}"
+    cv2.putText(frame, text_info, (8, 14), cv2.FONT_HERSHEY_SIMPLEX, PREVIEW_FONT_SCALE, ROI_COLOR, 1)
+    infer_info = f"{landmark_backend.name}: {landmark_backend.last_ms:.1f} ms"
+    if eye_backend is not None:
+        infer_info += f"  {eye_backend.name}: {eye_backend.last_ms:.1f} ms"
+    cv2.putText(frame, infer_info, (8, ph - 8), cv2.FONT_HERSHEY_SIMPLEX, PREVIEW_FONT_SCALE, ROI_COLOR, 1)
+    stage_info = f"FPS infer {inference_stage.fps:.0f} | cursor {cursor_stage.fps:.0f} | preview {preview_rate.fps:.0f}"
+    cv2.putText(frame, stage_info, (8, ph - 22), cv2.FONT_HERSHEY_SIMPLEX, PREVIEW_FONT_SCALE, ROI_COLOR, 1)
+    output_ms = latency.percentiles("capture_to_output") if LATENCY_OVERLAY else None
+    if output_ms is not None:
+        latency_info = "Latency p50/p95/p99: {:.0f}/{:.0f}/{:.0f} ms".format(*output_ms)
+        cv2.putText(frame, latency_info, (8, ph - 36), cv2.FONT_HERSHEY_SIMPLEX, PREVIEW_FONT_SCALE, ROI_COLOR, 1)
+
+
+inference_stage = Stage("inference", inference_step, stop_event)
+cursor_stage = Stage("cursor", cursor_step, stop_event)
+record_stage = Stage("recorder", record_step, stop_event) if recorder is not None else None
+preview_rate = RateCounter()
+
+if PREVIEW_EVERY:
+    cv2.namedWindow(WINDOW_NAME, cv2.WINDOW_NORMAL)
+    #cv2.setWindowProperty(WINDOW_NAME, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
+    # Mini view in the Top-Right Corner, so it doesn't block the keyboard
+    cv2.moveWindow(WINDOW_NAME, SCREEN_W - PREVIEW_W, 0)
+    if CALIBRATION_MODEL is not None:
+        print("Press SPACE and follow the dot to (re)calibrate.")
+    else:
+        print("Look at Blue Dot & Press SPACE to see the Highlighted Grid.")
+else:
+    print("Preview off: keys (SPACE, +/-, q) are unavailable, Ctrl+C to quit.")
+
+# start_als.sh stops us with SIGTERM: leave through the same cleanup as 'q'
+signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+
+inference_stage.start()
+cursor_stage.start()
+if record_stage is not None:
+    record_stage.start()
+# Nobody may be there to press SPACE: without a saved mapping, calibrate straight away
+if CALIBRATION_MODEL is not None and (args.calibrate or calibration.mapping is None):
+    calibration.start()
 
 try:
-    while True:
-        frame = camera.read()
-        if frame is None: break
-
-        small_frame = cv2.resize(frame, (640, 360))
-        rgb_small = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
-        results = face_mesh.process(rgb_small)
-        
+    preview_seq = 0
+    view = None
+    show_click_msg = 0
+    seen_clicks = 0
+    views_seen = 0
+
+    while not stop_event.is_set():
+        latency.maybe_dump()
+        update_calibration_screen()
+        if not PREVIEW_EVERY:
+            if calibration_canvas is None:
+                stop_event.wait(0.5)
+            elif cv2.waitKey(30) & 0xFF == 27:
+                calibration.cancel()
+            continue
+
+        preview_seq, new_view = preview_slot.get(preview_seq, timeout=STAGE_TIMEOUT)
         key = cv2.waitKey(1) & 0xFF
-        
-        # Sensitivity Controls
-        if key == ord('='): 
-            ROI_X_OFFSET += 1
-            ROI_Y_OFFSET += 0.5
-        elif key == ord('-'):
-            ROI_X_OFFSET -= 1
-            ROI_Y_OFFSET -= 0.5
-        ROI_X_OFFSET = max(1, ROI_X_OFFSET)
-        ROI_Y_OFFSET = max(1, ROI_Y_OFFSET)
-
-        if results.multi_face_landmarks:
-            landmarks = results.multi_face_landmarks[0].landmark
-            def get_point(idx):
-                return (landmarks[idx].x * WIDTH, landmarks[idx].y * HEIGHT)
-
-            xi, yi = get_point(RIGHT_IRIS_CENTER)
-
-            # --- CLICK LOGIC ---
-            l_top = get_point(LEFT_EYE_LIDS[0])
-            l_bot = get_point(LEFT_EYE_LIDS[1])
-            left_dist = abs(l_top[1] - l_bot[1])
-
-            r_top = get_point(RIGHT_EYE_LIDS[0])
-            r_bot = get_point(RIGHT_EYE_LIDS[1])
-            right_dist = abs(r_top[1] - r_bot[1])
-
-            if click_cooldown > 0: click_cooldown -= 1
-            
-            if left_dist < BLINK_THRESHOLD and right_dist > BLINK_THRESHOLD and click_cooldown == 0:
-                device.emit(uinput.BTN_LEFT, 1)
-                device.emit(uinput.BTN_LEFT, 0)
-                show_click_msg = 10
-                click_cooldown = 15
-
-            # --- CALIBRATION ---
-            if not calibrated:
-                center_x, center_y = WIDTH // 2, HEIGHT // 2
-                cv2.circle(frame, (center_x, center_y), 15, CALIBRATION_COLOR, -1)
-                cv2.circle(frame, (int(xi), int(yi)), 4, (0, 255, 0), -1) 
-                
-                if key == ord(' '):
-                    xs = xi
-                    ys = yi
-                    calibrated = True
-            
-            # --- ABSOLUTE MAPPING ---
-            else:
-                # 1. Move Cursor First
-                r1x = xs - ROI_X_OFFSET
-                r2x = xs + ROI_X_OFFSET
-                r1y = ys - ROI_Y_OFFSET
-                r2y = ys + ROI_Y_OFFSET
-
-                denom_x = (r2x - r1x)
-                denom_y = (r2y - r1y)
-                if denom_x == 0: denom_x = 0.001
-                if denom_y == 0: denom_y = 0.001
-
-                target_cursor_x = SCREEN_W - ((r2x - xi) * (SCREEN_W / denom_x))
-                target_cursor_y = SCREEN_H - ((r2y - yi) * (SCREEN_H / denom_y))
-
-                final_x = max(0, min(target_cursor_x, SCREEN_W))
-                final_y = max(0, min(target_cursor_y, SCREEN_H))
-
-                real_x, real_y = pyautogui.position()
-                diff_x = int(final_x - real_x)
-                diff_y = int(final_y - real_y)
-
-                if diff_x != 0 or diff_y != 0:
-                    device.emit(uinput.REL_X, diff_x)
-                    device.emit(uinput.REL_Y, diff_y)
-
-                # 2. HIGHLIGHT ACTIVE CELL
-                # Create a transparent overlay
-                overlay = frame.copy()
-                
-                # Determine which cell the cursor is in (0, 1, or 2)
-                col_idx = int(final_x / (SCREEN_W / 3))
-                row_idx = int(final_y / (SCREEN_H / 3))
-                
-                # Clamp index to 0-2 (handle edge case where cursor is at max screen pixel)
-                col_idx = min(2, max(0, col_idx))
-                row_idx = min(2, max(0, row_idx))
-
-                # Calculate coordinates on Camera Frame
-                cam_cell_w = WIDTH // 3
-                cam_cell_h = HEIGHT // 3
-                
-                x1 = col_idx * cam_cell_w
-                y1 = row_idx * cam_cell_h
-                x2 = x1 + cam_cell_w
-                y2 = y1 + cam_cell_h
-
-                # Draw filled Red Rectangle on overlay
-                cv2.rectangle(overlay, (x1, y1), (x2, y2), HIGHLIGHT_COLOR, -1)
-
-                # Blend overlay with original frame (0.3 = 30% opacity)
-                cv2.addWeighted(overlay, 0.3, frame, 0.7, 0, frame)
-
-                # 3. DRAW GRID LINES ON TOP
-                col_1, col_2 = WIDTH // 3, (WIDTH // 3) * 2
-                row_1, row_2 = HEIGHT // 3, (HEIGHT // 3) * 2
-                cv2.line(frame, (col_1, 0), (col_1, HEIGHT), GRID_COLOR, 2)
-                cv2.line(frame, (col_2, 0), (col_2, HEIGHT), GRID_COLOR, 2)
-                cv2.line(frame, (0, row_1), (WIDTH, row_1), GRID_COLOR, 2)
-                cv2.line(frame, (0, row_2), (WIDTH, row_2), GRID_COLOR, 2)
-
-                # Draw ROI Box & Cursor Circle
-                cv2.rectangle(frame, (int(r1x), int(r1y)), (int(r2x), int(r2y)), ROI_COLOR, 1)
-                cv2.circle(frame, (int(xi), int(yi)), 2, (0, 255, 0), -1) 
-                
-                cam_cursor_x = int((final_x / SCREEN_W) * WIDTH)
-                cam_cursor_y = int((final_y / SCREEN_H) * HEIGHT)
-                cv2.circle(frame, (cam_cursor_x, cam_cursor_y), 20, SKY_BLUE, 3)
-                
-                text_info = f"Box: {ROI_X_OFFSET:.1f}x{ROI_Y_OFFSET:.1f}"
-                cv2.putText(frame, text_info, (30, 50), cv2.FONT_HERSHEY_SIMPLEX, 0.7, ROI_COLOR, 2)
-
-            if show_click_msg > 0:
-                cv2.putText(frame, "CLICK!", (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 2.0, CLICK_MSG_COLOR, 5)
-                show_click_msg -= 1
-
-# --- END OF LOOP DISPLAY (MINI-VIEW MODE) ---
-        # 1. Resize to a small "Corner" view (e.g., 320x180)
-        # We use the aspect ratio of the camera
-        mini_w, mini_h = 320, 180
-        display_frame = cv2.resize(frame, (mini_w, mini_h))
-        
-        # 2. Show the window
-        cv2.imshow(WINDOW_NAME, display_frame)
-        
-        # 3. Move window to Top-Right Corner (so it doesn't block the keyboard)
-        # (Screen Width - Window Width, 0)
-        cv2.moveWindow(WINDOW_NAME, SCREEN_W - mini_w, 0)
-        
+        handle_key(key, view)
         if key == ord('q'): break
+        if new_view is None:
+            continue
+        view = new_view
+
+        if view["clicks"] != seen_clicks:
+            seen_clicks = view["clicks"]
+            show_click_msg = 10
+
+        views_seen += 1
+        if views_seen % PREVIEW_EVERY:
+            continue
+
+        # Mirrored BGR straight at preview size, in a buffer only the preview draws on
+        _, _, frame = camera.read_preview((PREVIEW_W, PREVIEW_H))
+        if frame is None:
+            continue
+
+        draw_overlay(frame, view)
+
+        if show_click_msg > 0:
+            cv2.putText(frame, "CLICK!", (12, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.8, CLICK_MSG_COLOR, 2)
+            show_click_msg -= PREVIEW_EVERY
+
+        cv2.imshow(WINDOW_NAME, frame)
+        preview_rate.tick()
+        latency.record("capture_to_preview", view["capture_time"])
 
 except KeyboardInterrupt:
     pass
 finally:
+    stop_event.set()
+    gaze_slot.close()
+    preview_slot.close()
+    # Keep the eye open/closed levels learned this session
+    cursor_stage.join(timeout=1.0)
+    save_tracker_profile()
+    print(f"Frames processed: {camera.frames_delivered}, dropped: {camera.frames_dropped}")
+    print(f"Stages: inference {inference_stage.count}, cursor {cursor_stage.count}, preview {preview_rate.count} "
+          f"(cursor skipped {gaze_slot.overwritten}, preview skipped {preview_slot.overwritten}, "
+          f"torn {camera.frames_torn})")
+    print(f"{landmark_backend.name}: {landmark_backend.calls} calls, avg {landmark_backend.avg_ms:.1f} ms")
+    if eye_backend is not None:
+        print(f"{eye_backend.name}: {eye_backend.calls} calls, avg {eye_backend.avg_ms:.1f} ms")
+    for stage, p in latency.summary().items():
+        print(f"  {stage:<20} p50 {p['p50']:7.2f}  p95 {p['p95']:7.2f}  p99 {p['p99']:7.2f} ms")
+    latency.dump()
+    if recorder is not None:
+        record_stage.join(timeout=1.0)
+        recorder.close()
+        print(f"Recorded {recorder.frames_written} frames to {recorder.path} "
+              f"({recorder.bytes_written / 1e6:.1f} MB, skipped {recorder_skipped})")
     camera.stop()
+    if cell_publisher is not None:
+        cell_publisher.close()
+    if events is not None:
+        events.close()
     cv2.destroyAllWindows()
@@ -0,0 +1,77 @@
+# --- SELECTION MODES ---
+# "wink": one-eyed wink clicks (old behaviour)
+# "dwell": look at a cell for DWELL_TIME seconds to click it
+SELECT_WINK = "wink"
+SELECT_DWELL = "dwell"
+
+DEFAULT_DWELL_TIME = 1.2     # seconds
+DEFAULT_HYSTERESIS = 0.15    # fraction of a cell the gaze must cross past a border to switch cells
+
+
+class DwellSelector:
+    """
+    Tracks which grid cell (row * cols + col) the cursor is in and fires once
+    the gaze has stayed there for dwell_time. The current cell is kept until
+    the cursor is `hysteresis` of a cell past its border, so jitter along a
+    border neither flips the highlight nor restarts the timer. After a click the
+    timer starts over: staying on the cell clicks it again after another dwell_time.
+    `confidence` says how far inside the cell the cursor is (1 = centre, 0 = border).
+    """
+
+    def __init__(self, screen_w, screen_h, cols=3, rows=3,
+                 dwell_time=DEFAULT_DWELL_TIME, hysteresis=DEFAULT_HYSTERESIS):
+        self.cols = cols
+        self.rows = rows
+        self.cell_w = screen_w / cols
+        self.cell_h = screen_h / rows
+        self.dwell_time = dwell_time
+        self.hysteresis = hysteresis
+        # Cells that may fire (e.g. not the keyboard's textbox); None = all
+        self.active_cells = None
+        self.reset()
+
+    def reset(self):
+        self.cell = None
+        self.progress = 0.0
+        self.confidence = 0.0
+        self._enter_t = 0.0
+
+    def _cell_at(self, x, y):
+        col = min(self.cols - 1, max(0, int(x / self.cell_w)))
+        row = min(self.rows - 1, max(0, int(y / self.cell_h)))
+        return row * self.cols + col
+
+    def _inside_current(self, x, y):
+        row, col = divmod(self.cell, self.cols)
+        mx = self.hysteresis * self.cell_w
+        my = self.hysteresis * self.cell_h
+        return (col * self.cell_w - mx <= x < (col + 1) * self.cell_w + mx
+                and row * self.cell_h - my <= y < (row + 1) * self.cell_h + my)
+
+    def cell_center(self, cell):
+        row, col = divmod(cell, self.cols)
+        return (col + 0.5) * self.cell_w, (row + 0.5) * self.cell_h
+
+    def _depth(self, x, y):
+        """1 at the centre of the current cell, 0 on (or past) its border."""
+        cx, cy = self.cell_center(self.cell)
+        edge = max(abs(x - cx) / (self.cell_w / 2), abs(y - cy) / (self.cell_h / 2))
+        return max(0.0, 1.0 - edge)
+
+    def update(self, x, y, t):
+        """Feed one cursor position (screen pixels) at time t. Returns True when a click fires."""
+        if self.cell is None or not self._inside_current(x, y):
+            self.cell = self._cell_at(x, y)
+            self._enter_t = t
+            self.progress = 0.0
+            self.confidence = self._depth(x, y)
+            return False
+
+        self.confidence = self._depth(x, y)
+        self.progress = min(1.0, (t - self._enter_t) / self.dwell_time)
+        if self.progress < 1.0:
+            return False
+        self._enter_t = t
+        self.progress = 0.0
+        active = self.active_cells
+        return active is None or self.cell in active
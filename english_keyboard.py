@@ -1,5 +1,5 @@
-import pygame
 from core_ui import *
+from keyboard_engine import Keyboard
 from speech_engine import speak_text
 
 # ----------------- Layout Data -----------------
@@ -70,134 +70,42 @@ pdm_messages = {
 placeholders = {"CL", "HA", "AboutUs", "WCC"}
 POSITIONS = [(0, 0), (0, 1), (0, 2), (2, 0), (2, 1), (2, 2)]
 
-# ----------------- Helpers -----------------
-def make_spread_from_items(items):
-    spread = {}
-    for i, pos in enumerate(POSITIONS):
-        spread[pos] = items[i] if i < len(items) else ""
-    return spread
-
-def open_spread_from_alpha_cell(r, c):
-    items = alpha_buttons[(r, c)].replace("\n\n", " ").split()
-    return make_spread_from_items(items)
-
-def open_spread_from_nums_cell(r, c):
-    items = nums_buttons[(r, c)].replace("\n\n", " ").split()
-    return make_spread_from_items(items)
-
-def open_spread_from_pdm_category(category_name):
-    items = pdm_messages.get(category_name, [])
-    return make_spread_from_items(items)
-
-def handle_click_label(label, text):
-    if not label: return text
-    if label in placeholders: return text
-    if label == "|__|": return text + " "
-    if label == "<--": return text[:-1]
-    if label == "Clear": return ""
-    return text + label
-
-def handle_language_select_click(pos, btn_rects, layout):
-    for (r, c), rect in btn_rects.items():
-        if rect.collidepoint(pos):
-            choice = layout.get((r, c), "")
-            if choice == "ENGLISH":
-                return "SWITCH_ENGLISH"
-            elif choice == "GUJARATI":
-                return "SWITCH_GUJARATI"
-            elif choice == "HINDI":
-                return "SWITCH_HINDI"
-    return None
-
-# ----------------- Event Handlers -----------------
-def handle_main_click(pos, btn_rects, text):
-    for (r, c), rect in btn_rects.items():
-        if rect.collidepoint(pos):
-            if (r, c) == (1, 2):  # Speak button
-                speak_text(text, language="ENGLISH")
-                return "main", {}
-            if (r, c) in alpha_buttons:
-                return "spread_alpha", open_spread_from_alpha_cell(r, c)
-    return "main", {}
-
-def handle_spread_alpha_click(pos, btn_rects, textbox_rect, spread, text):
-    for (r, c), rect in btn_rects.items():
-        if rect.collidepoint(pos):
-            lbl = spread.get((r, c), "")
-            if lbl == "Nums": return "nums", {}, text
-            if lbl == "PDM": return "pdm_categories", {}, text
-            if lbl == "LANGUAGE": return "language_select", LANGUAGE_SELECTION_LAYOUT_ENGLISH, ""
-            if lbl: text = handle_click_label(lbl, text)
-            return "main", {}, text
-    if textbox_rect.collidepoint(pos): return "main", {}, text
-    return "spread_alpha", spread, text
-
-def handle_nums_click(pos, btn_rects):
-    for (r, c), rect in btn_rects.items():
-        if rect.collidepoint(pos):
-            if (r, c) == (2, 2): return "main", {}
-            if (r, c) in nums_buttons: return "spread_nums", open_spread_from_nums_cell(r, c)
-    return "nums", {}
-
-def handle_spread_nums_click(pos, btn_rects, textbox_rect, spread, text):
-    for (r, c), rect in btn_rects.items():
-        if rect.collidepoint(pos):
-            lbl = spread.get((r, c), "")
-            if lbl: text = handle_click_label(lbl, text)
-            return "main", {}, text
-    if textbox_rect.collidepoint(pos): return "main", {}, text
-    return "spread_nums", spread, text
+# ----------------- Keyboard definition -----------------
+# States and transitions, compiled once by keyboard_engine (see there for the verbs)
+TEXT_KEYS = {"|__|": "space main", "<--": "backspace main", "Clear": "clear main",
+             **{p: "goto main" for p in placeholders}}
+
+KEYBOARD_ENGLISH = {
+    "start": "main",
+    "textbox_cells": [(1, 0), (1, 1)],
+    "spread_positions": POSITIONS,
+    "phrases": pdm_messages,
+    "screens": {
+        "main": {"cells": alpha_buttons, "on": "open spread_alpha", "fixed": {(1, 2): "speak"}},
+        "spread_alpha": {"on": "type main", "empty": "goto main", "textbox": "goto main",
+                         "special": {"Nums": "goto nums", "PDM": "goto pdm_categories",
+                                     "LANGUAGE": "goto language_select", **TEXT_KEYS}},
+        "nums": {"cells": nums_buttons, "on": "open spread_nums", "special": {"Back": "goto main"}},
+        "spread_nums": {"on": "type main", "empty": "goto main", "textbox": "goto main", "special": TEXT_KEYS},
+        "pdm_categories": {"cells": pdm_categories, "on": "phrases pdm_messages"},
+        "pdm_messages": {"on": "word main", "empty": "goto main", "textbox": "goto main"},
+        "language_select": {"cells": LANGUAGE_SELECTION_LAYOUT_ENGLISH, "on": "switch"},
+    },
+}
+keyboard = Keyboard(KEYBOARD_ENGLISH)
 
-def handle_pdm_categories_click(pos, btn_rects):
-    for (r, c), rect in btn_rects.items():
-        if rect.collidepoint(pos):
-            cat = pdm_categories.get((r, c), "")
-            if cat: return "pdm_messages", open_spread_from_pdm_category(cat)
-    return "pdm_categories", {}
+# ----------------- MAIN LOOP -----------------
+def preload_english(w, h):
+    preload_buttons(w, h, keyboard.layouts(keyboard.static_kinds() + ["pdm_messages"]))
 
-def handle_pdm_messages_click(pos, btn_rects, textbox_rect, spread, text):
-    for (r, c), rect in btn_rects.items():
-        if rect.collidepoint(pos):
-            lbl = spread.get((r, c), "")
-            if lbl: text += lbl + " "
-            return "main", {}, text
-    if textbox_rect.collidepoint(pos): return "main", {}, text
-    return "pdm_messages", spread, text
+def language_keyboard(w, h, preload=True):
+    # preload=False: labels are rendered as they are first shown, preload_english() can follow later
+    if preload:
+        preload_english(w, h)
+    return LanguageKeyboard(keyboard, draw_buttons, button_rects(w, h),
+                            lambda text: speak_text(text, language="ENGLISH"), None, False)
 
-# ----------------- MAIN LOOP -----------------
 def main():
     w, h = init_pygame_and_get_screen_size()
     screen = create_window(w, h)
-    text, state, spread = "", "main", {}
-    running = True
-
-    while running:
-        screen.fill(BLACK)
-        draw_grid(screen, w, h)
-
-        # Decide what to draw
-        if state == "main": layout = alpha_buttons
-        elif state == "nums": layout = nums_buttons
-        elif state == "pdm_categories": layout = pdm_categories
-        else: layout = spread
-
-        btn_rects = draw_buttons(screen, w, h, layout)
-        textbox_rect = draw_textbox(screen, w, h, text)
-        pygame.display.update()
-
-        for e in pygame.event.get():
-            if e.type == pygame.QUIT or (e.type == pygame.KEYDOWN and e.key == pygame.K_ESCAPE):
-                running = False
-            if e.type == pygame.MOUSEBUTTONDOWN:
-                pos = pygame.mouse.get_pos()
-                if state == "main": state, spread = handle_main_click(pos, btn_rects, text)
-                elif state == "spread_alpha": state, spread, text = handle_spread_alpha_click(pos, btn_rects, textbox_rect, spread, text)
-                elif state == "nums": state, spread = handle_nums_click(pos, btn_rects)
-                elif state == "spread_nums": state, spread, text = handle_spread_nums_click(pos, btn_rects, textbox_rect, spread, text)
-                elif state == "pdm_categories": state, spread = handle_pdm_categories_click(pos, btn_rects)
-                elif state == "pdm_messages": state, spread, text = handle_pdm_messages_click(pos, btn_rects, textbox_rect, spread, text)
-                elif state == "language_select":
-                    choice = handle_language_select_click(pos, btn_rects, layout)
-                    return choice
-
-    pygame.quit()
+    return run_keyboards(screen, w, h, {"ENGLISH": language_keyboard(w, h)}, "ENGLISH")
@@ -0,0 +1,127 @@
+import math
+import numpy as np
+
+# --- FILTERS ---
+# Both work on an (x, y) pair at once and take the frame's capture timestamp
+# (seconds), so they behave the same whatever the real frame rate is.
+FILTER_NONE = "none"
+FILTER_ONE_EURO = "one_euro"
+FILTER_KALMAN = "kalman"
+
+# Defaults for a 1280x720 iris position; tune per user
+ONE_EURO_DEFAULTS = {"min_cutoff": 1.0, "beta": 0.05, "d_cutoff": 1.0}
+KALMAN_DEFAULTS = {"process_noise": 100.0, "measurement_noise": 1.0, "saccade_gate": 3.0, "saccade_boost": 50.0}
+
+
+class PassThroughFilter:
+    def __call__(self, point, t):
+        return np.asarray(point, dtype=np.float64)
+
+    def reset(self):
+        pass
+
+
+class OneEuroFilter:
+    """
+    One Euro filter (Casiez et al.): a low-pass whose cutoff rises with speed,
+    so fixations are smoothed hard while saccades pass with little lag.
+    """
+
+    def __init__(self, min_cutoff=1.0, beta=0.05, d_cutoff=1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self._x = None
+        self._dx = np.zeros(2)
+        self._t = None
+
+    @staticmethod
+    def _alpha(dt, cutoff):
+        # cutoff may be a scalar or a per-axis array
+        return 1.0 / (1.0 + 1.0 / (2.0 * math.pi * cutoff * dt))
+
+    def __call__(self, point, t):
+        x = np.asarray(point, dtype=np.float64)
+        if self._x is None:
+            self._x = x.copy()
+            self._t = t
+            return self._x.copy()
+
+        dt = t - self._t
+        if dt <= 0:
+            return self._x.copy()
+        self._t = t
+
+        a_d = self._alpha(dt, self.d_cutoff)
+        self._dx = a_d * (x - self._x) / dt + (1.0 - a_d) * self._dx
+
+        a = self._alpha(dt, self.min_cutoff + self.beta * np.abs(self._dx))
+        self._x = a * x + (1.0 - a) * self._x
+        return self._x.copy()
+
+
+class KalmanFilter:
+    """
+    Constant-velocity Kalman filter on both axes. The axes share one model, so
+    they share one 2x2 covariance and only the state is per axis. When the
+    innovation leaves the saccade gate, the process noise is boosted for that
+    step so the estimate jumps to the new fixation instead of lagging behind.
+    """
+
+    def __init__(self, process_noise=100.0, measurement_noise=1.0, saccade_gate=3.0, saccade_boost=50.0):
+        self.q = process_noise
+        self.r = measurement_noise
+        self.gate = saccade_gate
+        self.boost = saccade_boost
+        self.reset()
+
+    def reset(self):
+        self._p = None            # position, per axis
+        self._v = np.zeros(2)     # velocity, per axis
+        self._cov = np.eye(2) * self.r
+        self._t = None
+
+    def __call__(self, point, t):
+        z = np.asarray(point, dtype=np.float64)
+        if self._p is None:
+            self._p = z.copy()
+            self._t = t
+            return self._p.copy()
+
+        dt = t - self._t
+        if dt <= 0:
+            return self._p.copy()
+        self._t = t
+
+        # Predict
+        self._p = self._p + self._v * dt
+        f = np.array([[1.0, dt], [0.0, 1.0]])
+        q = self.q * np.array([[dt ** 3 / 3.0, dt ** 2 / 2.0], [dt ** 2 / 2.0, dt]])
+        cov = f @ self._cov @ f.T + q
+
+        # Saccade: innovation far outside what the model expects -> trust the measurement
+        y = z - self._p
+        s = cov[0, 0] + self.r
+        if np.max(y * y) > self.gate ** 2 * s:
+            cov = cov + q * self.boost
+            s = cov[0, 0] + self.r
+
+        # Update (H = [1, 0])
+        k = cov[:, 0] / s
+        self._p = self._p + k[0] * y
+        self._v = self._v + k[1] * y
+        self._cov = cov - np.outer(k, cov[0, :])
+        return self._p.copy()
+
+
+def create_gaze_filter(name=FILTER_ONE_EURO, **params):
+    if name in (None, FILTER_NONE):
+        return PassThroughFilter()
+    if name == FILTER_ONE_EURO:
+        return OneEuroFilter(**{**ONE_EURO_DEFAULTS, **params})
+    if name == FILTER_KALMAN:
+        return KalmanFilter(**{**KALMAN_DEFAULTS, **params})
+    raise ValueError(f"Unknown gaze filter: {name}")
@@ -0,0 +1,338 @@
+import json
+import mmap
+import os
+import selectors
+import socket
+import struct
+import threading
+import time
+from collections import namedtuple
+
+# --- TRACKER OUTPUT MODES ---
+# "pointer": move the system pointer through uinput, the keyboard hit-tests it (old behaviour)
+# "cell":    publish which 3x3 cell is looked at; no pointer traffic at all, the
+#            keyboard reads the cell straight from shared memory
+OUTPUT_POINTER = "pointer"
+OUTPUT_CELL = "cell"
+
+GAZE_SHM_PATH = "/dev/shm/als_gaze_cell"
+NO_CELL = -1
+STALE_AFTER = 1.0      # seconds without an update before the reader ignores the tracker
+REOPEN_EVERY = 1.0     # how often a reader retries a missing or stale file
+
+# Seqlock header (odd while the tracker is writing), then the cell state:
+# cell, confidence, dwell progress, publish time (CLOCK_MONOTONIC, shared by all
+# processes), number of selections so far, cell of the last selection
+_SEQ = struct.Struct("<I")
+_STATE = struct.Struct("<iffdii")
+_SIZE = _SEQ.size + _STATE.size
+
+GazeCell = namedtuple("GazeCell", "cell confidence progress time selections selected_cell")
+
+# --- EVENT CHANNEL ---
+# Discrete, ordered events both ways over a SOCK_SEQPACKET Unix socket (one JSON
+# object per packet). The shared page above stays the place for the latest cell;
+# the channel is for things that must not be missed. Abstract namespace: no file.
+EVENT_SOCKET = "\0als_gaze_events"
+MAX_PACKET = 65536
+RECONNECT_EVERY = 1.0
+
+# Tracker -> keyboard. Every message has "sent"; frame-driven ones also "t", the
+# capture time of the frame (CLOCK_MONOTONIC, same clock in both processes).
+MSG_GAZE = "gaze"                       # every frame, only if asked for: t, x, y, cell
+MSG_CELL = "cell"                       # looked-at cell changed: t, cell, confidence
+MSG_CLICK = "click"                     # selection: t, cell
+MSG_TRACKING_LOST = "tracking_lost"     # t
+MSG_TRACKING_FOUND = "tracking_found"   # t
+MSG_CALIBRATION = "calibration"         # active
+# Keyboard -> tracker
+MSG_READY = "ready"                     # samples: also send MSG_GAZE
+MSG_LAYOUT = "layout"                   # active: selectable cells
+MSG_RECALIBRATE = "recalibrate"
+
+
+class CellPublisher:
+    """Tracker side. Every write is a few bytes into a mapped page: no syscalls per frame."""
+
+    def __init__(self, path=GAZE_SHM_PATH):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, _SIZE)
+            self._map = mmap.mmap(fd, _SIZE)
+        finally:
+            os.close(fd)
+        self._seq = 0
+        self.cell = NO_CELL
+        self.confidence = 0.0
+        self.progress = 0.0
+        self.selections = 0
+        self.selected_cell = NO_CELL
+        self._write()
+
+    def _write(self):
+        self._seq += 1
+        _SEQ.pack_into(self._map, 0, self._seq)
+        _STATE.pack_into(self._map, _SEQ.size, self.cell, self.confidence, self.progress, time.monotonic(),
+                         self.selections, self.selected_cell)
+        self._seq += 1
+        _SEQ.pack_into(self._map, 0, self._seq)
+
+    def update(self, cell, confidence, progress=0.0):
+        self.cell = NO_CELL if cell is None else cell
+        self.confidence = confidence
+        self.progress = progress
+        self._write()
+
+    def select(self, cell):
+        self.selections += 1
+        self.selected_cell = cell
+        self._write()
+
+    def close(self):
+        self.update(None, 0.0)
+        self._map.close()
+
+
+class CellReader:
+    """Keyboard side. Works whether or not the tracker is running, or restarts."""
+
+    def __init__(self, path=GAZE_SHM_PATH):
+        self.path = path
+        self._map = None
+        self._next_open = 0.0
+        self._seen_selections = None
+
+    @property
+    def attached(self):
+        """True while a tracker's page is mapped (it published within STALE_AFTER)."""
+        return self._map is not None
+
+    def _open(self):
+        now = time.monotonic()
+        if now < self._next_open:
+            return False
+        self._next_open = now + REOPEN_EVERY
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            return False
+        try:
+            self._map = mmap.mmap(fd, _SIZE, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        finally:
+            os.close(fd)
+        return True
+
+    def read(self):
+        """Latest GazeCell, or None when no tracker is publishing."""
+        if self._map is None and not self._open():
+            return None
+        for _ in range(10):
+            seq = _SEQ.unpack_from(self._map, 0)[0]
+            if seq & 1:
+                continue
+            state = GazeCell(*_STATE.unpack_from(self._map, _SEQ.size))
+            if _SEQ.unpack_from(self._map, 0)[0] == seq:
+                break
+        else:
+            return None
+
+        if time.monotonic() - state.time > STALE_AFTER:
+            # Tracker gone: drop the map so a restarted tracker's file is picked up
+            self._map.close()
+            self._map = None
+            self._seen_selections = None
+            return None
+        return state
+
+    def new_selection(self):
+        """Cell selected since the last call, or None."""
+        state = self.read()
+        if state is None:
+            return None
+        if self._seen_selections is None:
+            # Do not replay selections made before we started listening
+            self._seen_selections = state.selections
+        if state.selections == self._seen_selections:
+            return None
+        self._seen_selections = state.selections
+        return state.selected_cell if state.selected_cell != NO_CELL else None
+
+
+def _packet(msg_type, fields):
+    return json.dumps({"type": msg_type, "sent": time.monotonic(), **fields}).encode()
+
+
+class EventServer:
+    """
+    Tracker side. Accepts any number of keyboards; their messages go to
+    on_message(msg) on the server thread. send() never blocks: a client whose
+    buffer is full loses gaze samples, and is dropped if it cannot take an event.
+    """
+
+    def __init__(self, on_message, path=EVENT_SOCKET):
+        self.on_message = on_message
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.sock.bind(path)
+        self.sock.listen(4)
+        self.lock = threading.Lock()
+        self.clients = {}          # socket -> wants MSG_GAZE
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        sel = selectors.DefaultSelector()
+        sel.register(self.sock, selectors.EVENT_READ)
+        while self.running:
+            for key, _ in sel.select(timeout=0.5):
+                if key.fileobj is self.sock:
+                    try:
+                        client, _ = self.sock.accept()
+                    except OSError:
+                        continue
+                    client.setblocking(False)
+                    with self.lock:
+                        self.clients[client] = False
+                    sel.register(client, selectors.EVENT_READ)
+                    continue
+
+                client = key.fileobj
+                try:
+                    data = client.recv(MAX_PACKET)
+                except OSError:
+                    data = b""
+                if not data:
+                    sel.unregister(client)
+                    self._drop(client)
+                    continue
+                try:
+                    msg = json.loads(data)
+                except ValueError:
+                    continue
+                if not isinstance(msg, dict):
+                    continue
+                if msg.get("type") == MSG_READY:
+                    with self.lock:
+                        if client in self.clients:
+                            self.clients[client] = bool(msg.get("samples"))
+                # A bad message must not take the channel down with it
+                try:
+                    self.on_message(msg)
+                except Exception as e:
+                    print(f"⚠️ Event channel message {msg.get('type')!r} failed: {e}")
+        sel.close()
+
+    def _drop(self, client):
+        # Server thread only: the socket is registered with its selector
+        with self.lock:
+            self.clients.pop(client, None)
+        client.close()
+
+    def _hang_up(self, client):
+        # Any thread: stop sending, and let the server thread see EOF and clean up
+        with self.lock:
+            self.clients.pop(client, None)
+        try:
+            client.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def send(self, msg_type, **fields):
+        with self.lock:
+            clients = list(self.clients.items())
+        if not clients:
+            return
+        packet = _packet(msg_type, fields)
+        for client, samples in clients:
+            if msg_type == MSG_GAZE and not samples:
+                continue
+            try:
+                client.send(packet)
+            except BlockingIOError:
+                if msg_type != MSG_GAZE:
+                    self._hang_up(client)
+            except OSError:
+                self._hang_up(client)
+
+    def close(self):
+        self.running = False
+        self.thread.join(timeout=1.0)
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            self._drop(client)
+        self.sock.close()
+
+
+class EventClient:
+    """
+    Keyboard side. Connects (and reconnects) on its own whenever the tracker is
+    up; poll() never blocks. The last layout is sent again after a reconnect.
+    """
+
+    def __init__(self, path=EVENT_SOCKET, samples=False):
+        self.path = path
+        self.samples = samples
+        self.sock = None
+        self.layout = None
+        self._next_connect = 0.0
+
+    @property
+    def connected(self):
+        return self.sock is not None
+
+    def _connect(self):
+        now = time.monotonic()
+        if now < self._next_connect:
+            return False
+        self._next_connect = now + RECONNECT_EVERY
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            return False
+        sock.setblocking(False)
+        self.sock = sock
+        self.send(MSG_READY, samples=self.samples)
+        if self.layout is not None:
+            self.send(MSG_LAYOUT, **self.layout)
+        return self.sock is not None
+
+    def _disconnect(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def send(self, msg_type, **fields):
+        if msg_type == MSG_LAYOUT:
+            self.layout = fields
+        if self.sock is None:
+            return
+        try:
+            self.sock.send(_packet(msg_type, fields))
+        except OSError:
+            self._disconnect()
+
+    def poll(self):
+        """All messages received since the last call (may be empty)."""
+        if self.sock is None and not self._connect():
+            return []
+        messages = []
+        while True:
+            try:
+                data = self.sock.recv(MAX_PACKET)
+            except BlockingIOError:
+                break
+            except OSError:
+                data = b""
+            if not data:
+                self._disconnect()
+                break
+            try:
+                messages.append(json.loads(data))
+            except ValueError:
+                continue
+        return messages
@@ -2,16 +2,22 @@
 import os
 import pygame
 import pygame.freetype
-from core_ui import draw_grid, draw_textbox, create_window, init_pygame_and_get_screen_size, BLACK, WHITE, PURPLE, GREEN, TEXT_COLOR
+from core_ui import create_window, init_pygame_and_get_screen_size, WHITE, PURPLE, GREEN, \
+    LanguageKeyboard, run_keyboards, label_cache, get_font
+from label_cache import LabelStyle
+from keyboard_engine import Keyboard
 from speech_engine import speak_text
 
-# Init freetype
-pygame.init()
-pygame.freetype.init()
-
-# Load Gujarati freetype font
+# Gujarati freetype font, loaded when the keyboard is first shown (see language_keyboard)
 FONT_PATH_GUJARATI = os.path.join("assets", "fonts", "gujarati.ttf")
-gujarati_font = pygame.freetype.Font(FONT_PATH_GUJARATI, 40)
+gujarati_font = None
+
+def load_gujarati_font():
+    global gujarati_font
+    if gujarati_font is None:
+        pygame.freetype.init()
+        gujarati_font = pygame.freetype.Font(FONT_PATH_GUJARATI, 40)
+    return gujarati_font
 
 # The six positions (order used for spreads)
 POSITIONS = [(0, 0), (0, 1), (0, 2), (2, 0), (2, 1), (2, 2)]
@@ -111,337 +117,116 @@ PDM_MESSAGES_GUJARATI = {
     ]
 }
 
-# ----------------- Helpers -----------------
-def make_spread_from_string(s: str):
-    """
-    Convert a main-string or multi-line group string to an ordered spread dict:
-    POSITIONS -> token (string)
-    """
-    tokens = s.replace("\n\n", " ").split()
-    spread = {}
-    for i, pos in enumerate(POSITIONS):
-        spread[pos] = tokens[i] if i < len(tokens) else ""
-    return spread
-
-def make_spread_from_list(items):
-    """Takes a list of strings (even with spaces) -> maps each to one cell"""
-    spread = {}
-    for i, pos in enumerate(POSITIONS):
-        spread[pos] = items[i] if i < len(items) else ""
-    return spread
-
-def generate_maatra_groups(alpha: str):
-    """Return dict pos -> multi-line group-string for given alphabet alpha."""
-    groups = {}
-    for pos, template in MAATRA_GROUPS_TEMPLATE.items():
-        groups[pos] = template.format(a=alpha)
-    return groups
-
-# In draw_buttons_gujarati: keep speak button green always
-def draw_buttons_gujarati(screen, w, h, layout):
+# ----------------- Drawing -----------------
+# Labels are rendered once into core_ui.label_cache and blitted from there
+def draw_label_gujarati(surface, rect, label, color):
+    # Multiline text center
+    lines = label.split("\n")
+    line_rects = [gujarati_font.get_rect(line) for line in lines]
+    total_h = sum(rh.height for rh in line_rects)
+    y = rect.y + (rect.height - total_h) // 2
+
+    for i, line in enumerate(lines):
+        rct = line_rects[i]
+        x = rect.x + (rect.width - rct.width) // 2
+        gujarati_font.render_to(surface, (x, y), line, color)
+        y += rct.height
+
+def draw_speak_label(surface, rect, label, color):
+    surf = get_font(42, bold=True).render(label, True, color)
+    surface.blit(surf, surf.get_rect(center=rect.center))
+
+GUJARATI_LABELS = LabelStyle("gujarati-40", draw_label_gujarati, WHITE)
+SPEAK_LABEL = LabelStyle("speak-bold-42", draw_speak_label, WHITE)
+
+def button_rects_gujarati(w, h):
     cell_w, cell_h = w // 3, h // 3
     xm, ym = cell_w // 12, cell_h // 12
     btn_rects = {}
-
     for r in range(3):
         for c in range(3):
             if (r, c) in [(1, 0), (1, 1)]:
                 continue
+            btn_rects[(r, c)] = pygame.Rect(c * cell_w + xm, r * cell_h + ym, cell_w - 2 * xm, cell_h - 2 * ym)
+    return btn_rects
 
-            rect = pygame.Rect(c * cell_w + xm, r * cell_h + ym, cell_w - 2 * xm, cell_h - 2 * ym)
-            btn_rects[(r, c)] = rect
-
-            # Speak button stays green always
-            if (r, c) == (1, 2):
-                color = GREEN
-                pygame.draw.rect(screen, color, rect, border_radius=6)
-                sys_font = pygame.font.SysFont(None, 42, bold=True)
-                surf = sys_font.render("Speak", True, WHITE)
-                screen.blit(surf, surf.get_rect(center=rect.center))
-                continue
-
-            # Purple for all other cells
-            pygame.draw.rect(screen, PURPLE, rect, border_radius=6)
-            label = layout.get((r, c), "")
-            if not label:
-                continue
+# In draw_buttons_gujarati: keep speak button green always
+def draw_buttons_gujarati(screen, w, h, layout):
+    btn_rects = button_rects_gujarati(w, h)
+    for (r, c), rect in btn_rects.items():
+        # Speak button stays green always
+        if (r, c) == (1, 2):
+            pygame.draw.rect(screen, GREEN, rect, border_radius=6)
+            label_cache.blit(screen, rect, SPEAK_LABEL, "Speak")
+            continue
+
+        # Purple for all other cells
+        pygame.draw.rect(screen, PURPLE, rect, border_radius=6)
+        label = layout.get((r, c), "")
+        if label:
+            label_cache.blit(screen, rect, GUJARATI_LABELS, label)
 
-            # Multiline text center
-            lines = label.split("\n")
-            line_rects = [gujarati_font.get_rect(line) for line in lines]
-            total_h = sum(rh.height for rh in line_rects)
-            y = rect.y + (rect.height - total_h) // 2
+    return btn_rects
 
-            for i, line in enumerate(lines):
-                rct = line_rects[i]
-                x = rect.x + (rect.width - rct.width) // 2
-                gujarati_font.render_to(screen, (x, y), line, WHITE)
-                y += rct.height
+def preload_gujarati(w, h):
+    # Static layouts (and the PDM phrases) up front; spreads and maatra groups
+    # are rendered on first use and kept LRU
+    size = button_rects_gujarati(w, h)[(1, 2)].size
+    label_cache.preload(SPEAK_LABEL, "Speak", size)
+    for layout in keyboard.layouts(keyboard.static_kinds() + ["pdm_messages"]):
+        for label in layout.values():
+            if label:
+                label_cache.preload(GUJARATI_LABELS, label, size)
+
+
+# ----------------- Keyboard definition -----------------
+# States and transitions, compiled once by keyboard_engine (see there for the verbs).
+# Speak works on every screen; a click on the textbox goes back to main.
+SPREAD_PICK = {"on": "type main", "empty": "goto main", "special": {"____": "goto main"}}
+
+KEYBOARD_GUJARATI = {
+    "start": "main",
+    "textbox_cells": [(1, 0), (1, 1)],
+    "spread_positions": POSITIONS,
+    "phrases": PDM_MESSAGES_GUJARATI,
+    "maatra": MAATRA_GROUPS_TEMPLATE,
+    "defaults": {"empty": "stay", "textbox": "goto main", "fixed": {(1, 2): "speak"}},
+    "screens": {
+        "main": {"cells": MAIN_BUTTONS_GUJARATI, "on": "open spread_alpha"},
+        # anything but the special keys is a consonant: on to its maatra groups
+        "spread_alpha": {"on": "maatra maatra_groups",
+                         "special": {"<--": "backspace main", "|__|": "space main", "PDM": "goto pdm_categories",
+                                     "Others": "goto others", "Nums": "goto nums", "Clear": "clear main"}},
+        "maatra_groups": {"on": "open maatra_spread", "empty": "goto main"},
+        "maatra_spread": SPREAD_PICK,
+        "pdm_categories": {"cells": PDM_CATEGORIES_GUJARATI, "on": "phrases pdm_messages"},
+        "pdm_messages": {"on": "phrase main", "empty": "goto main"},
+        "others": {"cells": OTHERS_BUTTONS_GUJARATI, "on": "goto main",
+                   "special": {"About us": "placeholder main", "HA": "placeholder main", "Nums": "goto nums",
+                               "સ્વર": "goto swar", "Clear": "clear main", "LANGUAGE": "goto language_select"}},
+        "nums": {"cells": NUMS_BUTTONS_GUJARATI, "on": "open nums_spread"},
+        "nums_spread": SPREAD_PICK,
+        "swar": {"cells": SWAR_BUTTONS_GUJARATI, "on": "open swar_spread"},
+        "swar_spread": SPREAD_PICK,
+        "language_select": {"cells": LANGUAGE_SELECTION_LAYOUT_GUJARATI, "on": "switch"},
+    },
+}
+keyboard = Keyboard(KEYBOARD_GUJARATI)
 
-    return btn_rects
 
+# ----------------- Main loop -----------------
+def language_keyboard(w, h, preload=True):
+    # preload=False: labels are rendered as they are first shown, preload_gujarati() can follow later
+    load_gujarati_font()
+    if preload:
+        preload_gujarati(w, h)
+    return LanguageKeyboard(keyboard, draw_buttons_gujarati, button_rects_gujarati(w, h),
+                            lambda text: speak_text(text, language="GUJARATI"), gujarati_font, True)
 
-# ----------------- Main loop & state machine -----------------
 def main():
     w, h = init_pygame_and_get_screen_size()
     screen = create_window(w, h)
-
-    text = ""
-    state = "main"  # main, spread_alpha, maatra_groups, maatra_spread, pdm_categories, pdm_messages
-    spread = {}
-    current_alphabet = ""
-    current_pdm_category = None
-
-    running = True
-    while running:
-        screen.fill(BLACK)
-        draw_grid(screen, w, h)
-
-        # choose layout for drawing
-        if state == "main":
-            layout = MAIN_BUTTONS_GUJARATI
-        elif state in ("spread_alpha", "maatra_spread"):
-            layout = spread
-        elif state == "maatra_groups":
-            layout = spread
-        elif state == "pdm_categories":
-            layout = PDM_CATEGORIES_GUJARATI
-        elif state == "pdm_messages" and current_pdm_category:
-            msgs = PDM_MESSAGES_GUJARATI.get(current_pdm_category, [])
-            layout = make_spread_from_list(msgs)
-        elif state == "others":
-            layout = OTHERS_BUTTONS_GUJARATI
-        elif state == "nums":
-            layout = spread
-        elif state == "swar":
-            layout = spread
-        elif state == "nums_spread":
-            layout = spread
-        elif state == "swar_spread":
-            layout = spread
-        elif state == "language_select":
-            layout = LANGUAGE_SELECTION_LAYOUT_GUJARATI
-
-        btn_rects = draw_buttons_gujarati(screen, w, h, layout)
-        # draw textbox using freetype font
-        textbox_rect = draw_textbox(screen, w, h, text, custom_font=gujarati_font, use_freetype=True)
-
-        pygame.display.update()
-
-        for ev in pygame.event.get():
-            if ev.type == pygame.QUIT or (ev.type == pygame.KEYDOWN and ev.key == pygame.K_ESCAPE):
-                running = False
-            if ev.type == pygame.MOUSEBUTTONDOWN:
-                pos = pygame.mouse.get_pos()
-
-                # QUICK: if user clicked speak button (only active green in main)
-                if (1, 2) in btn_rects and btn_rects[(1, 2)].collidepoint(pos):
-                    speak_text(text, language="GUJARATI")
-                    continue
-
-                # find which button was clicked
-                clicked = None
-                for key, rect in btn_rects.items():
-                    if rect.collidepoint(pos):
-                        clicked = key
-                        break
-                if clicked is None:
-                    # clicked outside buttons: if clicked textbox, clear it (old behaviour)
-                    if textbox_rect.collidepoint(pos):
-                        state = "main"
-                        spread = {}
-                    continue
-
-                r, c = clicked
-                # get the label shown at that moment
-                current_label = None
-                # layout may be PDM_CATEGORIES_GUJARATI (mapping) or spread (dict) or MAIN_BUTTONS_GUJARATI (dict)
-                if isinstance(layout, dict):
-                    # layout used by draw is dict keyed by positions; but for pdm_messages layout is also a dict (from make_spread_from_string)
-                    current_label = layout.get((r, c), "")
-
-                # ----------------- State logic -----------------
-                if state == "main":
-                    # clicking main cell => produce spread of its 6 items (may include special tokens like <-- or |__| or PDM/CL)
-                    main_str = MAIN_BUTTONS_GUJARATI.get((r, c), "")
-                    if not main_str:
-                        continue
-                    spread = make_spread_from_string(main_str)
-                    state = "spread_alpha"
-                    continue
-
-                elif state == "spread_alpha":
-                    chosen = spread.get((r, c), "")
-                    if not chosen:
-                        continue
-                    # handle special tokens immediately here
-                    if chosen == "<--":
-                        text = text[:-1]
-                        state = "main"
-                        spread = {}
-                        continue
-                    if chosen == "|__|":
-                        text += " "
-                        state = "main"
-                        spread = {}
-                        continue
-                    if chosen == "PDM":
-                        state = "pdm_categories"
-                        spread = {}
-                        current_pdm_category = None
-                        continue
-                    if chosen == "Others":
-                        state = "others"
-                        spread = {}
-                        continue
-                    if chosen == "Nums":
-                        spread = NUMS_BUTTONS_GUJARATI
-                        state = "nums"
-                        continue
-                    if chosen == "Clear":
-                        text = ""
-                        state = "main"
-                        spread = {}
-                        continue
-                    # otherwise it's a base alphabet -> open its maatra groups
-                    current_alphabet = chosen
-                    spread = generate_maatra_groups(chosen)
-                    state = "maatra_groups"
-                    continue
-
-                elif state == "maatra_groups":
-                    # clicked a group (multi-line string) -> generate final spread of maatras
-                    group_str = spread.get((r, c), "")
-                    if not group_str or group_str.strip().startswith("____"):
-                        # placeholder -> do nothing and go back to main (or stay)
-                        state = "main"
-                        spread = {}
-                        continue
-                    # make final spread from this group string
-                    spread = make_spread_from_string(group_str)
-                    state = "maatra_spread"
-                    continue
-
-                elif state == "maatra_spread":
-                    chosen = spread.get((r, c), "")
-                    if chosen and not chosen.startswith("____"):
-                        # append chosen maatra/cluster to textbox
-                        text += chosen
-                    # after selecting a maatra, always return to main
-                    state = "main"
-                    spread = {}
-                    current_alphabet = ""
-                    continue
-
-                elif state == "pdm_categories":
-                    cat = PDM_CATEGORIES_GUJARATI.get((r, c), "")
-                    if cat:
-                        current_pdm_category = cat
-                        state = "pdm_messages"
-                        # layout will be generated above in drawing step
-                    continue
-
-                elif state == "pdm_messages":
-                    chosen = layout.get((r, c), "")
-                    if chosen:
-                        # layout here is a dict produced by make_spread_from_string("  ".join(msgs))
-                        # but in drawing step we used that dict; chosen is a message token
-                        text += (" " + chosen) if text and not text.endswith(" ") else chosen
-                    # after selecting PDM message return to main
-                    state = "main"
-                    spread = {}
-                    current_pdm_category = None
-                    continue
-                elif state == "others":
-                    chosen = OTHERS_BUTTONS_GUJARATI.get((r, c), "")
-                    if not chosen:
-                        continue
-
-                    if chosen == "About us":
-                        print("About us clicked")  # placeholder
-
-                    elif chosen == "સ્વર":
-                        spread = SWAR_BUTTONS_GUJARATI
-                        state = "swar"
-                        continue
-
-                    elif chosen == "Nums":
-                        spread = NUMS_BUTTONS_GUJARATI
-                        state = "nums"
-                        continue
-
-                    elif chosen == "HA":
-                        print("HA clicked")         # placeholder
-
-                    elif chosen == "Clear":
-                        text = ""
-                        state = "main"
-                        spread = {}
-                        continue
-
-                    elif chosen == "LANGUAGE":
-                        text = ""  # clear textbox
-                        state = "language_select"
-                        spread = None  # no normal spread
-                        continue
-
-                    # After action, return to main unless Nums handled above
-                    state = "main"
-                    spread = {}
-                    continue
-
-                elif state == "nums":
-                    chosen = spread.get((r, c), "")
-                    if not chosen:
-                        continue
-
-                    # Spread the clicked NUMS cell's 6 items
-                    spread = make_spread_from_string(chosen)
-                    state = "nums_spread"  # new temporary state
-                    continue
-
-                elif state == "swar":
-                    chosen = spread.get((r, c), "")
-                    if not chosen:
-                        continue
-
-                    # Spread the clicked स्वर cell's 6 items
-                    spread = make_spread_from_string(chosen)
-                    state = "swar_spread"  # new temporary state
-                    continue
-
-                elif state == "nums_spread":
-                    chosen = spread.get((r, c), "")
-                    if chosen and not chosen.startswith("____"):
-                        text += chosen  # append the number or symbol to textbox
-                    # After picking one item, return to main keyboard
-                    spread = {}
-                    state = "main"
-                    continue
-
-                elif state == "swar_spread":
-                    chosen = spread.get((r, c), "")
-                    if chosen and not chosen.startswith("____"):
-                        text += chosen  # append the स्वर
-                    # After picking one item, return to main keyboard
-                    spread = {}
-                    state = "main"
-                    continue
-                
-                if state == "language_select":
-                    chosen = layout.get((r, c), "")
-                    if chosen == "ENGLISH":
-                        return "SWITCH_ENGLISH"
-                    elif chosen == "GUJARATI":
-                        return "SWITCH_GUJARATI"
-                    elif chosen == "HINDI":
-                        return "SWITCH_HINDI"
-
-                # fallback: if clicked textbox, clear
-                if textbox_rect.collidepoint(pos):
-                    text = ""
-
-    pygame.quit()
+    return run_keyboards(screen, w, h, {"GUJARATI": language_keyboard(w, h)}, "GUJARATI")
 
 if __name__ == "__main__":
     main()
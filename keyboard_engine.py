@@ -0,0 +1,181 @@
+"""
+Table-driven keyboard state machine, shared by every language.
+
+A keyboard is a plain dict (see KEYBOARD_ENGLISH in english_keyboard.py):
+
+    "start":            first screen
+    "grid":             (rows, cols), default (3, 3)
+    "textbox_cells":    cells covered by the textbox instead of buttons
+    "spread_positions": cells a spread fills, in order
+    "phrases":          {label: [phrase, ...]} for the "phrases" verb
+    "maatra":           {cell: template with {a}} for the "maatra" verb
+    "defaults":         rule fields every screen starts from
+    "screens":          {name: rules}
+
+Screen rules:
+    "cells":    {cell: label}; screens without it are filled in by a verb below
+    "on":       action of a labelled cell
+    "special":  {label: action}, overrides "on"
+    "empty":    action of a button cell without a label
+    "fixed":    {cell: action}, whatever the label (the Speak button)
+    "textbox":  action of a click on the textbox
+
+Actions are "verb [target]":
+    stay                     nothing
+    goto S                   show screen S
+    open S                   the label's tokens spread over screen S
+    phrases S                phrases[label] spread over screen S
+    maatra S                 the maatra templates for the label, on screen S
+    type S / word S          append the label (word: and a space), then S
+    phrase S                 append the label as a phrase, space separated, then S
+    space S / backspace S / clear S
+    placeholder S            not implemented yet: say so, then S
+    switch                   switch to the language named by the label
+    speak                    speak the text
+
+Everything, including every spread and maatra screen, is compiled once when the
+Keyboard is built; a click is a hit test and a table lookup.
+"""
+
+# --- CLICK RESULTS ---
+SPEAK = "speak"
+SWITCH = "switch"
+
+_TEXT_VERBS = {"type", "word", "phrase", "space", "backspace", "clear", "placeholder"}
+_SCREEN_VERBS = {"open", "phrases", "maatra"}
+
+
+class Screen:
+    """One compiled screen: what each cell shows and does."""
+    __slots__ = ("name", "kind", "cells", "actions", "textbox")
+
+    def __init__(self, name, kind, cells):
+        self.name = name
+        self.kind = kind
+        self.cells = cells      # {cell: label}, what draw_buttons gets
+        self.actions = {}       # {cell: (verb, label, target Screen or None)}
+        self.textbox = None
+
+
+class Keyboard:
+    def __init__(self, definition):
+        self.definition = definition
+        rows, cols = definition.get("grid", (3, 3))
+        textbox_cells = set(definition.get("textbox_cells", ()))
+        self.button_cells = [(r, c) for r in range(rows) for c in range(cols) if (r, c) not in textbox_cells]
+        self.screens = {}
+        self._rules = {name: {**definition.get("defaults", {}), **rules}
+                       for name, rules in definition["screens"].items()}
+        self.start = self._static(definition["start"])
+        self._hits = []
+        self._textbox_rect = None
+        self.reset()
+
+    # ---------------- Compilation ----------------
+    def _static(self, kind):
+        screen = self.screens.get(kind)
+        if screen is None:
+            screen = self._build(kind, kind, dict(self._rules[kind]["cells"]))
+        return screen
+
+    def _build(self, name, kind, cells):
+        screen = self.screens[name] = Screen(name, kind, cells)
+        rules = self._rules[kind]
+        special = rules.get("special", {})
+        fixed = rules.get("fixed", {})
+        for cell in self.button_cells:
+            label = cells.get(cell, "")
+            if cell in fixed:
+                action = fixed[cell]
+            elif not label:
+                action = rules.get("empty", "stay")
+            else:
+                action = special.get(label, rules.get("on", "stay"))
+            screen.actions[cell] = self._compile_action(action, label)
+        screen.textbox = self._compile_action(rules.get("textbox", "stay"), "")
+        return screen
+
+    def _spread(self, items):
+        positions = self.definition["spread_positions"]
+        return {pos: items[i] if i < len(items) else "" for i, pos in enumerate(positions)}
+
+    def _compile_action(self, action, label):
+        verb, _, target = action.partition(" ")
+        if verb in _SCREEN_VERBS:
+            name = f"{target}:{label}"
+            screen = self.screens.get(name)
+            if screen is None:
+                if verb == "open":
+                    cells = self._spread(label.replace("\n\n", " ").split())
+                elif verb == "phrases":
+                    cells = self._spread(self.definition["phrases"].get(label, []))
+                else:
+                    cells = {pos: template.format(a=label) for pos, template in self.definition["maatra"].items()}
+                screen = self._build(name, target, cells)
+            return "goto", label, screen
+        if verb in ("goto",) or verb in _TEXT_VERBS:
+            return verb, label, self._static(target) if target else None
+        if verb in ("stay", "switch", "speak"):
+            return verb, label, None
+        raise ValueError(f"unknown keyboard action {action!r}")
+
+    def layouts(self, kinds=None):
+        """Cells of every compiled screen (of the given kinds), e.g. for preloading labels."""
+        return [screen.cells for screen in self.screens.values() if kinds is None or screen.kind in kinds]
+
+    def static_kinds(self):
+        return [name for name, rules in self._rules.items() if "cells" in rules]
+
+    # ---------------- Running ----------------
+    def reset(self):
+        self.screen = self.start
+        self.text = ""
+
+    def set_geometry(self, button_rects, textbox_rect):
+        """Rects (anything with collidepoint) the clicks are hit-tested against, as drawn."""
+        self._hits = [(rect, cell) for cell, rect in button_rects.items() if cell in self.screen.actions]
+        self._textbox_rect = textbox_rect
+
+    def cell_at(self, pos):
+        for rect, cell in self._hits:
+            if rect.collidepoint(pos):
+                return cell
+        return None
+
+    def click(self, pos):
+        """Apply a click. Returns (SPEAK, text), (SWITCH, language) or None."""
+        cell = self.cell_at(pos)
+        if cell is not None:
+            action = self.screen.actions[cell]
+        elif self._textbox_rect is not None and self._textbox_rect.collidepoint(pos):
+            action = self.screen.textbox
+        else:
+            return None
+        return self.apply(action)
+
+    def apply(self, action):
+        verb, label, target = action
+        if verb == "speak":
+            return SPEAK, self.text
+        if verb == "switch":
+            return (SWITCH, label) if label else None
+
+        text = self.text
+        if verb == "type":
+            text += label
+        elif verb == "word":
+            text += label + " "
+        elif verb == "phrase":
+            text += (" " + label) if text and not text.endswith(" ") else label
+        elif verb == "space":
+            text += " "
+        elif verb == "backspace":
+            text = text[:-1]
+        elif verb == "clear":
+            text = ""
+        elif verb == "placeholder":
+            print(f"{label} clicked")  # placeholder
+        self.text = text
+        if target is not None:
+            self.screen = target
+        return None
@@ -0,0 +1,84 @@
+from collections import OrderedDict, namedtuple
+import numpy as np
+import pygame
+
+# Rendered button labels. Laying out and rasterising text (freetype shaping of
+# Devanagari and Gujarati above all) is most of what a keyboard frame costs;
+# blitting a ready surface is not.
+DEFAULT_MAX_ENTRIES = 256   # labels only seen at run time (spreads, maatra groups), LRU
+
+# name: unique per font/size/colour; draw(surface, rect, label, color) lays the
+# label out in rect exactly as the keyboard would draw it directly
+LabelStyle = namedtuple("LabelStyle", "name draw color")
+
+
+class LabelCache:
+    """
+    (style, label, cell size) -> the label drawn by style.draw on a transparent
+    canvas, cropped to its bounding box, plus where that box sits relative to
+    the cell. preload()ed labels (the static layouts) are kept for good;
+    everything else is evicted least recently used first.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._pinned = {}
+        self._recent = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self._pinned) + len(self._recent)
+
+    @staticmethod
+    def _render(style, label, size):
+        # Half a cell of margin all round: long labels spill over their button, as before
+        w, h = size
+        mx, my = w // 2, h // 2
+        canvas = pygame.Surface((w + 2 * mx, h + 2 * my), pygame.SRCALPHA)
+        # Transparent pixels already carry the text colour, so antialiased
+        # edges blend to the same colour as text drawn straight on the button
+        canvas.fill((*style.color, 0))
+        style.draw(canvas, pygame.Rect(mx, my, w, h), label, style.color)
+        # Crop to the drawn pixels (numpy is several times faster than get_bounding_rect here)
+        alpha = pygame.surfarray.pixels_alpha(canvas)
+        xs = np.flatnonzero(alpha.any(axis=1))
+        ys = np.flatnonzero(alpha.any(axis=0))
+        del alpha
+        if not len(xs):
+            return pygame.Surface((0, 0), pygame.SRCALPHA), (0, 0)
+        box = pygame.Rect(xs[0], ys[0], xs[-1] - xs[0] + 1, ys[-1] - ys[0] + 1)
+        return canvas.subsurface(box).copy(), (box.x - mx, box.y - my)
+
+    def get(self, style, label, size):
+        """(surface, offset in the cell) for label at cell size (w, h)."""
+        key = (style.name, label, size)
+        entry = self._pinned.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+        entry = self._recent.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._recent.move_to_end(key)
+            return entry
+        self.misses += 1
+        entry = self._recent[key] = self._render(style, label, size)
+        if len(self._recent) > self.max_entries:
+            self._recent.popitem(last=False)
+            self.evicted += 1
+        return entry
+
+    def preload(self, style, label, size):
+        key = (style.name, label, size)
+        if key not in self._pinned:
+            self._pinned[key] = self._recent.pop(key, None) or self._render(style, label, size)
+
+    def blit(self, surface, rect, style, label):
+        text, (dx, dy) = self.get(style, label, rect.size)
+        surface.blit(text, (rect.x + dx, rect.y + dy))
+
+    def stats(self):
+        return {"pinned": len(self._pinned), "recent": len(self._recent),
+                "hits": self.hits, "misses": self.misses, "evicted": self.evicted}
@@ -0,0 +1,317 @@
+import os
+import time
+import cv2
+import numpy as np
+
+# --- BACKEND NAMES ---
+# Full-face backends find the face and return any FaceMesh landmark index
+BACKEND_MEDIAPIPE = "mediapipe"   # mp.solutions.face_mesh (old behaviour)
+BACKEND_TASKS = "tasks"           # MediaPipe Tasks FaceLandmarker
+# Eye-crop backends refine eye points inside a crop placed from the previous result
+EYE_BACKEND_TFLITE = "tflite"     # iris_landmark.tflite via tflite_runtime / tf.lite (XNNPACK)
+EYE_BACKEND_ONNX = "onnx"         # same model exported to ONNX, via onnxruntime
+
+MODEL_DIR = os.path.join("assets", "models")
+FACE_LANDMARKER_MODEL = os.path.join(MODEL_DIR, "face_landmarker.task")
+IRIS_MODEL_TFLITE = os.path.join(MODEL_DIR, "iris_landmark.tflite")
+IRIS_MODEL_ONNX = os.path.join(MODEL_DIR, "iris_landmark.onnx")
+
+DEFAULT_NUM_THREADS = 4
+
+# ---------------- Iris model geometry ----------------
+# Input is a 64x64 RGB crop around one eye, 2.3x the corner-to-corner width,
+# rotated so the corners are level. The model is trained on the eye that
+# FaceMesh calls 33/133; the other eye is mirrored before inference.
+IRIS_INPUT_SIZE = 64
+IRIS_CROP_SCALE = 2.3
+IRIS_INPUT_RANGE = (0.0, 1.0)
+
+# Outputs: 71 eye contour points and 5 iris points, (x, y, z) in crop pixels.
+# Contour 0-8 is the lower lid from corner to corner (33, 7, 163, 144, 145, 153,
+# 154, 155, 133 on the model's eye), 9-15 the upper lid (246, 161, 160, 159, 158, 157, 173).
+EYE_CONTOUR_LEN = 71 * 3
+IRIS_LEN = 5 * 3
+# Contour rows returned after the iris centre, in EYE_MODEL_LANDMARKS order
+CONTOUR_ROWS = [12, 4, 11, 13, 5, 3, 0, 8]
+
+# Face mesh index of each point the eye model returns, per eye.
+# Rows: iris centre, upper lid, lower lid, the other four eye-aspect-ratio lid
+# points, then corner0, corner1 (always last)
+EYE_MODEL_LANDMARKS = (
+    [468, 159, 145, 160, 158, 153, 144, 33, 133],
+    [473, 386, 374, 387, 385, 380, 373, 263, 362],
+)
+
+
+class TimedBackend:
+    """
+    Common timing for all backends: the public calls of each kind of backend go
+    through _timed(), which records how long every call took in last_ms / avg_ms.
+    """
+    name = ""
+
+    def __init__(self, num_threads=DEFAULT_NUM_THREADS):
+        self.num_threads = num_threads
+        self.calls = 0
+        self.last_ms = 0.0
+        self.total_ms = 0.0
+
+    @property
+    def avg_ms(self):
+        return self.total_ms / self.calls if self.calls else 0.0
+
+    def _timed(self, fn, *args):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        self.last_ms = (time.perf_counter() - t0) * 1000.0
+        self.total_ms += self.last_ms
+        self.calls += 1
+        return result
+
+    def close(self):
+        pass
+
+
+class LandmarkBackend(TimedBackend):
+    """Full-face backends. Subclasses implement _detect(); callers use detect()."""
+
+    def detect(self, rgb, indices, out=None):
+        """Return (len(indices), 2) normalized x, y of the first face, or None."""
+        return self._timed(self._detect, rgb, indices, out)
+
+    def warm_up(self, size):
+        """One untimed run on a blank (w, h) frame, so graph and delegate setup happen before the first real frame."""
+        self._detect(np.zeros((size[1], size[0], 3), dtype=np.uint8), [0], np.empty((1, 2), dtype=np.float32))
+
+
+# ---------------- Full-face backends ----------------
+class MediaPipeSolutionBackend(LandmarkBackend):
+    # The solutions API does not expose a thread count; num_threads is ignored
+    name = BACKEND_MEDIAPIPE
+
+    def __init__(self, num_threads=DEFAULT_NUM_THREADS, min_detection_confidence=0.5, min_tracking_confidence=0.5):
+        super().__init__(num_threads)
+        import mediapipe as mp
+        self.face_mesh = mp.solutions.face_mesh.FaceMesh(
+            max_num_faces=1, refine_landmarks=True,
+            min_detection_confidence=min_detection_confidence,
+            min_tracking_confidence=min_tracking_confidence
+        )
+
+    def _detect(self, rgb, indices, out):
+        results = self.face_mesh.process(rgb)
+        if not results.multi_face_landmarks:
+            return None
+        return landmarks_to_array(results.multi_face_landmarks[0].landmark, indices, out)
+
+    def close(self):
+        self.face_mesh.close()
+
+
+class MediaPipeTasksBackend(LandmarkBackend):
+    # FaceLandmarker only offers CPU/GPU delegate selection; num_threads is ignored
+    name = BACKEND_TASKS
+
+    def __init__(self, num_threads=DEFAULT_NUM_THREADS, model_path=FACE_LANDMARKER_MODEL,
+                 min_detection_confidence=0.5, min_tracking_confidence=0.5):
+        super().__init__(num_threads)
+        import mediapipe as mp
+        from mediapipe.tasks import python as mp_tasks
+        from mediapipe.tasks.python import vision
+
+        self._mp = mp
+        options = vision.FaceLandmarkerOptions(
+            base_options=mp_tasks.BaseOptions(model_asset_path=model_path),
+            running_mode=vision.RunningMode.VIDEO,
+            num_faces=1,
+            min_face_detection_confidence=min_detection_confidence,
+            min_tracking_confidence=min_tracking_confidence,
+        )
+        self.landmarker = vision.FaceLandmarker.create_from_options(options)
+        self._last_ts = 0
+
+    def _detect(self, rgb, indices, out):
+        # VIDEO mode needs strictly increasing timestamps
+        ts = max(int(time.monotonic() * 1000), self._last_ts + 1)
+        self._last_ts = ts
+        image = self._mp.Image(image_format=self._mp.ImageFormat.SRGB, data=np.ascontiguousarray(rgb))
+        result = self.landmarker.detect_for_video(image, ts)
+        if not result.face_landmarks:
+            return None
+        return landmarks_to_array(result.face_landmarks[0], indices, out)
+
+    def close(self):
+        self.landmarker.close()
+
+
+def landmarks_to_array(landmarks, indices, out=None):
+    """Copy only the landmarks we use into a (len(indices), 2) float32 array of normalized x, y."""
+    if out is None:
+        out = np.empty((len(indices), 2), dtype=np.float32)
+    for row, idx in enumerate(indices):
+        p = landmarks[idx]
+        out[row, 0] = p.x
+        out[row, 1] = p.y
+    return out
+
+
+# ---------------- Eye-crop backends ----------------
+class IrisModelBackend(TimedBackend):
+    """
+    Runs the MediaPipe iris landmark model on one eye crop at a time.
+    eye_landmarks() returns the EYE_MODEL_LANDMARKS rows for that eye in frame pixels.
+    Subclasses provide _load() and _run(input_tensor) -> (contours, iris).
+    """
+
+    def __init__(self, model_path, num_threads=DEFAULT_NUM_THREADS, int8=False):
+        super().__init__(num_threads)
+        self.int8 = int8
+        self._crop = np.empty((IRIS_INPUT_SIZE, IRIS_INPUT_SIZE, 3), dtype=np.uint8)
+        self._input = np.empty((1, IRIS_INPUT_SIZE, IRIS_INPUT_SIZE, 3), dtype=np.float32)
+        self._out = np.empty((len(CONTOUR_ROWS) + 1, 2), dtype=np.float32)
+        self._load(model_path)
+
+    def warm_up(self, size=None):
+        self._input.fill(IRIS_INPUT_RANGE[0])
+        self._run(self._input)
+
+    def eye_landmarks(self, rgb, corner0, corner1, mirror):
+        return self._timed(self._eye_landmarks, rgb, corner0, corner1, mirror)
+
+    def _eye_landmarks(self, rgb, corner0, corner1, mirror):
+        m = _eye_crop_matrix(corner0, corner1, mirror)
+        cv2.warpAffine(rgb, m, (IRIS_INPUT_SIZE, IRIS_INPUT_SIZE), dst=self._crop,
+                       flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REPLICATE)
+        lo, hi = IRIS_INPUT_RANGE
+        np.multiply(self._crop, (hi - lo) / 255.0, out=self._input[0], casting="unsafe")
+        self._input += lo
+
+        contours, iris = self._run(self._input)
+        contours = contours.reshape(-1, 3)
+        iris = iris.reshape(-1, 3)
+
+        crop_pts = self._out
+        crop_pts[0] = iris[0, :2]
+        crop_pts[1:] = contours[CONTOUR_ROWS, :2]
+        # Crop pixels -> frame pixels through the same affine map
+        return crop_pts @ m[:, :2].T + m[:, 2]
+
+    @staticmethod
+    def _split_outputs(outputs):
+        """Pick (contours, iris) out of the model outputs by size, not order."""
+        contours = iris = None
+        for arr in outputs:
+            if arr.size == EYE_CONTOUR_LEN:
+                contours = arr
+            elif arr.size == IRIS_LEN:
+                iris = arr
+        return contours, iris
+
+
+class TFLiteIrisBackend(IrisModelBackend):
+    name = EYE_BACKEND_TFLITE
+
+    def _load(self, model_path):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        if self.int8:
+            # Quantised models are converted offline; expect <name>_int8.tflite next to the float one
+            root, ext = os.path.splitext(model_path)
+            model_path = root + "_int8" + ext
+        # num_threads is passed on to the default XNNPACK delegate
+        self.interpreter = Interpreter(model_path=model_path, num_threads=self.num_threads)
+        self.interpreter.allocate_tensors()
+        self._in = self.interpreter.get_input_details()[0]
+        self._outs = self.interpreter.get_output_details()
+
+    def _run(self, tensor):
+        in_dtype = self._in["dtype"]
+        if in_dtype != np.float32:
+            scale, zero = self._in["quantization"]
+            tensor = np.round(tensor / scale + zero).astype(in_dtype)
+        self.interpreter.set_tensor(self._in["index"], tensor)
+        self.interpreter.invoke()
+
+        outputs = []
+        for d in self._outs:
+            arr = self.interpreter.get_tensor(d["index"])
+            if arr.dtype != np.float32:
+                scale, zero = d["quantization"]
+                arr = (arr.astype(np.float32) - zero) * scale
+            outputs.append(arr)
+        return self._split_outputs(outputs)
+
+
+class OnnxIrisBackend(IrisModelBackend):
+    name = EYE_BACKEND_ONNX
+
+    def _load(self, model_path):
+        import onnxruntime as ort
+
+        if self.int8:
+            # Dynamic int8 weight quantisation, done once and cached next to the model
+            root, ext = os.path.splitext(model_path)
+            int8_path = root + "_int8" + ext
+            if not os.path.exists(int8_path):
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                quantize_dynamic(model_path, int8_path, weight_type=QuantType.QInt8)
+            model_path = int8_path
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = self.num_threads
+        opts.inter_op_num_threads = 1
+        opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        self.session = ort.InferenceSession(model_path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self._input_name = self.session.get_inputs()[0].name
+        self._nhwc = self.session.get_inputs()[0].shape[-1] == 3
+
+    def _run(self, tensor):
+        if not self._nhwc:
+            tensor = tensor.transpose(0, 3, 1, 2)
+        outputs = self.session.run(None, {self._input_name: tensor})
+        return self._split_outputs(outputs)
+
+
+def _eye_crop_matrix(corner0, corner1, mirror):
+    """
+    2x3 affine map from 64x64 crop pixels to frame pixels (use with WARP_INVERSE_MAP):
+    centred between the corners, IRIS_CROP_SCALE x their distance, rotated level,
+    and mirrored for the eye the model was not trained on.
+    """
+    c0 = np.asarray(corner0, dtype=np.float64)
+    c1 = np.asarray(corner1, dtype=np.float64)
+    d = c1 - c0
+    if mirror:
+        # Crop x runs against corner0 -> corner1, so measure the angle of -d
+        d = -d
+    angle = np.arctan2(d[1], d[0])
+    scale = IRIS_CROP_SCALE * np.hypot(d[0], d[1]) / IRIS_INPUT_SIZE
+    cos_a, sin_a = np.cos(angle) * scale, np.sin(angle) * scale
+    a = np.array([[cos_a, -sin_a], [sin_a, cos_a]])
+    if mirror:
+        a[:, 0] = -a[:, 0]
+    half = IRIS_INPUT_SIZE / 2.0
+    b = (c0 + c1) / 2.0 - a @ (half, half)
+    return np.hstack([a, b[:, None]]).astype(np.float32)
+
+
+# ---------------- Factories ----------------
+def create_backend(name=BACKEND_MEDIAPIPE, num_threads=DEFAULT_NUM_THREADS, **kwargs):
+    if name == BACKEND_MEDIAPIPE:
+        return MediaPipeSolutionBackend(num_threads, **kwargs)
+    if name == BACKEND_TASKS:
+        return MediaPipeTasksBackend(num_threads, **kwargs)
+    raise ValueError(f"Unknown landmark backend: {name}")
+
+
+def create_eye_backend(name, num_threads=DEFAULT_NUM_THREADS, int8=False, model_path=None):
+    if name is None:
+        return None
+    if name == EYE_BACKEND_TFLITE:
+        return TFLiteIrisBackend(model_path or IRIS_MODEL_TFLITE, num_threads, int8)
+    if name == EYE_BACKEND_ONNX:
+        return OnnxIrisBackend(model_path or IRIS_MODEL_ONNX, num_threads, int8)
+    raise ValueError(f"Unknown eye backend: {name}")
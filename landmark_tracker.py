@@ -0,0 +1,164 @@
+import cv2
+import numpy as np
+from landmark_backends import EYE_MODEL_LANDMARKS
+
+# --- TRACKING MODES ---
+# "full": full-face backend on every frame (old behaviour)
+# "crop": full-face backend every N frames or after tracking loss; in between the
+#         tracked points are followed inside a crop around the eyes, either with
+#         optical flow or with an eye-crop backend (iris model)
+TRACK_FULL = "full"
+TRACK_CROP = "crop"
+
+DEFAULT_REDETECT_EVERY = 5
+
+# Eye corners + lids of both eyes. Symmetric, so it works mirrored or not.
+EYE_BOX_LANDMARKS = [33, 133, 159, 145, 362, 263, 386, 374]
+
+# Optical flow settings (pixels at inference resolution)
+LK_WIN_SIZE = (15, 15)
+LK_MAX_LEVEL = 2
+LK_CRITERIA = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
+MAX_FB_ERROR = 1.0   # forward-backward error above which we call the track lost
+# Eye-crop backend: eye width may change this much (ratio) before we re-detect
+MAX_EYE_WIDTH_CHANGE = 0.3
+
+
+class EyeRegionTracker:
+    """
+    Wraps a full-face landmark backend (see landmark_backends.py) and returns the
+    requested landmarks as a NumPy array of normalized (x, y), or None when no
+    face is found.
+    """
+
+    def __init__(self, backend, indices, mode=TRACK_CROP, redetect_every=DEFAULT_REDETECT_EVERY, margin=0.3,
+                 eye_backend=None):
+        self.backend = backend
+        self.eye_backend = eye_backend
+        self.indices = list(indices)
+        # Box points are appended after the tracked ones so one array carries both
+        self._all_indices = self.indices + [i for i in EYE_BOX_LANDMARKS if i not in self.indices]
+        if eye_backend is not None:
+            self._map_eye_rows()
+        self.mode = mode
+        self.redetect_every = redetect_every
+        self.margin = margin
+
+        self._points = np.empty((len(self._all_indices), 2), dtype=np.float32)
+        self._px = None           # eye-crop backend state, frame pixels of _all_indices
+        self._box = None          # (x0, y0, x1, y1) in pixels of the inference frame
+        self._prev_gray = None
+        self._prev_pts = None     # (N, 1, 2) float32, crop coordinates
+        self._since_full = 0
+
+        self.full_runs = 0
+        self.crop_runs = 0
+        self.lost = 0
+
+    def _map_eye_rows(self):
+        """For each eye: (rows of _all_indices, matching rows of the eye model output)."""
+        self._eye_rows = []
+        covered = set()
+        for eye_indices in EYE_MODEL_LANDMARKS:
+            rows, model_rows = [], []
+            for model_row, idx in enumerate(eye_indices):
+                if idx not in self._all_indices:
+                    self._all_indices.append(idx)
+                rows.append(self._all_indices.index(idx))
+                model_rows.append(model_row)
+                covered.add(idx)
+            self._eye_rows.append((rows, model_rows))
+        missing = [i for i in self.indices if i not in covered]
+        if missing:
+            raise ValueError(f"eye backend cannot track landmarks {missing}")
+
+    def process(self, rgb):
+        if self.mode == TRACK_CROP and self._box is not None and self._since_full < self.redetect_every:
+            points = self._refine(rgb) if self.eye_backend is not None else self._track(rgb)
+            if points is not None:
+                return points
+            self.lost += 1
+        return self._detect(rgb)
+
+    # ---------------- Full-face pass ----------------
+    def _detect(self, rgb):
+        self.full_runs += 1
+        self._since_full = 0
+        if self.backend.detect(rgb, self._all_indices, out=self._points) is None:
+            self._box = None
+            return None
+
+        if self.mode == TRACK_CROP:
+            self._start_track(rgb)
+        return self._points[:len(self.indices)].copy()
+
+    def _start_track(self, rgb):
+        h, w = rgb.shape[:2]
+        px = self._points * (w, h)
+        if self.eye_backend is not None:
+            self._px = px
+            self._eye_widths = [self._eye_width(px, rows) for rows, _ in self._eye_rows]
+            self._box = (0, 0, w, h)
+            return
+        x0, y0 = px.min(axis=0)
+        x1, y1 = px.max(axis=0)
+        pad = self.margin * (x1 - x0)
+        x0 = max(0, int(x0 - pad))
+        y0 = max(0, int(y0 - pad))
+        x1 = min(w, int(x1 + pad) + 1)
+        y1 = min(h, int(y1 + pad) + 1)
+        if x1 - x0 < 8 or y1 - y0 < 8:
+            self._box = None
+            return
+
+        self._box = (x0, y0, x1, y1)
+        self._prev_gray = cv2.cvtColor(rgb[y0:y1, x0:x1], cv2.COLOR_RGB2GRAY)
+        self._prev_pts = (px - (x0, y0)).astype(np.float32).reshape(-1, 1, 2)
+
+    # ---------------- Optical-flow pass ----------------
+    def _track(self, rgb):
+        x0, y0, x1, y1 = self._box
+        gray = cv2.cvtColor(rgb[y0:y1, x0:x1], cv2.COLOR_RGB2GRAY)
+
+        pts, status, _ = cv2.calcOpticalFlowPyrLK(
+            self._prev_gray, gray, self._prev_pts, None,
+            winSize=LK_WIN_SIZE, maxLevel=LK_MAX_LEVEL, criteria=LK_CRITERIA)
+        back, back_status, _ = cv2.calcOpticalFlowPyrLK(
+            gray, self._prev_gray, pts, None,
+            winSize=LK_WIN_SIZE, maxLevel=LK_MAX_LEVEL, criteria=LK_CRITERIA)
+
+        fb_error = np.abs(back - self._prev_pts).max()
+        inside = (pts[:, 0, 0] >= 0).all() and (pts[:, 0, 0] < x1 - x0).all() \
+            and (pts[:, 0, 1] >= 0).all() and (pts[:, 0, 1] < y1 - y0).all()
+        if not status.all() or not back_status.all() or fb_error > MAX_FB_ERROR or not inside:
+            return None
+
+        self.crop_runs += 1
+        self._since_full += 1
+        self._prev_gray = gray
+        self._prev_pts = pts
+
+        h, w = rgb.shape[:2]
+        tracked = pts[:len(self.indices), 0, :]
+        return (tracked + (x0, y0)) / (w, h)
+
+    # ---------------- Eye-crop backend pass ----------------
+    @staticmethod
+    def _eye_width(px, rows):
+        # Last two model rows are the eye corners
+        return float(np.hypot(*(px[rows[-1]] - px[rows[-2]])))
+
+    def _refine(self, rgb):
+        px = self._px
+        for eye, (rows, model_rows) in enumerate(self._eye_rows):
+            corner0, corner1 = px[rows[-2]], px[rows[-1]]
+            out = self.eye_backend.eye_landmarks(rgb, corner0, corner1, mirror=eye == 1)
+            px[rows] = out[model_rows]
+            width = self._eye_width(px, rows)
+            if abs(width - self._eye_widths[eye]) > MAX_EYE_WIDTH_CHANGE * self._eye_widths[eye]:
+                return None
+
+        self.crop_runs += 1
+        self._since_full += 1
+        h, w = rgb.shape[:2]
+        return px[:len(self.indices)] / (w, h)
@@ -0,0 +1,68 @@
+import json
+import os
+import time
+from collections import deque
+import numpy as np
+
+# Rolling per-stage latency percentiles. All timestamps are time.monotonic()
+# (CLOCK_MONOTONIC), so stamps taken in the tracker and in the keyboard compare.
+DEFAULT_WINDOW = 1000        # most recent samples kept per stage
+DEFAULT_DUMP_EVERY = 10.0    # seconds between stats file writes
+PERCENTILES = (50, 95, 99)
+
+
+class LatencyStats:
+    """
+    record() is cheap and safe from any thread (one deque append). Percentiles
+    are only computed when someone asks: summary(), the preview, or a dump.
+    """
+
+    def __init__(self, path=None, window=DEFAULT_WINDOW, dump_every=DEFAULT_DUMP_EVERY):
+        self.path = path
+        self.window = window
+        self.dump_every = dump_every
+        self._samples = {}
+        self._next_dump = time.monotonic() + dump_every
+
+    def record(self, stage, start, end=None):
+        """Add (end - start) to `stage`, in ms. end defaults to now."""
+        if end is None:
+            end = time.monotonic()
+        samples = self._samples.get(stage)
+        if samples is None:
+            samples = self._samples.setdefault(stage, deque(maxlen=self.window))
+        samples.append((end - start) * 1000.0)
+
+    def percentiles(self, stage):
+        """(p50, p95, p99) in ms over the window, or None before the first sample."""
+        samples = self._samples.get(stage)
+        if not samples:
+            return None
+        return tuple(np.percentile(np.fromiter(list(samples), dtype=np.float64), PERCENTILES))
+
+    def summary(self):
+        out = {}
+        for stage in list(self._samples):
+            p = self.percentiles(stage)
+            if p is not None:
+                out[stage] = {"n": len(self._samples[stage]),
+                              **{f"p{q}": round(float(v), 2) for q, v in zip(PERCENTILES, p)}}
+        return out
+
+    def dump(self):
+        if self.path is None:
+            return
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"time": time.time(), "window": self.window, "stages_ms": self.summary()}, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ Could not write latency stats {self.path}: {e}")
+
+    def maybe_dump(self):
+        """Call from a loop that is not latency critical; writes every dump_every seconds."""
+        now = time.monotonic()
+        if now >= self._next_dump:
+            self._next_dump = now + self.dump_every
+            self.dump()
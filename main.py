@@ -1,29 +1,60 @@
-import pygame
-from english_keyboard import main as english_main
-from gujarati_keyboard import main as gujarati_main
-from hindi_keyboard import main as hindi_main
-
-current_keyboard = "GUJARATI"  # default
-
-while True:
-    if current_keyboard == "ENGLISH":
-        result = english_main()
-    elif current_keyboard == "GUJARATI":
-        result = gujarati_main()
-    elif current_keyboard == "HINDI":
-        result = hindi_main()
-
-    # Clear old events and wait a bit
-    # wait until mouse is fully released
-    while any(pygame.mouse.get_pressed()):
-        pygame.event.pump()
-
-    if result == "SWITCH_ENGLISH":
-        current_keyboard = "ENGLISH"
-    elif result == "SWITCH_GUJARATI":
-        current_keyboard = "GUJARATI"
-    elif result == "SWITCH_HINDI":
-        current_keyboard = "HINDI"
-    else:
-        break
+import sys
+from startup_profile import StartupProfile
 
+# Before the other imports, so they are in the profile too
+profile = StartupProfile("--profile-startup" in sys.argv)
+
+import importlib
+import threading
+from core_ui import init_pygame_and_get_screen_size, create_window, run_keyboards
+import speech_engine
+
+DEFAULT_KEYBOARD = "GUJARATI"
+KEYBOARD_MODULES = {
+    "ENGLISH": "english_keyboard",
+    "GUJARATI": "gujarati_keyboard",
+    "HINDI": "hindi_keyboard",
+}
+
+def keyboard_loader(language, preload=True):
+    # Imported (fonts, compiled layout, rendered labels) only when the host asks
+    def load(w, h):
+        keyboard = importlib.import_module(KEYBOARD_MODULES[language]).language_keyboard(w, h, preload)
+        profile.mark(f"loaded {language}")
+        return keyboard
+    return load
+
+def label_preloader(language, w, h):
+    def preload():
+        getattr(importlib.import_module(KEYBOARD_MODULES[language]), f"preload_{language.lower()}")(w, h)
+        profile.mark(f"preloaded {language}")
+    return preload
+
+def warm_up_speech():
+    speech_engine.warm_up()
+    profile.mark("speech ready")
+
+# One display and one loop for every language: fonts, compiled layouts and
+# rendered labels of all keyboards stay loaded, so switching language is a
+# single frame, and the typed text goes along.
+# Only the default keyboard is loaded before the first frame, without
+# rendering its labels ahead (the first frame renders what it shows). When the
+# loop is idle, its other labels are rendered, a thread opens the audio device
+# and times the TTS backends (speech_engine.warm_up), and the other languages load.
+def main():
+    profile.mark("imports")
+    w, h = init_pygame_and_get_screen_size()
+    screen = create_window(w, h)
+    profile.mark("display")
+    keyboards = {language: keyboard_loader(language, preload=language != DEFAULT_KEYBOARD)
+                 for language in KEYBOARD_MODULES}
+    speech = threading.Thread(target=warm_up_speech, daemon=True)
+    profile.report_after("speech ready", *(f"loaded {language}" for language in KEYBOARD_MODULES))
+    run_keyboards(screen, w, h, keyboards, DEFAULT_KEYBOARD,
+                  idle_tasks=[label_preloader(DEFAULT_KEYBOARD, w, h), speech.start],
+                  on_first_frame=lambda: profile.mark("first_frame"))
+    # Closed before the background work was done: report what there is
+    profile.report()
+
+if __name__ == "__main__":
+    main()
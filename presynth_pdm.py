@@ -0,0 +1,102 @@
+"""
+Pre-synthesise every PDM phrase of every keyboard into the TTS audio cache
+(tts_cache.py), pinned so it is never evicted: the common phrases then play
+straight from disk, without waiting for (or having) any TTS engine.
+
+    python presynth_pdm.py                      # best backend per language
+    python presynth_pdm.py --backend piper --backend gtts
+    python presynth_pdm.py HINDI --force        # synthesise again, even if cached
+
+Run it again after adding phrases or voices; what is already pinned is skipped,
+and phrases already spoken once (in recent/) are moved to pinned/.
+"""
+import argparse
+import importlib
+import time
+
+import speech_engine
+
+PDM_TABLES = {
+    "ENGLISH": ("english_keyboard", "pdm_messages"),
+    "HINDI": ("hindi_keyboard", "PDM_MESSAGES_HINDI"),
+    "GUJARATI": ("gujarati_keyboard", "PDM_MESSAGES_GUJARATI"),
+}
+
+
+def pdm_phrases(language):
+    module, table = PDM_TABLES[language]
+    phrases = []
+    for group in getattr(importlib.import_module(module), table).values():
+        for phrase in group:
+            if phrase not in phrases:
+                phrases.append(phrase)
+    return phrases
+
+
+def backends_for(language, names):
+    engine = speech_engine.engine
+    if not names:
+        # What would speak it now, as the keyboard would pick
+        return engine.candidates(language)[:1]
+    backends = []
+    for backend in engine.backends:
+        if backend.name in names:
+            if backend.available(language):
+                backends.append(backend)
+            else:
+                print(f"⚠️ {backend.name} not available for {language}")
+    return backends
+
+
+def presynthesize(language, backends, force=False):
+    engine, cache = speech_engine.engine, speech_engine.cache
+    done = cached = failed = 0
+    for backend in backends:
+        voice = backend.voice(language)
+        try:
+            engine.prepare(backend, language)
+        except Exception as e:
+            print(f"❌ {backend.name} unusable for {language}: {e}")
+            continue
+        for phrase in pdm_phrases(language):
+            if not force and cache.is_pinned(phrase, language, voice):
+                cached += 1
+                continue
+            try:
+                # Already spoken (in recent/) or not, it is pinned now
+                path = cache.get(phrase, language, voice) if not force else None
+                if path is None:
+                    engine.synthesize_on(backend, phrase, language,
+                                         keep=lambda b, path: cache.put(phrase, language, voice, path, pinned=True))
+                else:
+                    cache.put(phrase, language, voice, path, pinned=True)
+                done += 1
+            except Exception as e:
+                print(f"❌ {backend.name} {language} {phrase!r}: {e}")
+                failed += 1
+    return done, cached, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-synthesise the PDM phrases into the TTS audio cache")
+    parser.add_argument("languages", nargs="*", metavar="LANGUAGE", help="ENGLISH, HINDI, GUJARATI (default: all)")
+    parser.add_argument("--backend", action="append", default=[], metavar="NAME",
+                        help="piper, espeak-ng or gtts; repeat for several (default: the best available)")
+    parser.add_argument("--force", action="store_true", help="synthesise phrases that are already cached again")
+    args = parser.parse_args()
+
+    start = time.monotonic()
+    for language in [language.upper() for language in args.languages] or list(PDM_TABLES):
+        backends = backends_for(language, args.backend)
+        if not backends:
+            print(f"❌ No TTS backend for {language}")
+            continue
+        done, cached, failed = presynthesize(language, backends, args.force)
+        names = ", ".join(backend.name for backend in backends)
+        print(f"✅ {language} ({names}): {done} pinned, {cached} already pinned, {failed} failed")
+    speech_engine.engine.close()
+    print(f"Cache at {speech_engine.cache.directory} ({time.monotonic() - start:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
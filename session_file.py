@@ -0,0 +1,136 @@
+import mmap
+import struct
+import zlib
+import numpy as np
+
+# Recorded camera sessions: the raw I420 frames exactly as rpicam-vid sent them,
+# plus their capture times, so the tracker can be run again on the same input.
+#
+# Layout: header, then chunks until end of file. Each chunk is
+#   chunk header | capture times (n float64) | zlib(n frames of I420)
+# Chunks are self-describing, so there is no index to write at the end: a
+# recording cut short by a crash or a pulled plug loses only its last chunk.
+# The reader maps the file and inflates one chunk at a time.
+MAGIC = b"ALSREC01"
+DEFAULT_CHUNK_FRAMES = 30   # 1 s at 30 fps per chunk
+DEFAULT_LEVEL = 1           # zlib level: sensor noise compresses poorly anyway, keep it cheap
+
+_HEADER = struct.Struct("<8sIII")    # magic, width, height, fps
+_CHUNK = struct.Struct("<II")        # compressed size, frames
+
+
+class SessionWriter:
+    """
+    Frames are copied into a preallocated chunk buffer (frame_buffer() + commit(),
+    or write()), which is compressed and written out every chunk_frames frames.
+    """
+
+    def __init__(self, path, width, height, fps, chunk_frames=DEFAULT_CHUNK_FRAMES, level=DEFAULT_LEVEL):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.level = level
+        self.frame_size = int(width * height * 1.5)
+        self.frames_written = 0
+        self.bytes_written = _HEADER.size
+        self._chunk = np.empty((chunk_frames, self.frame_size), dtype=np.uint8)
+        self._times = np.empty(chunk_frames, dtype="<f8")
+        self._n = 0
+        self._file = open(path, "wb")
+        self._file.write(_HEADER.pack(MAGIC, width, height, fps))
+
+    def frame_buffer(self):
+        """Flat buffer for the next frame; call commit() once it is filled."""
+        return self._chunk[self._n]
+
+    def commit(self, capture_time):
+        self._times[self._n] = capture_time
+        self._n += 1
+        if self._n == len(self._chunk):
+            self._flush()
+
+    def write(self, yuv, capture_time):
+        np.copyto(self.frame_buffer(), yuv.reshape(-1))
+        self.commit(capture_time)
+
+    def _flush(self):
+        if self._n == 0:
+            return
+        data = zlib.compress(memoryview(self._chunk[:self._n]).cast("B"), self.level)
+        self._file.write(_CHUNK.pack(len(data), self._n))
+        self._file.write(self._times[:self._n].tobytes())
+        self._file.write(data)
+        self.frames_written += self._n
+        self.bytes_written += _CHUNK.size + 8 * self._n + len(data)
+        self._n = 0
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._flush()
+        self._file.close()
+
+
+class SessionReader:
+    """
+    Read side of a session file. Only the chunk headers are touched when
+    opening; frame data stays in the page cache until a chunk is asked for.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path}: empty session file")
+        if len(self._map) < _HEADER.size:
+            self.close()
+            raise ValueError(f"{path}: not a session file")
+        magic, self.width, self.height, self.fps = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path}: not a session file")
+        self.frame_size = int(self.width * self.height * 1.5)
+
+        # (data offset, compressed size, capture times) per chunk
+        self.chunks = []
+        offset = _HEADER.size
+        end = len(self._map)
+        while offset + _CHUNK.size <= end:
+            size, n = _CHUNK.unpack_from(self._map, offset)
+            data_offset = offset + _CHUNK.size + 8 * n
+            if n == 0 or data_offset + size > end:
+                break   # truncated last chunk
+            times = np.frombuffer(self._map, dtype="<f8", count=n, offset=offset + _CHUNK.size)
+            self.chunks.append((data_offset, size, times))
+            offset = data_offset + size
+
+        self.frame_count = sum(len(times) for _, _, times in self.chunks)
+        self.timestamps = (np.concatenate([times for _, _, times in self.chunks])
+                           if self.chunks else np.empty(0, dtype="<f8"))
+        self.duration = float(self.timestamps[-1] - self.timestamps[0]) if self.frame_count else 0.0
+
+    def chunk(self, index):
+        """Frames of one chunk as an (n, frame_size) uint8 array, and their capture times."""
+        data_offset, size, times = self.chunks[index]
+        raw = zlib.decompress(memoryview(self._map)[data_offset:data_offset + size])
+        return np.frombuffer(raw, dtype=np.uint8).reshape(len(times), self.frame_size), times
+
+    def frames(self):
+        """Yield (flat I420 frame, capture time) in order."""
+        for index in range(len(self.chunks)):
+            frames, times = self.chunk(index)
+            for frame, t in zip(frames, times):
+                yield frame, float(t)
+
+    def close(self):
+        self.chunks = []
+        self.timestamps = None
+        if not self._map.closed:
+            try:
+                self._map.close()
+            except BufferError:
+                pass    # a caller still holds a timestamps view; the map goes with it
+        self._file.close()
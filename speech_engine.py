@@ -1,92 +1,400 @@
-from gtts import gTTS
 import pygame
 import os
 import time
+import select
+import shutil
 import subprocess
 import tempfile
-from ctypes import *
-from contextlib import contextmanager
+import threading
+from latency_stats import LatencyStats
+from tts_cache import AudioCache
+
+# gTTS, libasound and the mixer are loaded on first use, or by warm_up() in the
+# background once the keyboard is on screen: none of it is needed for the first frame.
+_audio_lock = threading.Lock()
+_audio_ready = False
+gTTS = None
 
 # ---------------- 1. ALSA Error Suppression (The Visual Fix) ----------------
-# This block hides the C-level ALSA warnings from the terminal
-ERROR_HANDLER_FUNC = CFUNCTYPE(None, c_char_p, c_int, c_char_p, c_int, c_char_p)
+# This hides the C-level ALSA warnings from the terminal
+c_error_handler = None
+
+def _suppress_alsa_errors():
+    global c_error_handler
+    import ctypes
 
-def py_error_handler(filename, line, function, err, fmt):
-    pass
+    ERROR_HANDLER_FUNC = ctypes.CFUNCTYPE(None, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_int,
+                                          ctypes.c_char_p)
 
-c_error_handler = ERROR_HANDLER_FUNC(py_error_handler)
+    def py_error_handler(filename, line, function, err, fmt):
+        pass
 
-try:
-    asound = cdll.LoadLibrary('libasound.so')
-    asound.snd_lib_error_set_handler(c_error_handler)
-except OSError:
-    pass # ALSA not available or different OS, ignore
+    # Kept in a global: ALSA calls it long after this function returns
+    c_error_handler = ERROR_HANDLER_FUNC(py_error_handler)
+    try:
+        asound = ctypes.cdll.LoadLibrary('libasound.so')
+        asound.snd_lib_error_set_handler(c_error_handler)
+    except OSError:
+        pass # ALSA not available or different OS, ignore
 
 # ---------------- 2. Pygame Init with Larger Buffer (The Real Fix) ----------------
-try:
-    # buffer=4096 increases latency slightly but prevents 'underrun' errors 
-    # when the CPU is busy with CV/AI tasks.
-    pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=4096)
-except Exception as e:
-    print(f"⚠️ pygame.mixer init failed: {e}")
+def _init_audio():
+    global _audio_ready
+    with _audio_lock:
+        if _audio_ready:
+            return
+        _suppress_alsa_errors()
+        try:
+            # buffer=4096 increases latency slightly but prevents 'underrun' errors
+            # when the CPU is busy with CV/AI tasks.
+            pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=4096)
+        except Exception as e:
+            print(f"⚠️ pygame.mixer init failed: {e}")
+        _audio_ready = True
 
-# ---------------- Logic ----------------
+def _load_gtts():
+    global gTTS
+    if gTTS is None:
+        from gtts import gTTS as gtts_class
+        gTTS = gtts_class
+    return gTTS
+
+# ---------------- 3. TTS Backends ----------------
+# A backend turns (text, language) into an audio file. Local ones (Piper,
+# espeak-ng) work without network and start speaking in a fraction of the
+# time of gTTS, which needs a round trip to Google for every sentence.
+VOICES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "voices")
+SYNTH_TIMEOUT_S = 15
+
+class TTSBackend:
+    name = "base"
+    expected_ms = 1000      # assumed synthesis time until one has been measured
+
+    def available(self, language):
+        return False
+
+    def voice(self, language):
+        """What the audio for language sounds like (engine, voice, settings), for the audio cache."""
+        return None
+
+    def prepare(self, language):
+        """Get ready to speak language (start processes, load voices); not timed."""
+        pass
+
+    def synthesize(self, text, language):
+        """Path of an audio file with text spoken in language; raises on failure."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def _out_path(self, ext):
+        return os.path.join(tempfile.gettempdir(), f"als_tts_{self.name}.{ext}")
+
+
+class PiperBackend(TTSBackend):
+    """
+    Piper neural voices. One piper process per language stays running with its
+    model loaded: loading the model takes longer than synthesising a sentence.
+    Put a voice (.onnx and its .onnx.json) in assets/voices to enable it.
+    """
+    name = "piper"
+    expected_ms = 250
+    # No Piper voice for Gujarati yet; espeak-ng covers it
+    VOICES = {
+        'ENGLISH': "en_US-lessac-medium.onnx",
+        'HINDI': "hi_IN-pratham-medium.onnx",
+    }
+
+    def __init__(self, voices_dir=VOICES_DIR):
+        self.binary = shutil.which("piper")
+        self.voices_dir = voices_dir
+        self.out_dir = os.path.join(tempfile.gettempdir(), "als_tts_piper")
+        self._procs = {}
+        self._last = None
+
+    def _model(self, language):
+        voice = self.VOICES.get(language)
+        return os.path.join(self.voices_dir, voice) if voice else None
+
+    def available(self, language):
+        model = self._model(language)
+        return bool(self.binary and model and os.path.exists(model))
+
+    def voice(self, language):
+        voice = self.VOICES.get(language)
+        return f"piper:{voice}" if voice else None
+
+    def _process(self, language):
+        proc = self._procs.get(language)
+        if proc is None or proc.poll() is not None:
+            os.makedirs(self.out_dir, exist_ok=True)
+            # --output_dir: one WAV per input line, its path printed on stdout
+            proc = self._procs[language] = subprocess.Popen(
+                [self.binary, "--model", self._model(language), "--output_dir", self.out_dir],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1)
+        return proc
+
+    def prepare(self, language):
+        # The first sentence waits for the model to load
+        self.synthesize(PROBE_TEXT.get(language, "Hello"), language)
+
+    def synthesize(self, text, language):
+        proc = self._process(language)
+        proc.stdin.write(" ".join(text.split()) + "\n")
+        proc.stdin.flush()
+        ready, _, _ = select.select([proc.stdout], [], [], SYNTH_TIMEOUT_S)
+        path = proc.stdout.readline().strip() if ready else ""
+        if not path:
+            proc.kill()
+            raise RuntimeError("piper gave no audio")
+        # A new file every time: keep only the latest
+        if self._last and self._last != path:
+            try:
+                os.remove(self._last)
+            except OSError:
+                pass
+        self._last = path
+        return path
+
+    def close(self):
+        for proc in self._procs.values():
+            proc.kill()
+        self._procs = {}
+
+
+class EspeakBackend(TTSBackend):
+    """espeak-ng: robotic, but tiny, fast and has all three languages."""
+    name = "espeak-ng"
+    expected_ms = 150
+    VOICES = {
+        'ENGLISH': "en",
+        'HINDI': "hi",
+        'GUJARATI': "gu",
+    }
+    WORDS_PER_MINUTE = 150
+
+    def __init__(self):
+        self.binary = shutil.which("espeak-ng") or shutil.which("espeak")
+
+    def available(self, language):
+        return bool(self.binary and language in self.VOICES)
 
-# Map our languages to gTTS codes and TLD for Indian accents
-LANG_CODE_TLD = {
-    'ENGLISH': ('en', 'com'),   # default English
-    'HINDI': ('hi', 'co.in'),   # Indian Hindi accent
-    'GUJARATI': ('gu', 'co.in') # Indian Gujarati accent
+    def voice(self, language):
+        voice = self.VOICES.get(language)
+        return f"espeak-ng:{voice}:{self.WORDS_PER_MINUTE}" if voice else None
+
+    def synthesize(self, text, language):
+        path = self._out_path("wav")
+        # Text on stdin: typed text such as "-5" would be read as an option
+        subprocess.run([self.binary, "-v", self.VOICES[language], "-s", str(self.WORDS_PER_MINUTE), "-w", path, "--stdin"],
+                       input=text.encode("utf-8"), check=True, timeout=SYNTH_TIMEOUT_S,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return path
+
+
+class GTTSBackend(TTSBackend):
+    """Google TTS (online): the most natural voice, when there is network and time."""
+    name = "gtts"
+    expected_ms = 1500
+    # Map our languages to gTTS codes and TLD for Indian accents
+    LANG_CODE_TLD = {
+        'ENGLISH': ('en', 'com'),   # default English
+        'HINDI': ('hi', 'co.in'),   # Indian Hindi accent
+        'GUJARATI': ('gu', 'co.in') # Indian Gujarati accent
+    }
+
+    def available(self, language):
+        try:
+            _load_gtts()
+        except ImportError:
+            return False
+        return True
+
+    def voice(self, language):
+        lang, tld = self.LANG_CODE_TLD.get(language, ('en', 'com'))
+        return f"gtts:{lang}:{tld}"
+
+    def synthesize(self, text, language):
+        lang, tld = self.LANG_CODE_TLD.get(language, ('en', 'com'))
+        path = self._out_path("mp3")
+        _load_gtts()(text=text, lang=lang, tld=tld).save(path)
+        return path
+
+# ---------------- 4. Backend Selection ----------------
+# The first backend in TTS_PREFERENCE that is available for the language and
+# whose measured synthesis time fits the budget speaks; if none fits, the
+# fastest available one does. A backend that fails (no network, crashed
+# process) is skipped for a while and the next one speaks instead.
+TTS_PREFERENCE = ["piper", "espeak-ng", "gtts"]
+SPEECH_LATENCY_BUDGET_MS = 300
+LATENCY_SMOOTHING = 0.3     # weight of the newest measurement in the running average
+FAILURE_BACKOFF_S = 60
+PROBE_TEXT = {
+    'ENGLISH': "Hello",
+    'HINDI': "नमस्ते",
+    'GUJARATI': "નમસ્તે",
 }
+SPEECH_LATENCY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "latency_speech.json")
+
+class SpeechEngine:
+    def __init__(self, backends, preference=TTS_PREFERENCE, budget_ms=SPEECH_LATENCY_BUDGET_MS):
+        rank = {name: i for i, name in enumerate(preference)}
+        self.backends = sorted(backends, key=lambda b: rank.get(b.name, len(rank)))
+        self.budget_ms = budget_ms
+        self.latency_ms = {}     # (backend, language) -> running average synthesis time
+        self.failed_until = {}   # backend -> time.monotonic() it may be tried again
+        self.stats = LatencyStats(SPEECH_LATENCY_PATH)
+        self._locks = {backend.name: threading.Lock() for backend in self.backends}
+
+    def estimate_ms(self, backend, language):
+        return self.latency_ms.get((backend.name, language), backend.expected_ms)
+
+    def candidates(self, language):
+        now = time.monotonic()
+        usable = [b for b in self.backends if now >= self.failed_until.get(b.name, 0) and b.available(language)]
+        fast = [b for b in usable if self.estimate_ms(b, language) <= self.budget_ms]
+        slow = sorted((b for b in usable if b not in fast), key=lambda b: self.estimate_ms(b, language))
+        return fast + slow
+
+    def _run(self, backend, text, language, keep=None):
+        # A backend writes every sentence to the same file (Piper: deletes the
+        # last one), so keep(backend, path) copies it away before the lock is
+        # let go and another thread (measure()) can synthesise over it
+        with self._locks[backend.name]:
+            start = time.monotonic()
+            path = backend.synthesize(text, language)
+            end = time.monotonic()
+            if keep is not None:
+                path = keep(backend, path)
+        ms = (end - start) * 1000
+        key = (backend.name, language)
+        old = self.latency_ms.get(key)
+        self.latency_ms[key] = ms if old is None else old + LATENCY_SMOOTHING * (ms - old)
+        self.stats.record(f"synth_{backend.name}", start, end)
+        return path
+
+    def synthesize(self, text, language, keep=None):
+        """
+        (audio file, backend) from the best backend that works, or (None, None).
+        keep(backend, path) -> path, if given, runs while the file is still the backend's own.
+        """
+        for backend in self.candidates(language):
+            try:
+                return self._run(backend, text, language, keep), backend
+            except Exception as e:
+                print(f"❌ {backend.name} failed: {e}")
+                self.failed_until[backend.name] = time.monotonic() + FAILURE_BACKOFF_S
+        return None, None
+
+    def prepare(self, backend, language):
+        with self._locks[backend.name]:
+            backend.prepare(language)
+
+    def synthesize_on(self, backend, text, language, keep=None):
+        """Audio file from this backend, timed like any other sentence; raises on failure."""
+        return self._run(backend, text, language, keep)
 
-def speak_sentence(text, language='ENGLISH', temp_file=None):
+    def measure(self, languages=PROBE_TEXT):
+        """Time every available backend once per language (slow; for a background thread)."""
+        for language in languages:
+            for backend in self.backends:
+                if backend.available(language):
+                    try:
+                        self.prepare(backend, language)
+                        self._run(backend, PROBE_TEXT.get(language, "Hello"), language)
+                    except Exception as e:
+                        print(f"⚠️ {backend.name} unusable for {language}: {e}")
+                        self.failed_until[backend.name] = time.monotonic() + FAILURE_BACKOFF_S
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
+
+    def voices(self, language, preference=None):
+        """Voice of every backend for language, in preference order (all of them, usable now or not)."""
+        rank = {name: i for i, name in enumerate(preference or [])}
+        backends = sorted(self.backends, key=lambda b: rank.get(b.name, len(rank)))
+        return [v for v in (b.voice(language) for b in backends) if v is not None]
+
+engine = SpeechEngine([PiperBackend(), EspeakBackend(), GTTSBackend()])
+
+# ---------------- 4b. Audio Cache ----------------
+# Everything spoken is kept (tts_cache.py): saying it again plays the file
+# without asking any backend. A sentence cached in several voices plays in the
+# most natural one, whichever backend would be picked to synthesise it now.
+CACHE_VOICE_PREFERENCE = ["piper", "gtts", "espeak-ng"]
+cache = AudioCache()
+
+def warm_up():
+    """Open the audio device and time the TTS backends ahead of the first Speak (e.g. from a background thread)."""
+    _init_audio()
+    engine.measure()
+    engine.stats.dump()
+
+# ---------------- 5. Playback ----------------
+def play_file(path):
+    # Try playing via pygame.mixer
+    try:
+        # Check if mixer is initialized before loading
+        if pygame.mixer.get_init():
+            pygame.mixer.music.load(path)
+            pygame.mixer.music.play()
+            while pygame.mixer.music.get_busy():
+                pygame.time.Clock().tick(10)
+
+            # Unload to release the file lock
+            pygame.mixer.music.unload()
+        else:
+            raise Exception("Mixer not initialized")
+
+    except Exception:
+        # Fallback: mpg123 for gTTS's mp3, aplay for the local engines' wav
+        # -q suppresses their own terminal output
+        player = 'mpg123' if path.endswith(".mp3") else 'aplay'
+        subprocess.run([player, '-q', path], check=True)
+
+# ---------------- Logic ----------------
+def speak_sentence(text, language='ENGLISH'):
     """
-    Speak full sentences using gTTS (online) for natural voice.
-    Falls back to mpg123 if pygame.mixer fails.
+    Play text from the audio cache, or speak it with the best TTS backend
+    available right now (see SpeechEngine) and cache that.
     """
     if not text.strip():
         return
 
-    lang, tld = LANG_CODE_TLD.get(language.upper(), ('en', 'com'))
-
-    # Use a temporary file if not provided
-    if temp_file is None:
-        temp_file = os.path.join(tempfile.gettempdir(), "temp_speech.mp3")
+    start = time.monotonic()
+    language = language.upper()
+    _init_audio()
+    path, _ = cache.lookup(text, language, engine.voices(language, CACHE_VOICE_PREFERENCE))
+    if path is not None:
+        source = "cache"
+    else:
+        def keep(backend, path):
+            # Play the cached copy: the backend's own file is reused by its next sentence
+            try:
+                return cache.put(text, language, backend.voice(language), path)
+            except OSError as e:
+                print(f"⚠️ Could not cache speech: {e}")
+                return path
 
+        path, backend = engine.synthesize(text, language, keep)
+        if path is None:
+            print("❌ No TTS backend could speak")
+            return
+        source = backend.name
+    # Until the audio starts: what the user waits for
+    engine.stats.record(f"speak_to_audio_{source}", start)
     try:
-        # Generate speech
-        tts = gTTS(text=text, lang=lang, tld=tld)
-        tts.save(temp_file)
-        
-        # 0.1s sleep helps ensure file handle is released before read
-        time.sleep(0.1) 
-
-        # Try playing via pygame.mixer
-        try:
-            # Check if mixer is initialized before loading
-            if pygame.mixer.get_init():
-                pygame.mixer.music.load(temp_file)
-                pygame.mixer.music.play()
-                while pygame.mixer.music.get_busy():
-                    pygame.time.Clock().tick(10)
-                
-                # Unload to release the file lock
-                pygame.mixer.music.unload()
-            else:
-                raise Exception("Mixer not initialized")
-                
-        except Exception:
-            # Fallback: use mpg123 via subprocess
-            # -q suppresses mpg123's own terminal output
-            subprocess.run(['mpg123', '-q', temp_file], check=True)
-
+        play_file(path)
     except Exception as e:
-        print(f"❌ gTTS failed: {e}")
+        print(f"❌ Playback failed: {e}")
+    engine.stats.maybe_dump()
 
 # ---------------- Unified function ----------------
 def speak_text(text, language='ENGLISH', mode='auto'):
     """
-    Speak text with gTTS first. Mode 'auto' ignores letters vs sentences.
+    Speak text with the best available engine. Mode 'auto' ignores letters vs sentences.
     """
     if not text.strip():
         return
@@ -14,8 +14,8 @@ sudo QT_QPA_PLATFORM=xcb /home/het/Downloads/gemini/myenv/bin/python3 cursor4.py
 # Save the Process ID (PID) so we can kill it later
 TRACKER_PID=$!
 
-# Wait a few seconds for the camera to warm up
-sleep 5
+# No wait needed: the keyboard connects to the tracker's event channel
+# whenever the tracker is up, and works with the mouse until then.
 
 # 3. Start the Virtual Keyboard
 # (Replace 'keyboard.py' with your ACTUAL keyboard filename)
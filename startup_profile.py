@@ -0,0 +1,99 @@
+import builtins
+import json
+import os
+import sys
+import threading
+import time
+
+# Where the keyboard's cold start goes (main.py --profile-startup): milestones
+# from the first line of main.py to the first frame and through the background
+# loading after it, and the slowest imports on the way, as JSON and a short
+# summary on stdout. Off, it costs nothing but the perf_counter() below.
+STARTUP_PROFILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_profile.json")
+TOP_IMPORTS = 25
+
+
+def _process_age_s():
+    """Seconds since this process was started (Linux), or None."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupProfile:
+    def __init__(self, enabled, path=STARTUP_PROFILE_PATH):
+        self.t0 = time.perf_counter()
+        self.enabled = enabled
+        self.path = path
+        self.marks = {}
+        self.imports = {}    # module -> [total ms, self ms]
+        self.reported = False
+        self.report_when = set()
+        self._lock = threading.Lock()
+        self._local = threading.local()   # stack of nested import times, per thread
+        self._import = None
+        if enabled:
+            # Interpreter start-up (and site imports) before main.py ran
+            age = _process_age_s()
+            self.marks["process_start"] = -round(age * 1000, 1) if age is not None else None
+            self._import = builtins.__import__
+            builtins.__import__ = self._timed_import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        # Only first imports count; everything else is a sys.modules lookup.
+        # Time spent in nested first imports is taken off the parent's self time.
+        if level or name in sys.modules:
+            return self._import(name, globals, locals, fromlist, level)
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append(0.0)
+        t = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            total = (time.perf_counter() - t) * 1000
+            nested = stack.pop()
+            if stack:
+                stack[-1] += total
+            self.imports[name] = [round(total, 2), round(total - nested, 2)]
+
+    def mark(self, name):
+        if self.enabled:
+            self.marks[name] = round((time.perf_counter() - self.t0) * 1000, 1)
+            if self.report_when and self.report_when <= self.marks.keys():
+                self.report()
+
+    def report_after(self, *names):
+        """report() as soon as all these marks are in (from whichever thread sets the last one)."""
+        self.report_when = set(names)
+
+    def report(self):
+        """Stop timing imports, write the JSON and print the summary (once)."""
+        with self._lock:
+            if not self.enabled or self.reported:
+                return
+            self.reported = True
+        builtins.__import__ = self._import
+        slowest = sorted(self.imports.items(), key=lambda item: -item[1][0])[:TOP_IMPORTS]
+        report = {
+            "time": time.time(),
+            "python": sys.version.split()[0],
+            "marks_ms": self.marks,
+            "imports_ms": [{"module": name, "total": total, "self": own} for name, (total, own) in slowest],
+        }
+        try:
+            with open(self.path, "w") as f:
+                json.dump(report, f, indent=2)
+        except OSError as e:
+            print(f"⚠️ Could not save startup profile {self.path}: {e}")
+
+        print("⏱️ Startup (ms from main.py):")
+        for name, ms in self.marks.items():
+            print(f"   {name:<24} {ms}")
+        print("   slowest imports (total / self):")
+        for name, (total, own) in slowest[:10]:
+            print(f"   {name:<24} {total} / {own}")
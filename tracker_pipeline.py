@@ -0,0 +1,103 @@
+import threading
+import time
+import traceback
+
+# How often Stage.fps is recomputed (seconds)
+FPS_WINDOW = 1.0
+
+
+class LatestSlot:
+    """
+    One-item, latest-wins mailbox between two stages. put() never blocks and
+    overwrites whatever the consumer has not taken yet (counted in `overwritten`);
+    get() blocks until there is something newer than the seq the caller last saw.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.seq = 0
+        self.value = None
+        self.closed = False
+        self.overwritten = 0
+        self._taken_seq = 0
+
+    def put(self, value):
+        with self.cond:
+            if self.seq > self._taken_seq:
+                self.overwritten += 1
+            self.seq += 1
+            self.value = value
+            self.cond.notify_all()
+
+    def get(self, after_seq=0, timeout=None):
+        """Return (seq, value). On timeout or close returns (after_seq, None)."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.seq > after_seq or self.closed, timeout)
+            if self.seq <= after_seq:
+                return after_seq, None
+            self._taken_seq = self.seq
+            return self.seq, self.value
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class RateCounter:
+    """Counts handled items and keeps a rolling items-per-second figure."""
+
+    def __init__(self):
+        self.count = 0
+        self.fps = 0.0
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    def tick(self):
+        self.count += 1
+        self._window_count += 1
+        now = time.monotonic()
+        if now - self._window_start >= FPS_WINDOW:
+            self.fps = self._window_count / (now - self._window_start)
+            self._window_start = now
+            self._window_count = 0
+
+
+class Stage(threading.Thread):
+    """
+    Runs step() in a loop on its own daemon thread until step() returns False,
+    stop() is called, or step() raises. step() returns True when it handled an
+    item and None when it only timed out; `count` and `fps` count the former.
+    """
+
+    def __init__(self, name, step, stop_event):
+        super().__init__(name=name, daemon=True)
+        self.step = step
+        self.stop_event = stop_event
+        self.rate = RateCounter()
+
+    @property
+    def count(self):
+        return self.rate.count
+
+    @property
+    def fps(self):
+        return self.rate.fps
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                handled = self.step()
+                if handled is False:
+                    break
+                if handled:
+                    self.rate.tick()
+        except Exception:
+            print(f"❌ {self.name} stage crashed:")
+            traceback.print_exc()
+        finally:
+            # One stage ending takes the whole pipeline down
+            self.stop_event.set()
+
+    def stop(self):
+        self.stop_event.set()
@@ -0,0 +1,35 @@
+import json
+import os
+
+# Per-user tracker settings, kept next to the scripts so a restart (or a
+# reboot) comes back calibrated without anyone pressing SPACE.
+PROFILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tracker_profile.json")
+PROFILE_VERSION = 1
+
+
+def load_profile(path=PROFILE_PATH):
+    """Return the saved profile dict, or {} if there is none (or it is unreadable)."""
+    try:
+        with open(path) as f:
+            profile = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Ignoring tracker profile {path}: {e}")
+        return {}
+    if profile.get("version") != PROFILE_VERSION:
+        print(f"⚠️ Ignoring tracker profile {path}: unknown version {profile.get('version')}")
+        return {}
+    return profile
+
+
+def save_profile(profile, path=PROFILE_PATH):
+    """Write atomically, so a crash mid-save never leaves half a profile behind."""
+    profile = {**profile, "version": PROFILE_VERSION}
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(profile, f, indent=2)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"⚠️ Could not save tracker profile {path}: {e}")
@@ -0,0 +1,149 @@
+import hashlib
+import os
+import shutil
+import time
+
+# Synthesised speech on disk, so a sentence said before plays again without
+# any TTS engine (or network). Files are named by a hash of
+# (voice, language, text): the same words in the same voice are one file.
+#   pinned/  kept for good (the pre-synthesised PDM phrases, presynth_pdm.py)
+#   recent/  everything else, least recently played evicted past max_bytes
+# Both directories are scanned once, on first use; after that a lookup is a
+# dict lookup and one system call (exists, or utime for a recent/ hit).
+TTS_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tts_cache")
+TTS_CACHE_MAX_BYTES = 200 * 1024 * 1024
+
+
+def normalize(text):
+    """Whitespace does not change what is said."""
+    return " ".join(text.split())
+
+
+class AudioCache:
+    def __init__(self, directory=TTS_CACHE_DIR, max_bytes=TTS_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.pinned_dir = os.path.join(directory, "pinned")
+        self.recent_dir = os.path.join(directory, "recent")
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._pinned = None     # key -> path
+        self._recent = None     # key -> [path, last played (mtime), size]
+        self._recent_bytes = 0
+
+    @staticmethod
+    def key(text, language, voice):
+        return hashlib.sha256(f"{voice}\0{language}\0{normalize(text)}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _scan(directory):
+        # The extension (wav, mp3) is kept for the player: key is the name without it
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return []
+        return [(os.path.splitext(entry.name)[0], entry) for entry in entries
+                if entry.is_file() and not entry.name.endswith(".tmp")]
+
+    def _index(self):
+        if self._recent is None:
+            self._pinned = {key: entry.path for key, entry in self._scan(self.pinned_dir)}
+            self._recent = {}
+            self._recent_bytes = 0
+            for key, entry in self._scan(self.recent_dir):
+                st = entry.stat()
+                self._recent[key] = [entry.path, st.st_mtime, st.st_size]
+                self._recent_bytes += st.st_size
+
+    def _forget_recent(self, key):
+        entry = self._recent.pop(key, None)
+        if entry is not None:
+            self._recent_bytes -= entry[2]
+        return entry
+
+    def _cached(self, key):
+        self._index()
+        path = self._pinned.get(key)
+        if path is not None:
+            if os.path.exists(path):
+                return path
+            del self._pinned[key]
+        entry = self._recent.get(key)
+        if entry is None:
+            return None
+        # Played now: last to be evicted (the mtime keeps that across restarts;
+        # file times can be too coarse to order plays close together)
+        now = time.time()
+        try:
+            os.utime(entry[0], (now, now))
+        except OSError:
+            # Deleted behind our back
+            self._forget_recent(key)
+            return None
+        entry[1] = now
+        return entry[0]
+
+    def lookup(self, text, language, voices):
+        """(path, voice) of the first of voices that has text cached, or (None, None)."""
+        for voice in voices:
+            path = self._cached(self.key(text, language, voice))
+            if path is not None:
+                self.hits += 1
+                return path, voice
+        self.misses += 1
+        return None, None
+
+    def get(self, text, language, voice):
+        """Path of the cached audio, or None."""
+        return self.lookup(text, language, [voice])[0]
+
+    def is_pinned(self, text, language, voice):
+        self._index()
+        path = self._pinned.get(self.key(text, language, voice))
+        return path is not None and os.path.exists(path)
+
+    def put(self, text, language, voice, source, pinned=False):
+        """Copy the audio file source into the cache; returns its cached path."""
+        self._index()
+        key = self.key(text, language, voice)
+        directory = self.pinned_dir if pinned else self.recent_dir
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, key + os.path.splitext(source)[1])
+        tmp_path = path + ".tmp"
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, path)
+
+        # Replaces what was in recent/ for this key (pinning moves it out of there)
+        old = self._forget_recent(key)
+        if old is not None and old[0] != path:
+            try:
+                os.remove(old[0])
+            except FileNotFoundError:
+                pass
+        if pinned:
+            self._pinned[key] = path
+        else:
+            size = os.path.getsize(path)
+            self._recent[key] = [path, time.time(), size]
+            self._recent_bytes += size
+            self._evict()
+        return path
+
+    def _evict(self):
+        if self._recent_bytes <= self.max_bytes:
+            return
+        for key, (path, mtime, size) in sorted(self._recent.items(), key=lambda item: item[1][1]):
+            if self._recent_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._forget_recent(key)
+            self.evicted += 1
+
+    def stats(self):
+        self._index()
+        return {"pinned": len(self._pinned), "recent": len(self._recent), "recent_bytes": self._recent_bytes,
+                "hits": self.hits, "misses": self.misses, "evicted": self.evicted}
@@ -0,0 +1,87 @@
+import ctypes
+import uinput
+
+# --- POINTER MODES ---
+# "abs": absolute pointer (ABS_X/ABS_Y sized to the screen). One report per move,
+#        no X server round trip, immune to pointer acceleration.
+# "rel": old relative mouse; asks X where the pointer is (pyautogui) every move.
+POINTER_ABS = "abs"
+POINTER_REL = "rel"
+
+DEVICE_NAME = "ALS Eye Tracker Pointer"
+DEFAULT_SCREEN_SIZE = (1920, 1080)
+FRAMEBUFFER_SIZE = "/sys/class/graphics/fb0/virtual_size"
+
+
+def screen_size(default=DEFAULT_SCREEN_SIZE):
+    """
+    (width, height) of the display, asked of libX11 directly instead of
+    shelling out to xrandr. Falls back to the framebuffer, then to default.
+    """
+    try:
+        xlib = ctypes.CDLL("libX11.so.6")
+        xlib.XOpenDisplay.restype = ctypes.c_void_p
+        xlib.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        xlib.XDefaultScreen.argtypes = [ctypes.c_void_p]
+        xlib.XDisplayWidth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XDisplayHeight.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        xlib.XCloseDisplay.argtypes = [ctypes.c_void_p]
+        display = xlib.XOpenDisplay(None)
+        if display:
+            screen = xlib.XDefaultScreen(display)
+            size = xlib.XDisplayWidth(display, screen), xlib.XDisplayHeight(display, screen)
+            xlib.XCloseDisplay(display)
+            return size
+    except OSError:
+        pass
+
+    try:
+        with open(FRAMEBUFFER_SIZE) as f:
+            w, h = map(int, f.read().strip().split(","))
+            return w, h
+    except (OSError, ValueError):
+        return default
+
+
+class VirtualPointer:
+    def __init__(self, mode, screen_w, screen_h):
+        self.mode = mode
+        self.screen_w = screen_w
+        self.screen_h = screen_h
+        self._last = None
+
+        if mode == POINTER_ABS:
+            events = [
+                uinput.BTN_LEFT, uinput.BTN_RIGHT,
+                uinput.ABS_X + (0, screen_w - 1, 0, 0),
+                uinput.ABS_Y + (0, screen_h - 1, 0, 0),
+            ]
+        else:
+            # Only the relative mode needs to query X
+            import pyautogui
+            self._position = pyautogui.position
+            events = [uinput.BTN_LEFT, uinput.BTN_RIGHT, uinput.REL_X, uinput.REL_Y]
+        self.device = uinput.Device(events, name=DEVICE_NAME)
+
+    def move_to(self, x, y):
+        """Put the pointer at screen pixel (x, y). Both axes go out in a single report."""
+        x = min(self.screen_w - 1, max(0, int(x)))
+        y = min(self.screen_h - 1, max(0, int(y)))
+
+        if self.mode == POINTER_ABS:
+            if (x, y) == self._last:
+                return
+            self._last = (x, y)
+            self.device.emit(uinput.ABS_X, x, syn=False)
+            self.device.emit(uinput.ABS_Y, y)
+        else:
+            real_x, real_y = self._position()
+            diff_x = x - real_x
+            diff_y = y - real_y
+            if diff_x != 0 or diff_y != 0:
+                self.device.emit(uinput.REL_X, diff_x, syn=False)
+                self.device.emit(uinput.REL_Y, diff_y)
+
+    def click(self):
+        self.device.emit(uinput.BTN_LEFT, 1)
+        self.device.emit(uinput.BTN_LEFT, 0)